@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import os
 import sys
 
 from direct.actor.Actor import Actor
@@ -7,34 +8,17 @@ from direct.interval.LerpInterval import LerpTexOffsetInterval
 from direct.showbase.ShowBase import ShowBase
 from panda3d.core import (
     AmbientLight, DirectionalLight,
-    CardMaker,
     TextureStage, TransparencyAttrib,
-    TextNode, NodePath,
+    PStatClient,
+    TextNode,
     WindowProperties,
-    LMatrix3, LPoint2, LPoint3, LVecBase3, LVecBase4,
+    LMatrix3, LPoint3, LVecBase3, LVecBase4,
 )
 # from panda3d.bullet import BulletWorld
 
-
-def create_plane(name, width, height, x_segments, y_segments):
-    maker = CardMaker('grid')
-    maker.set_frame(0, 1, 0, 1)
-    np = NodePath(name)
-    dx = 1.0 / x_segments
-    dy = 1.0 / x_segments
-    u = 0.0
-    for x in range(x_segments):
-        v = 0.0
-        for y in range(y_segments):
-            maker.set_uv_range(LPoint2(u, v), LPoint2(u + dx, v + dy))
-            v += dy
-            node = np.attach_new_node(maker.generate())
-            node.set_hpr(0, -90, 0)
-            node.set_pos(float(x) - float(x_segments) / 2, float(y) - float(y_segments) / 2, 0)
-        u += dx
-    np.set_scale(float(width) / x_segments, float(height) / y_segments, 1)
-    np.flatten_strong()
-    return np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'common'))
+import mesh
+import profiling
 
 
 class BoneControl(object):
@@ -279,6 +263,10 @@ class MyApp(ShowBase):
         ShowBase.__init__(self)
 
         self.debug = False
+        if self.debug:
+            PStatClient.connect()
+        # with profile-record-file set, frame timings are written there while PStats is not connected
+        profiling.record_from_config()
         self.has_focus = False
         self.pointer_is_dirty = True
         self.key_state = {
@@ -339,7 +327,7 @@ class MyApp(ShowBase):
 
         self.worldsize = 1024
 
-        self.water = create_plane('water', self.worldsize, self.worldsize, 64, 64)
+        self.water = mesh.load_grid_plane('water', self.worldsize, self.worldsize, 64, 64)
         self.water.set_transparency(TransparencyAttrib.MAlpha)
         self.water.reparent_to(self.render)
 
@@ -655,7 +643,8 @@ class MyApp(ShowBase):
                 armature.yard_control.set_local_scale(
                     max(LVecBase3(0.03125), scale + d.z * 0.02 * self.sensitivity))
 
-            armature.update()
+            with profiling.profiler.scope('App:Armature:%s' % part_name):
+                armature.update()
 
     def update_task(self, task):
         # dt = task.time
@@ -666,10 +655,12 @@ class MyApp(ShowBase):
 
         if not self.is_hud:
             if self.key_state['freecam']:
-                self.update_current_camera(task)
+                with profiling.profiler.scope('App:Camera'):
+                    self.update_current_camera(task)
             elif self.key_state['grab'] or self.key_state['wheel']:
                 self.update_parts(task)
             self.recenter_pointer()
+        profiling.profiler.end_frame(task.time)
         return task.cont
 
 
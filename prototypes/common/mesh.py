@@ -0,0 +1,173 @@
+import os
+
+import numpy as np
+from panda3d.core import (
+    Filename, Geom, GeomEnums, GeomNode, GeomTriangles, GeomVertexData, GeomVertexFormat, Loader, LoaderOptions,
+    NodePath)
+
+# v grows along +y (CardMaker cards) or runs from 1 at the -y edge down to 0 (egg planes, vertex_ocean.vs)
+uv_layouts = ('v_up', 'v_down')
+
+_cache_version = 1
+
+
+def _make_geom_node(name, positions, uvs, indices):
+    vertex_data = GeomVertexData(name, GeomVertexFormat.get_v3n3t2(), Geom.UH_static)
+    vertex_data.unclean_set_num_rows(len(positions))
+    vertices = np.frombuffer(memoryview(vertex_data.modify_array(0)), dtype=np.float32).reshape(-1, 8)
+    vertices[:, 0:3] = positions
+    vertices[:, 3:5] = 0.0
+    vertices[:, 5] = 1.0  # normal
+    vertices[:, 6:8] = uvs
+
+    triangles = GeomTriangles(Geom.UH_static)
+    triangles.set_index_type(GeomEnums.NT_uint32)
+    index_data = triangles.modify_vertices()
+    index_data.unclean_set_num_rows(indices.size)
+    np.frombuffer(memoryview(index_data), dtype=np.uint32)[:] = indices.ravel()
+
+    geom = Geom(vertex_data)
+    geom.add_primitive(triangles)
+    node = GeomNode(name)
+    node.add_geom(geom)
+    return NodePath(node)
+
+
+def _get_uvs(positions, width, height, uv_layout):
+    if uv_layout not in uv_layouts:
+        raise RuntimeError("Unknown uv layout: %s" % uv_layout)
+    uvs = np.empty((len(positions), 2), dtype=np.float32)
+    uvs[:, 0] = positions[:, 0] / width + 0.5
+    if uv_layout == 'v_up':
+        uvs[:, 1] = positions[:, 1] / height + 0.5
+    else:
+        uvs[:, 1] = 0.5 - positions[:, 1] / height
+    return uvs
+
+
+def create_grid_patch(name, x, y, width, height, segments_x, segments_y, extent, uv_layout='v_up', skirt=0.0):
+    # a rectangle of a larger, origin centred surface, uvs span the whole surface of the given extent;
+    # with a skirt a strip hangs that deep from its edges, hiding the cracks to patches of another resolution
+    width = float(width)
+    height = float(height)
+    columns = segments_x + 1
+    rows = segments_y + 1
+
+    positions = np.zeros((rows, columns, 3), dtype=np.float32)
+    positions[..., 0] = np.arange(columns, dtype=np.float32) * (width / segments_x) + x
+    positions[..., 1] = np.arange(rows, dtype=np.float32)[:, None] * (height / segments_y) + y
+    positions = positions.reshape(-1, 3)
+
+    # two counter-clockwise triangles per cell
+    corner = (np.arange(segments_y, dtype=np.uint32)[:, None] * columns +
+              np.arange(segments_x, dtype=np.uint32)).ravel()
+    indices = np.empty((corner.size, 6), dtype=np.uint32)
+    indices[:, 0] = corner
+    indices[:, 1] = corner + 1
+    indices[:, 2] = corner + columns + 1
+    indices[:, 3] = corner
+    indices[:, 4] = corner + columns + 1
+    indices[:, 5] = corner + columns
+
+    if skirt:
+        # the edge counter-clockwise and a copy of it below, seen from both sides
+        i = np.arange(segments_x)
+        j = np.arange(segments_y)
+        edge = np.concatenate((i, segments_x + j * columns, segments_y * columns + segments_x - i,
+                               (segments_y - j) * columns)).astype(np.uint32)
+        hanging = positions[edge]
+        hanging[:, 2] -= skirt
+        top = edge
+        next_top = np.roll(edge, -1)
+        bottom = np.arange(len(positions), len(positions) + len(edge), dtype=np.uint32)
+        next_bottom = np.roll(bottom, -1)
+        strip = np.stack((top, bottom, next_bottom, top, next_bottom, next_top,
+                          top, next_bottom, bottom, top, next_top, next_bottom), axis=1).reshape(-1, 6)
+        positions = np.concatenate((positions, hanging))
+        indices = np.concatenate((indices, strip))
+
+    return _make_geom_node(name, positions, _get_uvs(positions, extent[0], extent[1], uv_layout), indices)
+
+
+def create_grid_plane(name, width, height, segments_x, segments_y, uv_layout='v_up'):
+    # shared vertices centered on the origin
+    return create_grid_patch(
+        name, -width / 2.0, -height / 2.0, width, height, segments_x, segments_y, (width, height), uv_layout)
+
+
+def create_clipmap(name, spacing, resolution, levels, uv_layout='v_up'):
+    # Nested square rings centered on the origin, level l has resolution x resolution cells of
+    # spacing * 2 ** l with the area of level l - 1 cut out. The cells of a ring touching the hole
+    # are fanned to the midpoints of their inner edge, which are vertices of the finer ring, so the
+    # levels share every vertex on their seams and stay watertight when displaced.
+    if resolution % 4:
+        raise RuntimeError("Clipmap resolution has to be a multiple of 4")
+    half = resolution // 2
+    quarter = resolution // 4
+
+    vertex_ids = {}
+    triangles = []
+
+    def vertex(x, y):
+        # positions are kept on the lattice of the finest level until the end
+        key = (x, y)
+        index = vertex_ids.get(key)
+        if index is None:
+            index = vertex_ids[key] = len(vertex_ids)
+        return index
+
+    for level in range(levels):
+        step = 2 ** level
+        for j in range(-half, half):
+            for i in range(-half, half):
+                if level and -quarter <= i < quarter and -quarter <= j < quarter:
+                    continue
+                x, y = i * step, j * step
+                a, b, c, d = vertex(x, y), vertex(x + step, y), vertex(x + step, y + step), vertex(x, y + step)
+                inner_column = -quarter <= i < quarter
+                inner_row = -quarter <= j < quarter
+                if level and inner_column and j == -quarter - 1:
+                    m = vertex(x + step // 2, y + step)
+                    triangles.extend(((a, b, m), (a, m, d), (b, c, m)))
+                elif level and inner_column and j == quarter:
+                    m = vertex(x + step // 2, y)
+                    triangles.extend(((a, m, d), (m, b, c), (m, c, d)))
+                elif level and inner_row and i == -quarter - 1:
+                    m = vertex(x + step, y + step // 2)
+                    triangles.extend(((a, b, m), (a, m, d), (m, c, d)))
+                elif level and inner_row and i == quarter:
+                    m = vertex(x, y + step // 2)
+                    triangles.extend(((a, b, m), (b, c, m), (m, c, d)))
+                else:
+                    triangles.extend(((a, b, c), (a, c, d)))
+
+    positions = np.zeros((len(vertex_ids), 3), dtype=np.float32)
+    lattice = np.array(list(vertex_ids.keys()), dtype=np.float32)
+    positions[list(vertex_ids.values()), :2] = lattice * spacing
+    extent = resolution * spacing * 2 ** (levels - 1)
+    indices = np.array(triangles, dtype=np.uint32)
+    return _make_geom_node(name, positions, _get_uvs(positions, extent, extent, uv_layout), indices)
+
+
+def get_grid_plane_cache_file(width, height, segments_x, segments_y, uv_layout='v_up', cache_dir='tmp/meshes'):
+    return os.path.join(
+        cache_dir,
+        'grid-v%d-%gx%g-%dx%d-%s.bam' % (_cache_version, width, height, segments_x, segments_y, uv_layout))
+
+
+def load_grid_plane(name, width, height, segments_x, segments_y, uv_layout='v_up', cache_dir='tmp/meshes'):
+    # prebuilt grids are kept as .bam files, a cache miss builds and stores one
+    cache_file = get_grid_plane_cache_file(width, height, segments_x, segments_y, uv_layout, cache_dir)
+    filename = Filename.from_os_specific(cache_file)
+    if os.path.exists(cache_file):
+        node = Loader.get_global_ptr().load_sync(filename, LoaderOptions(LoaderOptions.LF_no_cache))
+        if node is not None:
+            node_path = NodePath(node)
+            node_path.set_name(name)
+            return node_path
+
+    node_path = create_grid_plane(name, width, height, segments_x, segments_y, uv_layout)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    node_path.write_bam_file(filename)
+    return node_path
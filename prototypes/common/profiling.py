@@ -0,0 +1,130 @@
+import timeit
+
+from panda3d.core import ConfigVariableFilename, PStatClient, PStatCollector
+
+record_file = ConfigVariableFilename(
+    'profile-record-file', '', "Rolling file the frame timings are recorded to while no PStats server is connected")
+
+
+class FrameRecorder(object):
+    # Timings of the scopes of a frame written as one JSON line per frame to a rolling file,
+    # max_bytes per file and backups older files kept.
+
+    def __init__(self, filename, max_bytes=4 << 20, backups=3):
+        # logging and json only load with the first recorder, importing this module stays cheap
+        import json
+        import logging
+        import logging.handlers
+
+        self._dumps = json.dumps
+        self._logger = logging.getLogger('profiling.%s' % filename)
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        if not self._logger.handlers:
+            self._logger.addHandler(logging.handlers.RotatingFileHandler(filename, 'a', max_bytes, backups))
+        self._timings = {}
+        self._levels = {}
+        self._frame = 0
+
+    def add(self, name, seconds):
+        self._timings[name] = self._timings.get(name, 0.0) + seconds
+
+    def set_level(self, name, value):
+        self._levels[name] = value
+
+    def end_frame(self, time):
+        if self._timings or self._levels:
+            record = {'frame': self._frame, 'time': round(time, 4)}
+            record['ms'] = dict((name, round(seconds * 1000.0, 4)) for name, seconds in self._timings.items())
+            if self._levels:
+                record['levels'] = dict(self._levels)
+            self._logger.info(self._dumps(record, sort_keys=True))
+            self._timings.clear()
+            self._levels.clear()
+        self._frame += 1
+
+    def close(self):
+        for handler in list(self._logger.handlers):
+            handler.close()
+            self._logger.removeHandler(handler)
+
+
+class _Scope(object):
+    __slots__ = ('_profiler', '_name', '_collector', '_start')
+
+    def __init__(self, profiler, name, collector):
+        self._profiler = profiler
+        self._name = name
+        self._collector = collector
+        self._start = 0.0
+
+    def __enter__(self):
+        self._collector.start()
+        if self._profiler.is_recording:
+            self._start = timeit.default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._collector.stop()
+        if self._profiler.is_recording:
+            self._profiler.recorder.add(self._name, timeit.default_timer() - self._start)
+        return False
+
+
+class Profiler(object):
+    # Named scopes for PStats. Collector names use ':' for nesting, e.g. 'App:Water:Impulses'. With
+    # a recorder the same scopes are timed into it while no PStats server is connected.
+
+    def __init__(self, recorder=None):
+        self._scopes = {}
+        self._levels = {}
+        self._recorder = None
+        self._recording = False
+        self.recorder = recorder
+
+    @property
+    def recorder(self):
+        return self._recorder
+
+    @property
+    def is_recording(self):
+        return self._recording
+
+    @recorder.setter
+    def recorder(self, value):
+        self._recorder = value
+        self._recording = value is not None and not PStatClient.is_connected()
+
+    def scope(self, name):
+        scope = self._scopes.get(name)
+        if scope is None:
+            scope = self._scopes[name] = _Scope(self, name, PStatCollector(name))
+        return scope
+
+    def set_level(self, name, value):
+        # a value of the frame rather than a time, e.g. a count
+        collector = self._levels.get(name)
+        if collector is None:
+            collector = self._levels[name] = PStatCollector(name)
+        collector.set_level(value)
+        if self._recording:
+            self._recorder.set_level(name, value)
+
+    def end_frame(self, time):
+        # decides once a frame whether the recorder is needed
+        if self._recorder is not None:
+            if self._recording:
+                self._recorder.end_frame(time)
+            self._recording = not PStatClient.is_connected()
+
+
+# shared by the modules of an application
+profiler = Profiler()
+
+
+def record_from_config():
+    # starts recording to profile-record-file if it is set
+    filename = record_file.get_value()
+    if not filename.empty() and profiler.recorder is None:
+        profiler.recorder = FrameRecorder(filename.to_os_specific())
+    return profiler.recorder
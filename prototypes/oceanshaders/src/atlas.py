@@ -0,0 +1,226 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+from panda3d.core import LVector4, Texture
+
+import waves
+
+# magic, version, frames, size, span, period and the gridRatio the frames are encoded for, padded
+# to 64 bytes; the frames follow as BGRA RAM images of the simulation texture
+_header = struct.Struct('<8sIIIff4f')
+_header_size = 64
+_magic = b'WAVATLAS'
+_version = 1
+
+
+def encode_frame(heights, slopes, grid_ratio, out):
+    # Heights and slopes along x and y of a sea tile in rows along +y, encoded the way
+    # vertex_ocean.vs reads the simulation texture with gridRatio: red is the height, green and blue
+    # the slopes.
+    gx, gy, gz, gw = grid_ratio
+    size = heights.shape[0]
+    # the texture's rows run along -y over the sea, texel centres half a texel off the grid
+    rows = (size // 2 - 1 - np.arange(size)) % size
+    columns = (np.arange(size) - size // 2) % size
+    index = np.ix_(rows, columns)
+    out[..., 2] = np.clip(np.rint((heights[index] / gw + 0.5) * 255.0), 0, 255)
+    out[..., 1] = np.clip(np.rint((slopes[0][index] * gx / (4.0 * gz) + 0.5) * 255.0), 0, 255)
+    out[..., 0] = np.clip(np.rint((slopes[1][index] * gy / (4.0 * gz) + 0.5) * 255.0), 0, 255)
+    out[..., 3] = 255
+    return out
+
+
+def _write(filename, frames, size, span, period, grid_ratio, get_fields):
+    # get_fields gives the heights and slopes of the sea at a time, laid out like those of a SpectralOcean
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    frame = np.zeros((size, size, 4), dtype=np.uint8)
+    with open(filename, 'wb') as f:
+        header = _header.pack(_magic, _version, frames, size, span, period, *grid_ratio)
+        f.write(header + b'\0' * (_header_size - len(header)))
+        for i in range(frames):
+            heights, slopes = get_fields(period * i / float(frames))
+            encode_frame(heights, slopes, grid_ratio, frame)
+            f.write(frame.tobytes())
+
+
+def bake(filename, ocean, frames, grid_ratio=(10.0, 10.0, 15.0, 5.0)):
+    # Records frames evenly spread over the period of a spectrum.SpectralOcean (made with a
+    # period, so the last frame runs into the first one). Its span should be the extent of the sea.
+    # Only the heights and slopes are kept: the atlas has no channel for the choppy horizontal
+    # displacement, so the baked sea is the tile at its undisplaced grid points and looks rounder
+    # than the spectrum on the vertex shader.
+    if not ocean.period:
+        raise RuntimeError("Only a sea with a period loops, give the SpectralOcean one")
+
+    def get_fields(time):
+        ocean.update(time)
+        return ocean.heights, ocean.slopes
+
+    _write(filename, frames, ocean.size, ocean.span, ocean.period, grid_ratio, get_fields)
+
+
+class LoopingWaves(waves.GerstnerWaves):
+    # The waves of a waves.GerstnerWaves, each sped up or slowed down to a whole number of cycles
+    # over period so they repeat themselves after it. Waves making less than half a cycle in it stand still.
+
+    def __init__(self, waves, period):
+        super(LoopingWaves, self).__init__(waves.params)
+        self._waves = waves
+        self._cycle = 2.0 * np.pi / period
+
+    def get_waves(self):
+        return [(freq, amp, np.rint(omega / self._cycle) * self._cycle, direction)
+                for freq, amp, omega, direction in self._waves.get_waves()]
+
+
+def bake_waves(filename, waves, frames, size, span, period, grid_ratio=(10.0, 10.0, 15.0, 5.0), iterations=2):
+    # Records frames of a waves.GerstnerWaves over a square of span around the origin of the water,
+    # the waves made to loop over period with LoopingWaves. The heights are those of the surface
+    # above each texel, iterations as in GerstnerWaves.evaluate, so only the sideways motion of the
+    # vertices is lost; grid_ratio[3] needs to be twice the summed amplitudes or the crests are cut.
+    looping = LoopingWaves(waves, period)
+    texel = span / float(size)
+    # texel centres in the order of the rows and columns of a SpectralOcean tile, the origin first
+    coordinates = ((np.arange(size) + size // 2) % size - size // 2 + 0.5) * texel
+    xs, ys = np.meshgrid(coordinates, coordinates)
+
+    def get_fields(time):
+        heights, normals, _ = looping.evaluate(xs, ys, time, iterations=iterations)
+        return heights, (-normals[..., 0] / normals[..., 2], -normals[..., 1] / normals[..., 2])
+
+    _write(filename, frames, size, span, period, grid_ratio, get_fields)
+
+
+class WaveAtlas(object):
+    # A baked file mapped into memory. Frames are views of the mapped pages, nothing is read
+    # before it is used.
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _header.unpack_from(self._map, 0)
+        magic, version, self.frames, self.size, self.span, self.period = header[:6]
+        if magic != _magic or version != _version:
+            raise RuntimeError("Not a wave atlas of version %d: %s" % (_version, filename))
+        self.grid_ratio = tuple(header[6:])
+        if len(self._map) < _header_size + self.frames * self.size * self.size * 4:
+            raise RuntimeError("Wave atlas is cut short: %s" % filename)
+        self._frames = np.frombuffer(self._map, dtype=np.uint8, count=self.frames * self.size * self.size * 4,
+                                     offset=_header_size).reshape(self.frames, self.size, self.size, 4)
+
+    def get_frame_index(self, time):
+        return int(np.floor(time / self.period * self.frames)) % self.frames
+
+    def get_frame(self, index):
+        # (size, size, 4) BGRA view, bottom row first
+        return self._frames[index]
+
+    def close(self):
+        self._frames = None
+        self._map.close()
+        self._file.close()
+
+
+class AtlasWaterHelper(object):
+    # Plays a WaveAtlas in place of a ripple simulation. Every frame is one copy of the mapped
+    # frame into the texture's RAM image and only when the frame changes. It has no simulation to
+    # push water into, WaterNodeHelper.has_simulation tells rain and wakes to leave it alone.
+    max_substeps = None
+
+    def __init__(self, base, width, height, filename, timestep=1.0 / 60.0):
+        self.base = base
+        self.atlas = WaveAtlas(filename)
+        self._size = self.atlas.size
+        self._width = width
+        self._height = height
+        self.window = None
+        self.timestep = timestep
+        self.is_texture_changed = False
+        self.acceleration = 0
+        self.dampening = 0
+
+        self._time = 0.0
+        self._frame = None
+        self.vertex_tex = Texture('water-atlas')
+        self.vertex_tex.setup_2d_texture(self._size, self._size, Texture.T_unsigned_byte, Texture.F_rgba)
+        self.vertex_tex.set_wrap_u(Texture.WMClamp)
+        self.vertex_tex.set_wrap_v(Texture.WMClamp)
+        self._show(0)
+
+    @property
+    def frame(self):
+        return self._frame
+
+    def _show(self, index):
+        if index == self._frame:
+            return
+        image = np.frombuffer(memoryview(self.vertex_tex.modify_ram_image()), dtype=np.uint8)
+        np.copyto(image.reshape(self._size, self._size, 4), self.atlas.get_frame(index))
+        self._frame = index
+
+    def bind(self, ocean):
+        ocean.set_shader_input('vtftex', self.vertex_tex)
+        # the baked sea takes the place of the geometric waves, its heights span the range of the atlas
+        values = {'grid_ratio': LVector4(*self.atlas.grid_ratio), 'geometric_waves': 0.0}
+        if ocean.spectrum is None:
+            values['height_range'] = self.atlas.grid_ratio[3]
+        if any(ocean.params[name] != value for name, value in values.items()):
+            ocean.params.update(values)
+
+    def update(self, steps=1):
+        # the atlas runs on the simulation clock, steps of timestep seconds
+        self._time += steps * self.timestep
+        self._show(self.atlas.get_frame_index(self._time))
+
+    def get_texture_pos(self, px, py):
+        x = int((px + self._width / 2.0) / self._width * self._size)
+        y = int((py + self._height / 2.0) / self._height * self._size)
+        return x, y
+
+    def get_texture_positions(self, xs, ys):
+        xs = np.floor((np.asarray(xs) + self._width / 2.0) * (self._size / float(self._width))).astype(np.intp)
+        ys = np.floor((np.asarray(ys) + self._height / 2.0) * (self._size / float(self._height))).astype(np.intp)
+        return xs, ys
+
+    def push_water(self, x1, y1, r, v):
+        self.stamp_water(x1, y1, r, v)
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        raise RuntimeError("A wave atlas has no simulation to push water into")
+
+    def get_heights(self, xs, ys):
+        # heights of the shown frame straight from the mapped pages, nearest texel
+        xs, ys = self.get_texture_positions(xs, ys)
+        last = self._size - 1
+        rows = last - np.clip(ys, 0, last)
+        red = self.atlas.get_frame(self._frame)[rows, np.clip(xs, 0, last), 2]
+        return (red / 255.0 - 0.5) * self.atlas.grid_ratio[3]
+
+    def close(self):
+        # the atlas is unmapped, nothing is shown or sampled afterwards
+        self.atlas.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import spectrum
+
+    parser = argparse.ArgumentParser(description="Bakes a looping spectral sea into a wave atlas")
+    parser.add_argument('filename')
+    parser.add_argument('--frames', type=int, default=240)
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--span', type=float, default=128.0, help="extent of the sea the atlas covers")
+    parser.add_argument('--period', type=float, default=8.0, help="seconds before the sea repeats itself")
+    parser.add_argument('--wind', type=float, default=8.0, help="wind speed in m/s")
+    parser.add_argument('--fetch', type=float, default=20000.0, help="fetch in metres")
+    parser.add_argument('--direction', type=float, default=180.0, help="wind direction in degrees")
+    parser.add_argument('--spectrum', default='jonswap', choices=sorted(spectrum.SpectralOcean.spectra))
+    args = parser.parse_args()
+
+    bake(args.filename, spectrum.SpectralOcean(
+        args.size, args.span, args.wind, args.fetch, args.direction, args.spectrum, period=args.period), args.frames)
@@ -0,0 +1,402 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+from panda3d.core import ClockObject, LVector3, PNMImage, Texture, load_prc_file_data
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'common'))
+
+
+def make_offscreen_base(software=False):
+    load_prc_file_data('', 'window-type offscreen\naudio-library-name null')
+    if software:
+        load_prc_file_data('', 'load-display p3tinydisplay')
+    from direct.showbase.ShowBase import ShowBase
+    return ShowBase()
+
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'p99_ms': float(np.percentile(samples, 99)),
+    }
+
+
+class ScopeTimes(object):
+    # takes the place of a FrameRecorder for the profiler, keeps the scope timings of one frame
+    def __init__(self):
+        self.timings = {}
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def set_level(self, name, value):
+        pass
+
+    def end_frame(self, time):
+        self.timings.clear()
+
+
+def run_isolated(arguments):
+    # runs a benchmark of this script in a new process and returns its result, for runs that would
+    # otherwise share the buffers and state of earlier ones
+    command = [sys.executable, os.path.abspath(__file__)] + [str(argument) for argument in arguments]
+    return json.loads(subprocess.check_output(command))
+
+
+def benchmark_ping_pong(base, size=512, frames=200):
+    import ocean
+
+    helper = ocean.WaterShaderHelper(base, 128, 128, size)
+
+    # the PNMImage round trips WaterShaderHelper.update used to do, fed by the same surface texture
+    screen_image = PNMImage(size, size)
+    screen_image.fill(0.5, 0.5, 0.5)
+    legacy_current, legacy_history = Texture(), Texture()
+
+    def legacy_update():
+        legacy_history.load(screen_image)
+        helper._temp_tex.store(screen_image)
+        legacy_current.load(screen_image)
+        legacy_current.set_wrap_u(Texture.WMClamp)
+        legacy_current.set_wrap_v(Texture.WMClamp)
+        legacy_history.set_wrap_u(Texture.WMClamp)
+        legacy_history.set_wrap_v(Texture.WMClamp)
+
+    legacy, ram_image = [], []
+    timer = timeit.default_timer
+    for _ in range(frames):
+        base.graphicsEngine.render_frame()
+
+        start = timer()
+        legacy_update()
+        legacy.append(timer() - start)
+
+        start = timer()
+        helper.update()
+        ram_image.append(timer() - start)
+
+    return {'size': size, 'frames': frames, 'pnm_image': summarize(legacy), 'ram_image': summarize(ram_image)}
+
+
+def benchmark_rain(base, size=512, frames=200, drops=1000):
+    import ocean
+    import rain
+
+    helper = ocean.WaterShaderHelper(base, 128, 128, size)
+    # intensity giving the requested number of drops in a 60 fps frame
+    emitter = rain.RainEmitter(size, intensity=drops * 60.0, wind=(20.0, 5.0), seed=1)
+
+    stamping, applying = [], []
+    timer = timeit.default_timer
+    for _ in range(frames):
+        base.graphicsEngine.render_frame()
+
+        start = timer()
+        emitter.rain_on(helper, 1.0 / 60.0)
+        stamping.append(timer() - start)
+
+        start = timer()
+        helper.update()
+        applying.append(timer() - start)
+
+    return {
+        'size': size, 'frames': frames, 'drops_per_frame': emitter.emitted / float(frames),
+        'emit_and_stamp': summarize(stamping), 'update': summarize(applying)}
+
+
+def benchmark_reflection(base, quality='high', frames=200, masked=False):
+    import ocean
+    import mesh
+
+    base.disable_mouse()
+    water = ocean.WaterNodeHelper(
+        base, 128, 128, 2, 128, 128, LVector3(0, 0, 0), False, reflection_quality=quality)
+    skybox = base.loader.load_model("models/morningbox/morningbox")
+    skybox.set_scale(64, 64, 32)
+    skybox.reparent_to(base.render)
+    # stand-ins for the rest of a scene, left out of a masked reflection
+    for i in range(16):
+        wall = mesh.create_grid_plane('wall', 16, 16, 32, 32)
+        wall.set_pos(((i % 4) - 1.5) * 30, ((i // 4) - 1.5) * 30, 8)
+        wall.set_p(90)
+        wall.set_two_sided(True)
+        wall.reparent_to(base.render)
+    if masked:
+        water.ocean_shader_hlp.set_reflected_nodes([skybox])
+
+    frame_times = []
+    timer = timeit.default_timer
+    for frame in range(frames):
+        # a slow fly-by, the way the camera drifts in main.py
+        base.camera.set_pos(frame * 0.05, -60, 15)
+        base.camera.set_hpr(frame * 0.2, -10, 0)
+
+        start = timer()
+        water.set_eye_pos(base.camera.get_pos(), base.camera.get_mat())
+        water.update(frame / 60.0)
+        base.graphicsEngine.render_frame()
+        frame_times.append(timer() - start)
+
+    return {
+        'quality': quality, 'masked': masked, 'frames': frames,
+        'reflection_updates': water.ocean_shader_hlp.reflection_updates, 'frame': summarize(frame_times)}
+
+
+def benchmark_frames(base, grid=128, size=512, frames=200, backend='gpu', pushes=2, seed=1, threaded=False,
+                     spectrum_size=0):
+    # the frame of main.py stage by stage, with a fixed 60 fps clock and seeded pushes; threaded
+    # water updates in one call, the ocean is told apart by its profiler scope, the time the worker
+    # took alongside
+    import ocean
+    import spectrum
+    from profiling import profiler
+
+    clock = ClockObject.get_global_clock()
+    clock.set_mode(ClockObject.M_non_real_time)
+    clock.set_frame_rate(60)
+    random = np.random.RandomState(seed)
+
+    water = ocean.WaterNodeHelper(
+        base, 128, 128, 2, grid, grid, LVector3(0, 0, 0), False, backend=backend, texture_size=size, threaded=threaded)
+    if spectrum_size:
+        water.ocean_shader_hlp.set_spectrum(spectrum.SpectralOcean(spectrum_size, 64.0, wind_speed=8.0, fetch=20000.0))
+    base.camera.set_pos(0, -35, 5)
+    base.camera.set_hpr(0, -10, 0)
+    water.set_eye_pos(base.camera.get_pos(), base.camera.get_mat())
+
+    stages = ('push_water', 'water_update', 'ocean_update', 'render', 'get_height')
+    if threaded:
+        stages += ('worker',)
+        scopes = ScopeTimes()
+        recorder = profiler.recorder
+        profiler.recorder = scopes
+    samples = dict((stage, []) for stage in stages)
+    timer = timeit.default_timer
+    for _ in range(frames):
+        clock.tick()
+        time = clock.get_frame_time()
+        xs = random.uniform(-50, 50, pushes)
+        ys = random.uniform(-50, 50, pushes)
+
+        start = timer()
+        for x, y in zip(xs, ys):
+            tx, ty = water.water_shader_hlp.get_texture_pos(x, y)
+            water.water_shader_hlp.push_water(tx, ty, 0, 0.45)
+        samples['push_water'].append(timer() - start)
+
+        if threaded:
+            start = timer()
+            water.update(time)
+            total = timer() - start
+            ocean_time = scopes.timings.get('App:Water:Ocean', 0.0)
+            samples['water_update'].append(total - ocean_time)
+            samples['ocean_update'].append(ocean_time)
+            samples['worker'].append(water.worker.job_time)
+            profiler.end_frame(time)
+        else:
+            start = timer()
+            water.water_shader_hlp.update(water.simulation_clock.advance(clock.get_dt()))
+            water.water_shader_hlp.bind(water.ocean_shader_hlp)
+            samples['water_update'].append(timer() - start)
+
+            start = timer()
+            water.ocean_shader_hlp.update(time)
+            samples['ocean_update'].append(timer() - start)
+
+        start = timer()
+        base.graphicsEngine.render_frame()
+        samples['render'].append(timer() - start)
+
+        # the first height after an update reads the height map back
+        start = timer()
+        water.ocean_shader_hlp.get_height(xs[0], ys[0])
+        samples['get_height'].append(timer() - start)
+    if threaded:
+        profiler.recorder = recorder
+
+    return {
+        'grid': grid, 'size': size, 'frames': frames, 'backend': backend, 'threaded': threaded,
+        'spectrum_size': spectrum_size, 'substeps': water.simulation_clock.total_steps,
+        'stages': dict((stage, summarize(samples[stage])) for stage in stages)}
+
+
+def benchmark_replay(base, filename, size=512, backend='gpu', threaded=False):
+    # the water of a recording of main.py frame by frame, as fast as it renders; the ship is not
+    # there, its wake comes from the recording
+    import ocean
+    import replay
+
+    player = replay.Player(filename)
+    world_size = player.info.get('world_size', 128)
+    water = ocean.WaterNodeHelper(
+        base, world_size, world_size, 2, 128, 128, LVector3(0, 0, 0), False, backend=backend, texture_size=size,
+        threaded=threaded)
+    water.replay_from(player)
+    player.add_target('wake', water.water_shader_hlp)
+    base.camera.set_pos(0, -35, 5)
+    base.camera.set_hpr(0, -10, 0)
+    water.set_eye_pos(base.camera.get_pos(), base.camera.get_mat())
+
+    stages = ('water_update', 'render')
+    samples = dict((stage, []) for stage in stages)
+    timer = timeit.default_timer
+    start = timer()
+    while True:
+        frame = player.next_frame()
+        if frame is None:
+            break
+        time, _ = frame
+        base.render.set_shader_input('time', time)
+
+        stage_start = timer()
+        water.update(time)
+        samples['water_update'].append(timer() - stage_start)
+
+        stage_start = timer()
+        base.graphicsEngine.render_frame()
+        samples['render'].append(timer() - stage_start)
+    seconds = timer() - start
+    player.close()
+
+    return {
+        'recording': filename, 'frames': player.frames, 'size': size, 'backend': backend, 'threaded': threaded,
+        'fps': player.frames / max(seconds, 1e-6), 'substeps': water.simulation_clock.total_steps,
+        'stages': dict((stage, summarize(samples[stage])) for stage in stages)}
+
+
+def benchmark_startup(repeats=10):
+    # every import in a fresh interpreter, panda3d itself is imported before the clock starts
+    script = (
+        "import timeit, panda3d.core, direct.interval.LerpInterval, numpy\n"
+        "start = timeit.default_timer()\n"
+        "import ocean\n"
+        "print(timeit.default_timer() - start)\n")
+    directory = os.path.dirname(os.path.abspath(__file__))
+    samples = [float(subprocess.check_output([sys.executable, '-c', script], cwd=directory))
+               for _ in range(repeats)]
+    return {'repeats': repeats, 'import_ocean': summarize(samples)}
+
+
+def benchmark_shaders(base):
+    import ocean
+    import shader_registry
+
+    registry = shader_registry.registry
+    timer = timeit.default_timer
+    result = {}
+    for name in registry.names:
+        start = timer()
+        registry.get(name)
+        first = timer() - start
+        start = timer()
+        registry.get(name)
+        result[name] = {'first_use_ms': first * 1000.0, 'cached_ms': (timer() - start) * 1000.0}
+    return result
+
+
+def benchmark_spectrum(sizes=(128, 256, 512), frames=200):
+    # the CPU side of a spectral sea frame, the transform and the encoding into the textures
+    import spectrum
+
+    timer = timeit.default_timer
+    results = []
+    for size in sizes:
+        ocean = spectrum.SpectralOcean(size, 256.0)
+        displacement = np.zeros((size, size, 4), dtype=np.float32)
+        normals = np.zeros((size, size, 4), dtype=np.uint8)
+        start = timer()
+        ocean.set_sea_state(12.0, 50000.0, 45.0)
+        new_state = timer() - start
+
+        updates, encodes = [], []
+        for frame in range(frames):
+            start = timer()
+            ocean.update(frame / 60.0)
+            updates.append(timer() - start)
+            start = timer()
+            ocean.encode(displacement, normals)
+            encodes.append(timer() - start)
+        results.append({
+            'size': size, 'frames': frames, 'new_sea_state_ms': new_state * 1000.0,
+            'update': summarize(updates), 'encode': summarize(encodes)})
+    return results
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the ocean hot paths")
+    parser.add_argument(
+        'benchmark', choices=['frames', 'pingpong', 'rain', 'reflection', 'replay', 'startup', 'shaders', 'spectrum'])
+    parser.add_argument('--size', type=int_list, default=[512], help="texture sizes, comma separated")
+    parser.add_argument('--grid', type=int_list, default=[128], help="grid segments, comma separated")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--backend', default='gpu', choices=['gpu', 'cpu'])
+    parser.add_argument('--drops', type=int, default=1000, help="rain drops per frame")
+    parser.add_argument('--quality', default='high', help="reflection quality, 'all' runs every one in a new process")
+    parser.add_argument('--masked', action='store_true', help="only draw the sky in the reflection")
+    parser.add_argument('--software', action='store_true', help="use the software renderer")
+    parser.add_argument('--threaded', action='store_true', help="prepare the water on a worker thread")
+    parser.add_argument('--spectrum-size', type=int, default=0, help="size of a spectral sea, 0 for none")
+    parser.add_argument('--recording', help="water recording of main.py to replay, see water-record-file")
+    args = parser.parse_args()
+    software = ['--software'] if args.software else []
+    frame_options = ['--backend', args.backend, '--spectrum-size', args.spectrum_size] + (
+        ['--threaded'] if args.threaded else [])
+
+    if args.benchmark == 'frames' and len(args.size) * len(args.grid) > 1:
+        # one process per point of the sweep
+        results = [
+            run_isolated(['frames', '--grid', grid, '--size', size, '--frames', args.frames] + frame_options + software)
+            for grid in args.grid for size in args.size]
+        print(json.dumps(results, indent=2, sort_keys=True))
+        sys.exit(0)
+
+    if args.benchmark == 'reflection' and args.quality == 'all':
+        import ocean
+        results = []
+        for quality in sorted(ocean.OceanShaderHelper.reflection_qualities):
+            for masked in (False, True):
+                results.append(run_isolated(
+                    ['reflection', '--quality', quality, '--frames', args.frames] +
+                    (['--masked'] if masked else []) + software))
+        print(json.dumps(results, indent=2, sort_keys=True))
+        sys.exit(0)
+
+    if args.benchmark == 'startup':
+        print(json.dumps(benchmark_startup(), indent=2, sort_keys=True))
+        sys.exit(0)
+
+    if args.benchmark == 'spectrum':
+        print(json.dumps(benchmark_spectrum(args.size, args.frames), indent=2, sort_keys=True))
+        sys.exit(0)
+
+    if args.benchmark == 'replay' and not args.recording:
+        parser.error("replay needs --recording")
+
+    app = make_offscreen_base(args.software)
+    size, grid = args.size[0], args.grid[0]
+    if args.benchmark == 'frames':
+        result = benchmark_frames(
+            app, grid, size, args.frames, args.backend, threaded=args.threaded, spectrum_size=args.spectrum_size)
+    elif args.benchmark == 'pingpong':
+        result = benchmark_ping_pong(app, size, args.frames)
+    elif args.benchmark == 'rain':
+        result = benchmark_rain(app, size, args.frames, args.drops)
+    elif args.benchmark == 'reflection':
+        result = benchmark_reflection(app, args.quality, args.frames, args.masked)
+    elif args.benchmark == 'replay':
+        result = benchmark_replay(app, args.recording, size, args.backend, args.threaded)
+    else:
+        result = benchmark_shaders(app)
+    print(json.dumps(result, indent=2, sort_keys=True))
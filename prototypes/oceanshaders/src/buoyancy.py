@@ -0,0 +1,140 @@
+import numpy as np
+from panda3d.core import LPoint3, LVecBase3
+
+
+class Hull(object):
+    # A floating node moved up and down, pitched and rolled by the water under a grid of points
+    # spread over its tight bounds. Its origin floats on the surface when the water is calm, the
+    # points sit draft below it. x and y stay with whatever else moves the node.
+
+    def __init__(self, node, samples=(6, 3), draft=0.5, heave_damping=1.5, angular_damping=2.0):
+        self.node = node
+        self.draft = draft
+        self.heave_damping = heave_damping
+        self.angular_damping = angular_damping
+
+        lower, upper = node.get_tight_bounds(node)
+        length, width = upper.x - lower.x, upper.y - lower.y
+        # points in the middle of the cells of a samples[0] x samples[1] grid
+        xs = lower.x + (np.arange(samples[0]) + 0.5) * (length / samples[0])
+        ys = lower.y + (np.arange(samples[1]) + 0.5) * (width / samples[1])
+        xs, ys = np.meshgrid(xs, ys)
+        self.points = np.stack((xs.ravel(), ys.ravel()), axis=-1)
+        # moments of inertia per unit mass of a uniform box, around y (roll) and x (pitch)
+        self._inertia = (max(length * length, 1e-6) / 12.0, max(width * width, 1e-6) / 12.0)
+
+        # heave, pitch and roll (radians) and their rates
+        self.state = np.zeros(3)
+        self.velocity = np.zeros(3)
+        self.is_placed = False
+        self._origin = None
+        self._heading = 0.0
+
+    @property
+    def num_points(self):
+        return len(self.points)
+
+    def get_sample_positions(self, water):
+        # x, y of the points in the space of water, turned by the heading only: the pitch and roll
+        # are the hull's own state, the points are where they would be on a level hull
+        self._origin = self.node.get_pos(water)
+        self._heading = self.node.get_h(water)
+        heading = np.radians(self._heading)
+        cos_h, sin_h = np.cos(heading), np.sin(heading)
+        xs = self._origin.x + self.points[:, 0] * cos_h - self.points[:, 1] * sin_h
+        ys = self._origin.y + self.points[:, 0] * sin_h + self.points[:, 1] * cos_h
+        return xs, ys
+
+    def place(self, heights):
+        # starts at rest on the mean height under it
+        self.state[:] = (float(np.mean(heights)), 0.0, 0.0)
+        self.velocity[:] = 0.0
+        self.is_placed = True
+
+    def apply(self, water):
+        # one transform change in the space of water, with the position and heading of the last
+        # get_sample_positions
+        z, pitch, roll = self.state
+        hpr = LVecBase3(self._heading, np.degrees(pitch), np.degrees(roll))
+        self.node.set_pos_hpr(water, LPoint3(self._origin.x, self._origin.y, z), hpr)
+
+
+class BuoyancySolver(object):
+    # Steps every hull at a fixed timestep, all of them at once. The heights under all of them
+    # are looked up once per update with a single call, the substeps of the frame share them.
+
+    def __init__(self, water, get_heights, timestep=1.0 / 60.0, max_steps=4, gravity=9.81):
+        # get_heights takes arrays of x and y in the space of water, e.g. OceanShaderHelper.get_heights
+        self.water = water
+        self.get_heights = get_heights
+        self.timestep = timestep
+        self.max_steps = max_steps
+        self.gravity = gravity
+        self.hulls = []
+        self._lag = 0.0
+
+    def add(self, node, **kwargs):
+        hull = Hull(node, **kwargs)
+        self.hulls.append(hull)
+        return hull
+
+    def remove(self, hull):
+        self.hulls.remove(hull)
+
+    def update(self, dt):
+        if not self.hulls:
+            return 0
+        self._lag = min(self._lag + dt, self.max_steps * self.timestep)
+        steps = int(self._lag / self.timestep)
+        if not steps:
+            return 0
+        self._lag -= steps * self.timestep
+
+        hulls = self.hulls
+        positions = [hull.get_sample_positions(self.water) for hull in hulls]
+        heights = np.asarray(self.get_heights(
+            np.concatenate([p[0] for p in positions]), np.concatenate([p[1] for p in positions])), dtype=np.float64)
+
+        counts = np.array([hull.num_points for hull in hulls])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        for hull, start, count in zip(hulls, starts, counts):
+            if not hull.is_placed:
+                hull.place(heights[start:start + count])
+
+        # per point copies of the hull properties
+        owner = np.repeat(np.arange(len(hulls)), counts)
+        px = np.concatenate([hull.points[:, 0] for hull in hulls])
+        py = np.concatenate([hull.points[:, 1] for hull in hulls])
+        draft = np.array([hull.draft for hull in hulls])
+        # springs per unit mass, holding a hull up with its points draft deep
+        stiffness = (self.gravity / (counts * draft))[owner]
+        depth_limit = 2.0 * draft[owner]
+        point_draft = draft[owner]
+        inertia = np.array([hull._inertia for hull in hulls])
+        damping = np.array([(hull.heave_damping, hull.angular_damping, hull.angular_damping) for hull in hulls])
+        state = np.array([hull.state for hull in hulls])
+        velocity = np.array([hull.velocity for hull in hulls])
+
+        for _ in range(steps):
+            # Pitch and roll both turn about the level axes of the heading. Panda3D applies the roll
+            # before the pitch, the difference is second order in the angles and left out.
+            z, pitch, roll = state[owner, 0], state[owner, 1], state[owner, 2]
+            point_z = z + py * np.sin(pitch) - px * np.sin(roll) - point_draft
+            # capped once a point is under water
+            forces = stiffness * np.clip(heights - point_z, 0.0, depth_limit)
+
+            acceleration = np.stack((
+                np.add.reduceat(forces, starts) - self.gravity,
+                np.add.reduceat(forces * py, starts) / inertia[:, 1],
+                -np.add.reduceat(forces * px, starts) / inertia[:, 0]), axis=-1)
+            acceleration -= damping * velocity
+
+            # semi-implicit Euler
+            velocity += acceleration * self.timestep
+            state += velocity * self.timestep
+
+        for hull, hull_state, hull_velocity in zip(hulls, state, velocity):
+            hull.state[:] = hull_state
+            hull.velocity[:] = hull_velocity
+            hull.apply(self.water)
+        return steps
@@ -0,0 +1,74 @@
+import hashlib
+import os
+
+from panda3d.core import Filename, LightAttrib, NodePath, PandaNode, Texture
+
+# bump when the way cube maps are baked changes
+_cache_version = 1
+
+
+def get_scene_key(root, size, extra=''):
+    # Everything the baked environment depends on: the model files under root (path, size and
+    # time of the file) with their transforms, the lights set on root and the size of the map.
+    digest = hashlib.sha1()
+    digest.update(('v%d %d %s' % (_cache_version, size, extra)).encode('utf-8'))
+    for model in root.find_all_matches('**/+ModelRoot'):
+        if model.is_hidden():
+            continue
+        path = model.node().get_fullpath().to_os_specific()
+        stamp = (os.path.getsize(path), int(os.path.getmtime(path))) if os.path.exists(path) else None
+        digest.update(('%s %s %s' % (path, stamp, model.get_mat(root))).encode('utf-8'))
+
+    if root.has_attrib(LightAttrib):
+        lights = root.get_attrib(LightAttrib)
+        for i in range(lights.get_num_on_lights()):
+            light = lights.get_on_light(i)
+            digest.update(('%s %s %s' % (
+                light.node().get_type().get_name(), light.node().get_color(), light.get_mat(root))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def bake_cube_map(base, size, source=None):
+    # renders the six faces around source (the camera by default) straight into a texture
+    rig = NodePath('cube-map-rig')
+    buffer = base.win.make_cube_map('cube-map', size, rig, PandaNode.get_all_camera_mask(), True)
+    if buffer is None:
+        raise RuntimeError("Could not make a cube map buffer")
+    lens = rig.find('**/+Camera').node().get_lens()
+    lens.set_near_far(base.camLens.get_near(), base.camLens.get_far())
+
+    rig.reparent_to(source if source is not None else base.camera)
+    base.graphicsEngine.open_windows()
+    base.graphicsEngine.render_frame()
+    base.graphicsEngine.render_frame()
+    base.graphicsEngine.sync_frame()
+
+    texture = buffer.get_texture()
+    base.graphicsEngine.remove_window(buffer)
+    rig.remove_node()
+    return texture
+
+
+def load_cube_map(base, size=256, cache_dir='tmp/cubemaps', key=None):
+    # A cube map of the scene, baked once per scene key and kept as a .txo with its mipmaps,
+    # later launches load it as is.
+    if key is None:
+        # the faces are rendered from the camera
+        key = get_scene_key(base.render, size, str(base.camera.get_pos(base.render)))
+    cache_file = os.path.join(cache_dir, 'cube-%s.txo' % key)
+    filename = Filename.from_os_specific(cache_file)
+
+    if os.path.exists(cache_file):
+        texture = Texture('environment')
+        if texture.read(filename):
+            return texture
+
+    texture = bake_cube_map(base, size)
+    texture.set_name('environment')
+    # reflection blur samples the mipmaps
+    texture.set_minfilter(Texture.FT_linear_mipmap_linear)
+    texture.generate_ram_mipmap_images()
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    texture.write(filename)
+    return texture
@@ -1,15 +1,35 @@
 from direct.actor.Actor import Actor
 from direct.showbase.ShowBase import ShowBase
+import timeit
+
 from panda3d.core import (
-    AmbientLight, DirectionalLight,
+    AmbientLight, ClockObject, ConfigVariableBool, ConfigVariableFilename, DirectionalLight,
     LPoint3, LVector3, LVector4,
-    PStatClient)
+    PStatClient, load_prc_file_data)
 
+import buoyancy
 import ocean
+import profiling
+import replay
+import shader_registry
+import spectrum
+import wake
+
+record_file = ConfigVariableFilename(
+    'water-record-file', '', "File the impulses, parameter changes and ship poses of every frame are recorded to")
+replay_file = ConfigVariableFilename(
+    'water-replay-file', '', "Recording played back instead of the live inputs, as fast as the frames render")
+threaded_water = ConfigVariableBool(
+    'water-threaded', False, "Runs the CPU work of the water on a worker thread, except while recording or replaying")
 
 
 class MyApp(ShowBase):
+    weather_parameters = ('bump_scale', 'bump_speed', 'teeth', 'wave_freq', 'speed0', 'speed1', 'wave_amp')
+
     def __init__(self):
+        if not replay_file.get_value().empty():
+            # nothing waits for the display while replaying
+            load_prc_file_data('', 'sync-video 0')
         ShowBase.__init__(self)
 
         self.debug = False
@@ -17,23 +37,40 @@ class MyApp(ShowBase):
             PStatClient.connect()
             self.bufferViewer.toggleEnable()
             self.camera.place()
+        # with profile-record-file set, frame timings are written there while PStats is not connected
+        profiling.record_from_config()
 
         self.world_size = 128
 
+        # with water-record-file or water-replay-file set, the inputs of the water are recorded or played back
+        self.water_recorder = None
+        self.water_player = None
+        if not replay_file.get_value().empty():
+            self.water_player = replay.Player(replay_file.get_value().to_os_specific())
+            # the recorded frame times drive everything, intervals included
+            ClockObject.get_global_clock().set_mode(ClockObject.M_slave)
+        elif not record_file.get_value().empty():
+            self.water_recorder = replay.Recorder(
+                record_file.get_value().to_os_specific(), {'world_size': self.world_size})
+            self.finalExitCallbacks.append(self.water_recorder.close)
+
         panoramic_view = LPoint3(0.0, -300.0, 60.0), LVector3(0.0, -15.0, 0.0)
         model_view = LPoint3(0.0, -35.0, 5.0), LVector3(0.0, -10.0, 0.0)
 
         self.camera_pos, self.camera_hpr = model_view
 
+        # shaders are read and compiled while the models load
+        shader_registry.registry.prewarm(gsg=self.win.get_gsg())
+
         self.skybox = self.loader.loadModel("models/morningbox/morningbox")
+        # the worker publishes whenever its job is done, not on a given frame, so recordings only
+        # play back the same without it
+        threaded = threaded_water.get_value() and self.water_recorder is None and self.water_player is None
         self.water = ocean.WaterNodeHelper(
-            self, self.world_size, self.world_size, 2, 128, 128, LVector3(0, 0, 0), False)
+            self, self.world_size, self.world_size, 2, 128, 128, LVector3(0, 0, 0), False, threaded=threaded)
+        self.finalExitCallbacks.append(self.water.close)
 
         self.model = Actor("models/flying_cloud/FLYING_L-tailed")
-        lower, upper = self.model.get_tight_bounds()
-        half_length = (lower[0] - upper[0]) / 2
-        self.head = 0.75 * half_length
-        self.tail = -0.9 * half_length
 
         self.pivot = self.render.attach_new_node("boatpivot")
         self.pivot_interval = self.pivot.hprInterval(10, LPoint3(-360, 0, 0))
@@ -66,21 +103,48 @@ class MyApp(ShowBase):
         self.water.water_shader_hlp.dampening = 0.96
         self.water.water_shader_hlp.acceleration = 10
 
-        # time of the day
-        self.water.ocean_shader_hlp.deep_colour = LVector4(0.0, 0.3, 0.5, 0.2)
-        self.water.ocean_shader_hlp.shallow_colour = LVector4(0.0, 1.0, 1.0, 0.1)
-        self.water.ocean_shader_hlp.reflection_colour = LVector4(0.85, 1.0, 1.0, 0.25)
-        self.water.ocean_shader_hlp.water_amount = 0.4
-        self.water.ocean_shader_hlp.reflection_amount = 4.0
-        self.water.ocean_shader_hlp.hdr_multiplier = 0.3
-        # weather
-        self.water.ocean_shader_hlp.bump_scale = 0.05
-        self.water.ocean_shader_hlp.bump_speed = (0.0, 0.0)
-        self.water.ocean_shader_hlp.teeth = 0.9
-        self.water.ocean_shader_hlp.wave_freq = 0.23
-        self.water.ocean_shader_hlp.speed0 = (-2.0, 0)
-        self.water.ocean_shader_hlp.speed1 = (1.0, 1.0)
-        self.water.ocean_shader_hlp.wave_amp = 0.3
+        ocean_hlp = self.water.ocean_shader_hlp
+        with ocean_hlp.params.transaction():
+            # time of the day
+            ocean_hlp.deep_colour = LVector4(0.0, 0.3, 0.5, 0.2)
+            ocean_hlp.shallow_colour = LVector4(0.0, 1.0, 1.0, 0.1)
+            ocean_hlp.reflection_colour = LVector4(0.85, 1.0, 1.0, 0.25)
+            ocean_hlp.water_amount = 0.4
+            ocean_hlp.reflection_amount = 4.0
+            ocean_hlp.hdr_multiplier = 0.3
+            # weather
+            ocean_hlp.bump_scale = 0.05
+            ocean_hlp.bump_speed = (0.0, 0.0)
+            ocean_hlp.teeth = 0.9
+            ocean_hlp.wave_freq = 0.23
+            ocean_hlp.speed0 = (-2.0, 0)
+            ocean_hlp.speed1 = (1.0, 1.0)
+            ocean_hlp.wave_amp = 0.3
+
+        ocean_hlp.params.save_preset('calm', self.weather_parameters)
+        ocean_hlp.params.add_preset('rough', {
+            'bump_scale': 0.15, 'bump_speed': (0.01, 0.005), 'teeth': 1.4, 'wave_freq': 0.3,
+            'speed0': (-3.0, 0.5), 'speed1': (1.5, 1.5), 'wave_amp': 0.6})
+        self.weather = 'calm'
+        self.spectral_sea = None
+        if self.water_player is None:
+            # a replay changes the parameters the way the recording did
+            self.accept('w', self.toggle_weather)
+            self.accept('f', self.toggle_spectrum)
+
+    def toggle_weather(self):
+        self.weather = 'rough' if self.weather == 'calm' else 'calm'
+        self.water.ocean_shader_hlp.params.blend_to(self.weather, 10.0)
+
+    def toggle_spectrum(self):
+        # between the geometric waves and a spectral sea
+        ocean_hlp = self.water.ocean_shader_hlp
+        if ocean_hlp.spectrum is not None:
+            ocean_hlp.set_spectrum(None)
+            return
+        if self.spectral_sea is None:
+            self.spectral_sea = spectrum.SpectralOcean(256, 64.0, wind_speed=8.0, fetch=20000.0, direction=180.0)
+        ocean_hlp.set_spectrum(self.spectral_sea)
 
     def init_camera(self):
         print "Initializing camera"
@@ -98,28 +162,81 @@ class MyApp(ShowBase):
         self.model.set_h(90)
         self.model.reparent_to(self.pivot)
 
+        self.buoyancy = buoyancy.BuoyancySolver(self.water.water_np, self.water.ocean_shader_hlp.get_heights)
+        self.buoyancy.add(self.model)
+
+        # the bowsprit and the yards stick out of the hull
+        lower, upper = self.model.get_tight_bounds(self.model)
+        length = upper.x - lower.x
+        outline = wake.get_hull_outline(lower.x + 0.125 * length, upper.x - 0.05 * length, 0.1 * length)
+        wake_target = self.water.water_shader_hlp
+        if self.water_recorder is not None:
+            self.water.record_to(self.water_recorder)
+            wake_target = self.water_recorder.add_target('wake', wake_target)
+            self.water_recorder.add_node('pivot', self.pivot)
+            self.water_recorder.add_node('model', self.model)
+        elif self.water_player is not None:
+            self.water.replay_from(self.water_player)
+            self.water_player.add_target('wake', wake_target)
+            self.water_player.add_node('pivot', self.pivot)
+            self.water_player.add_node('model', self.model)
+            # the recorded poses move the ship
+            self.pivot_interval.pause()
+            self.replay_start = None
+        self.wake = wake.WakeRasterizer(self.model, self.water.water_np, wake_target, outline)
+
         self.render.set_shader_input('time', 0)
         self.taskMgr.add(self.update_task, 'update')
+        if self.water_recorder is not None or self.water_player is not None:
+            # after the intervals have moved the nodes, before the frame is rendered
+            self.taskMgr.add(self.pose_task, 'poses', sort=45)
 
     def update_camera(self):
         if not self.debug:
             self.camera.set_pos(self.camera_pos)
             self.camera.set_hpr(self.camera_hpr)
-        self.water.ocean_shader_hlp.set_eye_pos(self.camera.get_pos(), self.camera.get_mat())
+        self.water.set_eye_pos(self.camera.get_pos(), self.camera.get_mat())
 
     def update_task(self, task):
-        self.render.set_shader_input('time', task.time)
-        self.update_camera()
-        pos = self.model.get_pos(self.water.water_np)
-
-        x, y = self.water.water_shader_hlp.get_texture_pos(self.tail + pos.x, pos.y)
-        self.water.water_shader_hlp.push_water(x, y, 0, 0.45)
-        x, y = self.water.water_shader_hlp.get_texture_pos(self.head + pos.x, pos.y)
-        self.water.water_shader_hlp.push_water(x, y, 0, 0.475)
-
-        self.water.update(task.time)
-        z = self.water.ocean_shader_hlp.get_height(pos.x, pos.y)
-        self.model.set_z(self.water.water_np, z)
+        profiler = profiling.profiler
+        if self.water_player is not None:
+            if self.replay_start is None:
+                self.replay_start = timeit.default_timer()
+            frame = self.water_player.next_frame()
+            if frame is None:
+                seconds = timeit.default_timer() - self.replay_start
+                print "Replayed %d frames in %.2f s, %.1f fps" % (
+                    self.water_player.frames, seconds, self.water_player.frames / max(seconds, 1e-6))
+                self.userExit()
+                return task.done
+            time, dt = frame
+            ClockObject.get_global_clock().set_frame_time(time)
+        else:
+            time, dt = task.time, ClockObject.get_global_clock().get_dt()
+            if self.water_recorder is not None:
+                self.water_recorder.begin_frame(time, dt)
+
+        self.render.set_shader_input('time', time)
+        with profiler.scope('App:Camera'):
+            self.update_camera()
+
+        if self.water_player is None and self.water.has_simulation:
+            # while replaying, the recorded impulses and poses stand in for the wake and the buoyancy
+            with profiler.scope('App:Water:Impulses'):
+                self.wake.update(dt)
+
+        self.water.update(time)
+        if self.water_player is None:
+            with profiler.scope('App:Buoyancy'):
+                self.buoyancy.update(dt)
+        profiler.end_frame(time)
+        return task.cont
+
+    def pose_task(self, task):
+        if self.water_recorder is not None:
+            self.water_recorder.record_poses()
+        else:
+            self.water_player.apply_poses()
         return task.cont
 
 
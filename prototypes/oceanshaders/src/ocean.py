@@ -1,91 +1,46 @@
-import random
+import collections
+import os
+import sys
+import timeit
 
 import copy
+import numpy as np
 from direct.interval.LerpInterval import LerpTexOffsetInterval
 from panda3d.core import (
-    Camera, CardMaker, CullFaceAttrib, Filename, FrameBufferProperties, GraphicsOutput, GraphicsPipe, LPlane, LPoint2,
-    LPoint2d, LPoint3, LPoint3d, LVector3, LVector3d, LVector4, NodePath, OrthographicLens, PlaneNode, PNMImage,
-    RenderState, Shader, TexGenAttrib, Texture, TextureStage, TransparencyAttrib, WindowProperties)
-from panda3d.egg import CS_zup_right, EggData, EggPolygon, EggVertex, EggVertexPool, load_egg_data
-
-
-def create_plane(name, width, height, x_segments, y_segments):
-    maker = CardMaker('grid')
-    maker.set_frame(0, 1, 0, 1)
-    np = NodePath(name)
-    dx = 1.0 / x_segments
-    dy = 1.0 / x_segments
-    u = 0.0
-    for x in range(x_segments):
-        v = 0.0
-        for y in range(y_segments):
-            maker.set_uv_range(LPoint2(u, v), LPoint2(u + dx, v + dy))
-            v += dy
-            node = np.attach_new_node(maker.generate())
-            node.set_hpr(0, -90, 0)
-            node.set_pos(float(x) - float(x_segments) / 2, float(y) - float(y_segments) / 2, 0)
-        u += dx
-    np.set_scale(float(width) / x_segments, float(height) / y_segments, 1)
-    np.flatten_strong()
-    return np
-
-
-def create_egg_plane(name, width, height, segments_x, segments_y, filename=None):
-    data = EggData()
-    vp = EggVertexPool('s')
-    data.add_child(vp)
-
-    width = float(width)
-    height = float(height)
-
-    d_width = width / segments_x
-    d_height = height / segments_y
-    dx = 1.0 / segments_x
-    dy = 1.0 / segments_y
-    for y in range(segments_y):
-        ty = 1.0 - y * dy
-        for x in range(segments_x):
-            tx = x * dx
-            x_pos = float(x) * d_width - width / 2.0
-            y_pos = float(y) * d_height - height / 2.0
-            tex_coord = [[tx, ty], [tx + dx, ty], [tx + dx, ty - dy], [tx, ty - dy]]
-            add_square(data, vp, x_pos, y_pos, d_width, d_height, tex_coord)
-
-    if filename is not None:
-        data.set_coordinate_system(CS_zup_right)
-        data.write_egg(Filename(filename))
-    node = load_egg_data(data)
-    np = NodePath(node)
-    np.set_name(name)
-    return np
-
-
-def add_square(data, vp, x, y, w, h, tex_coord=None):
-    if tex_coord is None:
-        tex_coord = [[1, 0], [1, 1], [0, 1], [0, 0]]
-    e_poly = EggPolygon()
-    data.add_child(e_poly)
-    in_position = [[x, y, 0], [x + w, y, 0], [x + w, y + h, 0], [x, y + h, 0]]
-    for i in range(4):
-        ev = EggVertex()
-        ev.set_pos(LPoint3d(*in_position[i]))
-        ev.set_uv(LPoint2d(*tex_coord[i]))
-        ev.set_normal(LVector3d(0, 0, 1))
-        e_poly.add_vertex(vp.add_vertex(ev))
+    BitMask32, BoundingBox, Camera, CardMaker, CullFaceAttrib, FrameBufferProperties, GraphicsOutput, GraphicsPipe,
+    LMatrix4, LPlane, LPoint3, LVector3, LVector4, NodePath, OmniBoundingVolume, OrthographicLens, PlaneNode,
+    RenderState, TexGenAttrib, Texture, TextureStage, TransparencyAttrib, WindowProperties)
+
+# atlas, cubemap, spectrum and worker are imported where they are first needed, they are not on
+# every path and importing ocean is meant to cost next to nothing
+import parameters
+import rain
+import ripple
+import shader_registry
+import waves
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'common'))
+import mesh
+from profiling import profiler
+
+
+# loaded from the registry when the first helper needs them
+shader_registry.registry.register('ocean', "shaders/vertex_ocean.vs", "shaders/vertex_ocean.fs")
+shader_registry.registry.register('water', "shaders/water.vs", "shaders/water.fs")
 
 
 class ShaderHelper(object):
-    _shader = None
+    _shader_name = None
 
     def __init__(self, target, base):
         self.target = target
         self.base = base
 
-        if self._shader is None:
+        if self._shader_name is None:
             raise NotImplementedError(
-                "Child class of AbstractShaderHelper needs to override _shader attribute")
+                "Child class of AbstractShaderHelper needs to override _shader_name attribute")
         else:
-            self.target.set_shader(self._shader)
+            self.target.set_shader(shader_registry.registry.get(self._shader_name))
 
     def set_shader_input(self, name, *args):
         self.target.set_shader_input(name, *args)
@@ -107,31 +62,235 @@ class TextureShaderHelper(ShaderHelper):
         y = int((py + self._height / 2.0) / self._height * self._size)
         return x, y
 
+    def get_texture_positions(self, xs, ys):
+        # get_texture_pos of arrays of points
+        xs = np.floor((np.asarray(xs) + self._width / 2.0) * (self._size / float(self._width))).astype(np.intp)
+        ys = np.floor((np.asarray(ys) + self._height / 2.0) * (self._size / float(self._height))).astype(np.intp)
+        return xs, ys
 
-class OceanShaderHelper(TextureShaderHelper):
-    _shader = Shader.load(
-        Shader.SL_GLSL, vertex="shaders/vertex_ocean.vs", fragment="shaders/vertex_ocean.fs")
 
-    def __init__(self, target, base, width, height, size, use_cubemap_only):
-        super(OceanShaderHelper, self).__init__(target, base, width, height, size)
-        self._use_cubemap_only = use_cubemap_only
+_component_types = {
+    Texture.T_unsigned_byte: (np.uint8, 255.0),
+    Texture.T_unsigned_short: (np.uint16, 65535.0),
+    Texture.T_float: (np.float32, 1.0),
+}
+
+
+def read_red_channel(texture, out=None):
+    # flat, row-major and normalized copy of the red channel, bottom row first like the RAM image
+    dtype, scale = _component_types[texture.get_component_type()]
+    image = np.frombuffer(memoryview(texture.get_ram_image()), dtype=dtype)
+    return decode_red_channel(image, scale, texture.get_num_components(), out)
+
+
+def decode_red_channel(image, scale, components, out=None):
+    # read_red_channel of a flat copy of a RAM image, no Panda3D calls so it runs on any thread
+    # RAM images are stored in BGR(A) order
+    red = 2 if components >= 3 else 0
+    return np.multiply(image[red::components], 1.0 / scale, out=out, dtype=np.float32)
+
+
+class HeightfieldSampler(object):
+    def __init__(self, texture, width, height, size):
+        self._texture = texture
+        self._width = float(width)
+        self._height = float(height)
+        self._size = size
 
-        self._wave_freq, self._wave_amp, self._teeth = 0.028, 0.9, 1.5
-        self._speed0, self._speed1 = (-1, 0), (-0.7, 0.7)
-        self._bump_scale, self._bump_speed, self._texture_scale = 0.2, (0.015, 0.005), (25.0, 25.0)
-        self._reflection_amount, self._water_amount = 1.0, 0.3
-        self._deep_colour, self._shallow_colour, self._reflection_colour = (
-            LVector4(0.0, 0.3, 0.5, 1.0), LVector4(0.0, 1.0, 1.0, 1.0), LVector4(0.95, 1.0, 1.0, 1.0)
-        )
-        self._fresnel_power, self._fresnel_bias, self._hdr_multiplier, self._reflection_blur = (
-            5.0, 0.328, 0.471, 0.0
-        )
+        self._snapshot = np.empty(self._size * self._size, dtype=np.float32)
+        self._is_valid = False
+        # with a worker, the snapshots and the RAM image copy the next one is decoded from
+        self._snapshots = None
+        self._image = None
 
-        self._grid_ratio = LVector4(10, 10, 15, 5)
+    @property
+    def is_valid(self):
+        return self._is_valid
+
+    @property
+    def is_threaded(self):
+        return self._snapshots is not None
+
+    def set_threaded(self):
+        # From now on the snapshots are decoded on a worker: prepare hands it the last read back
+        # and the snapshot sampled stays the front one until the next is published.
+        import worker
+
+        self._snapshot.fill(0.5)
+        self._is_valid = True
+        self._snapshots = worker.DoubleBuffer(self._snapshot, np.full_like(self._snapshot, 0.5))
+
+    def invalidate(self):
+        if self._snapshots is None:
+            self._is_valid = False
+
+    def get_snapshot(self):
+        if not self._is_valid:
+            self._read_back()
+        return self._snapshot
+
+    def _has_image(self):
+        texture = self._texture
+        return texture.has_ram_image() and texture.get_x_size() == self._size and texture.get_y_size() == self._size
+
+    def _read_back(self):
+        if not self._has_image():
+            # nothing rendered yet, a neutral surface is the best guess
+            self._snapshot.fill(0.5)
+        else:
+            read_red_channel(self._texture, self._snapshot)
+        self._is_valid = True
+
+    def prepare(self):
+        # (work, publish) of the next snapshot for an idle worker, None before anything was rendered.
+        # The render copies into the same RAM image every frame, so only the bytes are copied here,
+        # the decoding is the work.
+        if not self._has_image():
+            return None
+        texture = self._texture
+        dtype, scale = _component_types[texture.get_component_type()]
+        components = texture.get_num_components()
+        image = np.frombuffer(memoryview(texture.get_ram_image()), dtype=dtype)
+        if self._image is None or self._image.shape != image.shape or self._image.dtype != dtype:
+            self._image = np.empty_like(image)
+        copy = self._image
+        np.copyto(copy, image)
+        snapshots = self._snapshots
+        back = snapshots.back
+
+        def work():
+            decode_red_channel(copy, scale, components, back)
+
+        def publish():
+            self._snapshot = snapshots.swap()
+
+        return work, publish
+
+    def sample(self, xs, ys):
+        snapshot = self.get_snapshot()
+        last = self._size - 1
+
+        # continuous texel coordinates, texel centres sit on half integers
+        fx = (np.asarray(xs, dtype=np.float32) + self._width / 2.0) / self._width * self._size - 0.5
+        fy = (np.asarray(ys, dtype=np.float32) + self._height / 2.0) / self._height * self._size - 0.5
+        fx = np.clip(fx, 0, last)
+        fy = np.clip(fy, 0, last)
+
+        x0 = np.minimum(fx.astype(np.intp), last - 1)
+        y0 = np.minimum(fy.astype(np.intp), last - 1)
+        tx = fx - x0
+        ty = fy - y0
+
+        i00 = y0 * self._size + x0
+        i10 = i00 + 1
+        i01 = i00 + self._size
+        i11 = i01 + 1
+
+        bottom = snapshot[i00] * (1 - tx) + snapshot[i10] * tx
+        top = snapshot[i01] * (1 - tx) + snapshot[i11] * tx
+        return bottom * (1 - ty) + top * ty
+
+
+def _shader_parameter(name):
+    # the value is written to the shader with the next flush of the parameter block
+    def getter(self):
+        return self.params[name]
+
+    def setter(self, value):
+        self.params[name] = value
+    return property(getter, setter)
+
+
+class OceanShaderHelper(TextureShaderHelper):
+    _shader_name = 'ocean'
+    _parameter_layout = (
+        ('waveInfo', ('wave_freq', 'wave_amp', 'bump_scale', 'teeth')),
+        ('param2', ('bump_speed', 'texture_scale')),
+        ('param3', ('reflection_amount', 'water_amount', 0.0, 'cubemap_only')),
+        ('param4', ('fresnel_power', 'fresnel_bias', 'hdr_multiplier', 'reflection_blur')),
+        ('speed', ('speed0', 'speed1')),
+        ('deepColor', ('deep_colour',)),
+        ('shallowColor', ('shallow_colour',)),
+        ('reflectionColor', ('reflection_colour',)),
+        ('gridRatio', ('grid_ratio',)),
+        ('surfaceFrame', ('mesh_offset', 'texture_extent')),
+        ('rippleWindow', ('ripple_window_corner', 'ripple_window_span', 0.0)),
+        # coarser levels of a cascade, see CascadedWaterHelper
+        ('rippleCascade1', ('cascade_corner1', 'cascade_span1', 'cascade_scale1')),
+        ('rippleCascade2', ('cascade_corner2', 'cascade_span2', 'cascade_scale2')),
+        ('spectrumFrame', ('spectrum_span', 'height_range', 'geometric_waves', 0.0)),
+    )
+
+    # resolution as a fraction of size, frames between updates (0: only on camera movement) and the
+    # (distance, degrees) the camera has to move or turn by to force an update (None: never)
+    reflection_qualities = {
+        'high': (1.0, 1, None),
+        'medium': (0.5, 2, (1.0, 2.0)),
+        'low': (0.25, 10, (2.0, 5.0)),
+    }
+    # draw mask of the reflection camera, see set_reflected_nodes
+    reflection_mask = BitMask32.bit(4)
+    # where get_heights takes the heights from: the surface rendered into the height buffer, read back
+    # a frame late, or the waves or the spectral sea evaluated on the CPU like vertex_ocean.vs does
+    height_sources = ('readback', 'analytic')
+    # parameters that follow from the spectral sea, see set_spectrum
+    derived_parameters = ('spectrum_span', 'height_range')
+
+    def __init__(self, target, base, width, height, size, use_cubemap_only, reflection_quality='high'):
+        super(OceanShaderHelper, self).__init__(target, base, width, height, size)
+        self._use_cubemap_only = use_cubemap_only
+        if reflection_quality not in self.reflection_qualities:
+            raise RuntimeError("Unknown reflection quality: %s" % reflection_quality)
+        self._reflection_scale, self.reflection_interval, self.reflection_threshold = (
+            self.reflection_qualities[reflection_quality])
+        self.reflection_updates = 0
+
+        # CPU evaluation of the geometric waves, always in sync with the properties below
+        self.waves = waves.GerstnerWaves(self)
+        self._height_source = 'readback'
+        # the analytic heights add this function of arrays of x and y, the heights of the ripples
+        self.ripple_heights = None
+        self._time = 0.0
 
         alt_render = NodePath('altRender')
-        self._clone = NodePath(copy.copy(self.target.node()))
-        self._clone.reparent_to(alt_render)
+        if self.target.node().is_geom_node():
+            self._clone = NodePath(copy.copy(self.target.node()))
+            self._clone.reparent_to(alt_render)
+        else:
+            # a surface made of child nodes (e.g. paged tiles) is shared, so changes to it show up in both
+            self._clone = alt_render.attach_new_node('%s-clone' % self.target.get_name())
+            self.target.instance_to(self._clone)
+
+        self.params = parameters.ParameterBlock(self._parameter_layout, {
+            'wave_freq': 0.028, 'wave_amp': 0.9, 'teeth': 1.5, 'bump_scale': 0.2,
+            'speed0': (-1, 0), 'speed1': (-0.7, 0.7),
+            'bump_speed': (0.015, 0.005), 'texture_scale': (25.0, 25.0),
+            'reflection_amount': 1.0, 'water_amount': 0.3, 'cubemap_only': 1.0 if use_cubemap_only else 0.0,
+            'fresnel_power': 5.0, 'fresnel_bias': 0.328, 'hdr_multiplier': 0.471, 'reflection_blur': 0.0,
+            'deep_colour': LVector4(0.0, 0.3, 0.5, 1.0),
+            'shallow_colour': LVector4(0.0, 1.0, 1.0, 1.0),
+            'reflection_colour': LVector4(0.95, 1.0, 1.0, 1.0),
+            'grid_ratio': LVector4(10, 10, 15, 5),
+            'mesh_offset': (0.0, 0.0), 'texture_extent': (0.0, 0.0),
+            'ripple_window_corner': (0.0, 0.0), 'ripple_window_span': 0.0,
+            'cascade_corner1': (0.0, 0.0), 'cascade_span1': 0.0, 'cascade_scale1': 1.0,
+            'cascade_corner2': (0.0, 0.0), 'cascade_span2': 0.0, 'cascade_scale2': 1.0,
+            'spectrum_span': 0.0, 'height_range': 0.0, 'geometric_waves': 1.0,
+        }, (self.target, self._clone))
+
+        # levels of a cascade that are not there are calm
+        calm = Texture('calm-water')
+        calm.setup_2d_texture(1, 1, Texture.T_unsigned_byte, Texture.F_rgba)
+        calm.set_ram_image(b'\x80\x80\x80\xff')
+        for name in ('vtftex1', 'vtftex2', 'spectrumtex', 'spectrumnormals'):
+            self.set_shader_input(name, calm)
+        self.spectrum = None
+        self._spectrum_textures = None
+        # anything with record_spectrum(ocean), e.g. a replay.Recorder
+        self.recorder = None
+        # with a worker, the spectrum is transformed into the back of two pairs of textures
+        self.worker = None
+        self._spectrum_buffer = None
 
         # Heightmap buffer and camera
         winprops = WindowProperties.size(self._size, self._size)
@@ -157,7 +316,7 @@ class OceanShaderHelper(TextureShaderHelper):
 
         self._wave_tex = Texture()
         wave_buffer.add_render_texture(self._wave_tex, GraphicsOutput.RTM_copy_ram, GraphicsOutput.RTP_aux_rgba_0)
-        self._heightmap = PNMImage(self._size, self._size)
+        self.height_sampler = HeightfieldSampler(self._wave_tex, width, height, self._size)
 
         self.target.set_transparency(TransparencyAttrib.MAlpha)
 
@@ -169,8 +328,14 @@ class OceanShaderHelper(TextureShaderHelper):
             plane_node = PlaneNode('waterPlane')
             plane_node.set_plane(self._reflection_plane)
             # Buffer and reflection camera
-            reflection_buffer = base.win.make_texture_buffer('waterBuffer', self._size, self._size)
+            reflection_size = max(int(self._size * self._reflection_scale), 1)
+            reflection_buffer = base.win.make_texture_buffer('waterBuffer', reflection_size, reflection_size)
             reflection_buffer.set_clear_color(LVector4(0, 0, 0, 1))
+            self._reflection_buffer = reflection_buffer
+            self._reflection_root = base.render
+            self._reflected_nodes = []
+            self._reflection_mat = None
+            self._reflection_age = 0
 
             cfa = CullFaceAttrib.make_reverse()
             rs = RenderState.make(cfa)
@@ -202,30 +367,7 @@ class OceanShaderHelper(TextureShaderHelper):
         # Texture stage for cube map
         self.ts_environ = TextureStage('environ')
 
-        self.set_shader_input(
-            'waveInfo', LVector4(self._wave_freq, self._wave_amp, self._bump_scale, self._teeth))
-        self.set_shader_input(
-            'param2',
-            LVector4(
-                self._bump_speed[0],
-                self._bump_speed[1],
-                self._texture_scale[0],
-                self._texture_scale[1]))
-        self.set_shader_input(
-            'param3',
-            LVector4(
-                self._reflection_amount,
-                self._water_amount,
-                0.0,
-                1.0 if self.use_cubemap_only else 0.0))
-        self.set_shader_input(
-            'param4', LVector4(self._fresnel_power, self._fresnel_bias, self._hdr_multiplier, self._reflection_blur))
-        self.set_shader_input(
-            'speed', LVector4(self._speed0[0], self._speed0[1], self._speed1[0], self._speed1[1]))
-        self.set_shader_input('deepColor', self._deep_colour)
-        self.set_shader_input('shallowColor', self._shallow_colour)
-        self.set_shader_input('reflectionColor', self._reflection_colour)
-        self.set_shader_input('gridRatio', self._grid_ratio)
+        self.params.flush()
 
     # read-only
     @property
@@ -233,257 +375,169 @@ class OceanShaderHelper(TextureShaderHelper):
         return self._use_cubemap_only
 
     @property
-    def wave_freq(self):
-        return self._wave_freq
-
-    @property
-    def wave_amp(self):
-        return self._wave_amp
-
-    @property
-    def bump_speed(self):
-        return self._bump_speed
-
-    @property
-    def teeth(self):
-        return self._teeth
-
-    @property
-    def bump_scale(self):
-        return self._bump_scale
-
-    @property
-    def texture_scale(self):
-        return self._texture_scale
-
-    @property
-    def reflection_amount(self):
-        return self._reflection_amount
-
-    @property
-    def water_amount(self):
-        return self._water_amount
-
-    @property
-    def fresnel_power(self):
-        return self._fresnel_power
-
-    @property
-    def fresnel_bias(self):
-        return self._fresnel_bias
-
-    @property
-    def hdr_multiplier(self):
-        return self._hdr_multiplier
-
-    @property
-    def reflection_blur(self):
-        return self._reflection_blur
+    def reflection_scale(self):
+        return self._reflection_scale
+
+    # packed into the shader inputs by self.params
+    wave_freq = _shader_parameter('wave_freq')
+    wave_amp = _shader_parameter('wave_amp')
+    bump_speed = _shader_parameter('bump_speed')
+    teeth = _shader_parameter('teeth')
+    bump_scale = _shader_parameter('bump_scale')
+    texture_scale = _shader_parameter('texture_scale')
+    reflection_amount = _shader_parameter('reflection_amount')
+    water_amount = _shader_parameter('water_amount')
+    fresnel_power = _shader_parameter('fresnel_power')
+    fresnel_bias = _shader_parameter('fresnel_bias')
+    hdr_multiplier = _shader_parameter('hdr_multiplier')
+    reflection_blur = _shader_parameter('reflection_blur')
+    speed0 = _shader_parameter('speed0')
+    speed1 = _shader_parameter('speed1')
+    deep_colour = _shader_parameter('deep_colour')
+    shallow_colour = _shader_parameter('shallow_colour')
+    reflection_colour = _shader_parameter('reflection_colour')
+    grid_ratio = _shader_parameter('grid_ratio')
+    mesh_offset = _shader_parameter('mesh_offset')
+    texture_extent = _shader_parameter('texture_extent')
+    ripple_window_corner = _shader_parameter('ripple_window_corner')
+    ripple_window_span = _shader_parameter('ripple_window_span')
+    spectrum_span = _shader_parameter('spectrum_span')
+    geometric_waves = _shader_parameter('geometric_waves')
 
-    @property
-    def speed0(self):
-        return self._speed0
+    def set_shader_input(self, name, *args):
+        super(OceanShaderHelper, self).set_shader_input(name, *args)
+        self._clone.set_shader_input(name, *args)
 
     @property
-    def speed1(self):
-        return self._speed1
+    def height_source(self):
+        return self._height_source
 
-    @property
-    def deep_colour(self):
-        return self._deep_colour
+    @height_source.setter
+    def height_source(self, value):
+        if value not in self.height_sources:
+            raise RuntimeError("Unknown height source: %s" % value)
+        self._height_source = value
 
     @property
-    def shallow_colour(self):
-        return self._shallow_colour
+    def height_range(self):
+        # heights span this around the surface, the height buffer holds them scaled to 0 to 1
+        return self.params['height_range'] or 2.0 * 1.75 * self.wave_amp + 0.2
 
     @property
-    def reflection_colour(self):
-        return self._reflection_colour
-
-    @property
-    def grid_ratio(self):
-        return self._grid_ratio
-
-    @wave_freq.setter
-    def wave_freq(self, value):
-        self._wave_freq = value
-        self.set_shader_input(
-            'waveInfo',
-            LVector4(
-                self._wave_freq,
-                self._wave_amp,
-                self._bump_scale,
-                self._teeth))
-
-    @wave_amp.setter
-    def wave_amp(self, value):
-        self._wave_amp = value
-        self.set_shader_input(
-            'waveInfo',
-            LVector4(
-                self._wave_freq,
-                self._wave_amp,
-                self._bump_scale,
-                self._teeth))
-
-    @bump_scale.setter
-    def bump_scale(self, value):
-        self._bump_scale = value
-        self.set_shader_input(
-            'waveInfo',
-            LVector4(
-                self._wave_freq,
-                self._wave_amp,
-                self._bump_scale,
-                self._teeth))
-
-    @teeth.setter
-    def teeth(self, value):
-        self._teeth = value
-        self.set_shader_input(
-            'waveInfo',
-            LVector4(
-                self._wave_freq,
-                self._wave_amp,
-                self._bump_scale,
-                self._teeth))
-
-    @bump_speed.setter
-    def bump_speed(self, value):
-        self._bump_speed = value
-        self.set_shader_input(
-            'param2',
-            LVector4(
-                self._bump_speed[0],
-                self._bump_speed[1],
-                self._texture_scale[0],
-                self._texture_scale[1]))
-
-    @texture_scale.setter
-    def texture_scale(self, value):
-        self._texture_scale = value
-        self.set_shader_input(
-            'param2',
-            LVector4(
-                self._bump_speed[0],
-                self._bump_speed[1],
-                self._texture_scale[0],
-                self._texture_scale[1]))
-
-    @reflection_amount.setter
-    def reflection_amount(self, value):
-        self._reflection_amount = value
-        self.set_shader_input(
-            'param3',
-            LVector4(
-                self._reflection_amount,
-                self._water_amount,
-                0.0,
-                1.0 if self.use_cubemap_only else 0.0))
-
-    @water_amount.setter
-    def water_amount(self, value):
-        self._water_amount = value
-        self.set_shader_input(
-            'param3',
-            LVector4(
-                self._reflection_amount,
-                self._water_amount,
-                0.0,
-                1.0 if self.use_cubemap_only else 0.0))
-
-    @fresnel_power.setter
-    def fresnel_power(self, value):
-        self._fresnel_power = value
-        self.set_shader_input(
-            'param4',
-            LVector4(
-                self._fresnel_power,
-                self._fresnel_bias,
-                self._hdr_multiplier,
-                self._reflection_blur))
-
-    @fresnel_bias.setter
-    def fresnel_bias(self, value):
-        self._fresnel_bias = value
-        self.set_shader_input(
-            'param4',
-            LVector4(
-                self._fresnel_power,
-                self._fresnel_bias,
-                self._hdr_multiplier,
-                self._reflection_blur))
-
-    @hdr_multiplier.setter
-    def hdr_multiplier(self, value):
-        self._hdr_multiplier = value
-        self.set_shader_input(
-            'param4',
-            LVector4(
-                self._fresnel_power,
-                self._fresnel_bias,
-                self._hdr_multiplier,
-                self._reflection_blur))
-
-    @reflection_blur.setter
-    def reflection_blur(self, value):
-        self._reflection_blur = value
-        self.set_shader_input(
-            'param4',
-            LVector4(
-                self._fresnel_power,
-                self._fresnel_bias,
-                self._hdr_multiplier,
-                self._reflection_blur))
-
-    @speed0.setter
-    def speed0(self, value):
-        self._speed0 = value
-        self.set_shader_input(
-            'speed',
-            LVector4(
-                self._speed0[0],
-                self._speed0[1],
-                self._speed1[0],
-                self._speed1[1]))
-
-    @speed1.setter
-    def speed1(self, value):
-        self._speed1 = value
-        self.set_shader_input(
-            'speed',
-            LVector4(
-                self._speed0[0],
-                self._speed0[1],
-                self._speed1[0],
-                self._speed1[1]))
-
-    @deep_colour.setter
-    def deep_colour(self, value):
-        self._deep_colour = value
-        self.set_shader_input('deepColor', self._deep_colour)
-
-    @shallow_colour.setter
-    def shallow_colour(self, value):
-        self._shallow_colour = value
-        self.set_shader_input('shallowColor', self._shallow_colour)
-
-    @reflection_colour.setter
-    def reflection_colour(self, value):
-        self._reflection_colour = value
-        self.set_shader_input('reflectionColor', self._reflection_colour)
-
-    @grid_ratio.setter
-    def grid_ratio(self, value):
-        self._grid_ratio = value
-        self.set_shader_input('gridRatio', self._grid_ratio)
-
-    def set_shader_input(self, name, *args):
-        super(OceanShaderHelper, self).set_shader_input(name, *args)
-        self._clone.set_shader_input(name, *args)
+    def displacement_bounds(self):
+        # (sideways, up or down) vertex_ocean.vs moves a vertex by at most, the ripples included
+        if self.spectrum is not None:
+            sideways = self.spectrum.displacement_range
+        elif self.geometric_waves:
+            sideways = self.waves.get_max_horizontal_displacement()
+        else:
+            sideways = 0.0
+        return sideways, (self.height_range + self.grid_ratio[3]) / 2.0
+
+    def set_worker(self, worker):
+        # a worker.Worker the spectrum and the height snapshots are prepared on from now on
+        self.worker = worker
+        self.height_sampler.set_threaded()
+        self.set_spectrum(self.spectrum)
+
+    def set_spectrum(self, ocean):
+        # A spectrum.SpectralOcean instead of the geometric waves, tiled over the surface; None
+        # goes back to them. Heights are read back from the rendered surface either way.
+        if self.worker is not None:
+            # the job in flight may still be transforming the last sea
+            self.worker.wait()
+        self.spectrum = ocean
+        self._spectrum_buffer = None
+        if self.recorder is not None:
+            self.recorder.record_spectrum(ocean)
+        if ocean is None:
+            self.spectrum_span = 0.0
+            self.params['height_range'] = 0.0
+            self._spectrum_textures = None
+            return
+        self._spectrum_textures = self._make_spectrum_textures(ocean.size)
+        if self.worker is not None:
+            import worker
+            self._spectrum_buffer = worker.DoubleBuffer(
+                self._spectrum_textures, self._make_spectrum_textures(ocean.size))
+        self._set_spectrum_textures()
+        self.spectrum_span = ocean.span
+        self._update_spectrum(0.0 if ocean.time is None else ocean.time)
+
+    def _make_spectrum_textures(self, size):
+        displacement = Texture('spectrum-displacement')
+        displacement.setup_2d_texture(size, size, Texture.T_float, Texture.F_rgba32)
+        normals = Texture('spectrum-normals')
+        normals.setup_2d_texture(size, size, Texture.T_unsigned_byte, Texture.F_rgba)
+        for texture in (displacement, normals):
+            texture.set_wrap_u(Texture.WMRepeat)
+            texture.set_wrap_v(Texture.WMRepeat)
+            texture.set_minfilter(Texture.FT_linear)
+            texture.set_magfilter(Texture.FT_linear)
+        return displacement, normals
+
+    def _set_spectrum_textures(self):
+        displacement, normals = self._spectrum_textures
+        self.set_shader_input('spectrumtex', displacement)
+        self.set_shader_input('spectrumnormals', normals)
+
+    def _get_spectrum_images(self, textures):
+        size = self.spectrum.size
+        displacement, normals = textures
+        return (np.frombuffer(memoryview(displacement.modify_ram_image()), dtype=np.float32).reshape(size, size, 4),
+                np.frombuffer(memoryview(normals.modify_ram_image()), dtype=np.uint8).reshape(size, size, 4))
+
+    def _update_spectrum(self, time):
+        ocean = self.spectrum
+        ocean.update(time)
+        ocean.encode(*self._get_spectrum_images(self._spectrum_textures))
+        self._update_height_range()
+
+    def _update_height_range(self):
+        # the ripples come on top, like in the default range
+        height_range = self.spectrum.height_range + 0.2
+        if self.params['height_range'] != height_range:
+            self.params['height_range'] = height_range
+
+    def prepare_spectrum(self, time):
+        # (work, publish) of the spectrum at time for an idle worker, None without a spectral sea
+        if self._spectrum_buffer is None:
+            return None
+        ocean, buffer = self.spectrum, self._spectrum_buffer
+        displacement, normals = self._get_spectrum_images(buffer.back)
+
+        def work():
+            ocean.update(time)
+            ocean.encode(displacement, normals)
+
+        def publish():
+            # unless the sea was changed meanwhile
+            if buffer is self._spectrum_buffer:
+                self._spectrum_textures = buffer.swap()
+                self._set_spectrum_textures()
+
+        return work, publish
+
+    def set_sea_state(self, wind_speed, fetch, direction):
+        # SpectralOcean.set_sea_state of the spectral sea, not under a running transform
+        if self.worker is not None:
+            self.worker.wait()
+        self.spectrum.set_sea_state(wind_speed, fetch, direction)
+        if self.recorder is not None:
+            self.recorder.record_spectrum(self.spectrum)
 
     def update(self, time):
+        self._time = time
         self._clone.set_shader_input('time', time)
+        if self._spectrum_buffer is not None:
+            # the transform runs on the worker, see prepare_spectrum
+            self._update_height_range()
+        elif self.spectrum is not None:
+            with profiler.scope('App:Water:Spectrum'):
+                self._update_spectrum(time)
+        # parameter changes and preset transitions of the frame
+        self.params.advance(time)
+        self.height_sampler.invalidate()
         # self._reflection_plane.set_w(0.1 - self.target.get_z() - self.get_height(0, 0))
 
     def set_skybox(self, cubemap):
@@ -494,69 +548,172 @@ class OceanShaderHelper(TextureShaderHelper):
 
     def set_eye_pos(self, pos, mc=None):
         if mc is not None and not self._use_cubemap_only:
-            # update matrix of the reflection camera
-            mf = self._reflection_plane.get_reflection_mat()
-            self._reflection_cam_np.set_mat(mc * mf)
+            self._update_reflection(mc)
         self.target.set_shader_input('eyePosition', LVector4(pos - self.target.get_pos(), 0))
         self._clone.set_shader_input('eyePosition', LVector4(pos - self.target.get_pos(), 0))
+        # a moved clipmap has to match the eye position in the same frame
+        self.params.flush()
+
+    def _update_reflection(self, mc):
+        # the reflection is only rendered in the frames it is due, otherwise the last one is kept
+        mat = mc * self._reflection_plane.get_reflection_mat()
+        last = self._reflection_mat
+        due = last is None or (self.reflection_interval and self._reflection_age + 1 >= self.reflection_interval)
+        if not due and self.reflection_threshold is not None:
+            distance, degrees = self.reflection_threshold
+            moved = (LVector3(mat.get_row3(3)) - LVector3(last.get_row3(3))).length()
+            turned = LVector3(mat.get_row3(1)).normalized().angle_deg(LVector3(last.get_row3(1)).normalized())
+            due = moved > distance or turned > degrees
+
+        self._reflection_buffer.set_active(due)
+        if due:
+            self._reflection_cam_np.set_mat(mat)
+            self._reflection_mat = LMatrix4(mat)
+            self._reflection_age = 0
+            self.reflection_updates += 1
+        else:
+            self._reflection_age += 1
+
+    def set_reflected_nodes(self, nodes):
+        # only the given nodes (e.g. the ship and the sky) are drawn in the reflection, None draws everything
+        if self._use_cubemap_only:
+            return
+        mask = self.reflection_mask
+        for node in self._reflected_nodes:
+            node.show(mask)
+        if nodes is None:
+            self._reflected_nodes = []
+            self._reflection_root.show(mask)
+        else:
+            self._reflected_nodes = list(nodes)
+            self._reflection_root.hide(mask)
+            for node in self._reflected_nodes:
+                node.show_through(mask)
+        self._reflection_cam_np.node().set_camera_mask(mask)
+
+    def get_heights(self, xs, ys):
+        if self._height_source == 'analytic':
+            return self.get_analytic_heights(xs, ys)
+        return (self.height_sampler.sample(xs, ys) - 0.5) * self.height_range
+
+    def get_analytic_heights(self, xs, ys, iterations=2):
+        # Heights over xs, ys in the water node's space, where the shader's positions are once the
+        # mesh offset is added. The surface moves sideways, fixed-point iterations find the point
+        # that ends up above xs, ys; the ripples are taken where that point was, like in the shader.
+        if self.spectrum is not None:
+            import spectrum
+            # the tile the shader samples, with a worker the one published last
+            displacement, _ = self._spectrum_textures
+            size, span = self.spectrum.size, self.spectrum.span
+            field = np.frombuffer(memoryview(displacement.get_ram_image()), dtype=np.float32).reshape(size, size, 4)
+
+            def get_displacement(px, py):
+                return (spectrum.sample_tile(field[..., 2], span, px, py),
+                        spectrum.sample_tile(field[..., 1], span, px, py))
+
+            px, py = spectrum.find_origins(get_displacement, xs, ys, iterations)
+            heights = spectrum.sample_tile(field[..., 0], span, px, py)
+        elif self.geometric_waves:
+            px, py = self.waves.find_origins(xs, ys, self._time, iterations)
+            heights, _, _ = self.waves.evaluate(px, py, self._time, iterations=0)
+        else:
+            px, py = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+            heights = np.zeros(np.broadcast(px, py).shape)
+        if self.ripple_heights is not None:
+            heights = heights + self.ripple_heights(px, py)
+        return heights
 
     def get_height(self, x, y):
-        self._wave_tex.store(self._heightmap)
-        self._heightmap.flip(False, True, False)
-        f = self._heightmap.get_pixel(*self.get_texture_pos(x, y))
-        return (f.get_red() / 255.0 - 0.5) * (2.0 * 1.75 * self._wave_amp + 0.2)
+        return float(self.get_heights(x, y))
 
 
 class WaterShaderHelper(TextureShaderHelper):
-    _shader = Shader.load(
-        Shader.SL_GLSL, vertex="shaders/water.vs", fragment="shaders/water.fs")
-
-    def __init__(self, base, width, height, size):
-        cm = CardMaker('water-filter-stage-quad')
-        cm.set_frame_fullscreen_quad()
-        quad = NodePath(cm.generate())
-        quad.set_depth_test(0)
-        quad.set_depth_write(0)
-        quad.set_color(LVector4(0.5, 0.5, 0.5, 1))
+    _shader_name = 'water'
+    # water.fs runs up to this many times a frame, each step rendered into a texture buffer of its
+    # own from the two before it
+    max_substeps = 4
 
-        super(WaterShaderHelper, self).__init__(quad, base, width, height, size)
+    def __init__(self, base, width, height, size, window_span=0, passes=None):
+        # the shader and its inputs are shared by the quads of all passes
+        super(WaterShaderHelper, self).__init__(NodePath('water-filter'), base, width, height, size)
 
         self._acceleration = 30
         self._dampening = 0.99
 
         self.is_texture_changed = False
 
-        surface_buffer = base.win.make_texture_buffer('surface', self._size, self._size, Texture(), True)
-        surface_buffer.set_clear_color(LVector4(0.5, 0.5, 0.5, 0))
-        surface_buffer.set_sort(-1)
-
-        quad_cam_node = Camera('water-filter-quad-cam')
-        lens = OrthographicLens()
-        lens.set_film_size(2, 2)
-        lens.set_film_offset(0, 0)
-        lens.set_near_far(-1000, 1000)
-        quad_cam_node.set_lens(lens)
-        quad_cam_np = self.target.attach_new_node(quad_cam_node)
-
-        surface_buffer.get_display_region(0).set_camera(quad_cam_np)
-        surface_buffer.get_display_region(0).set_active(1)
-
-        self.vertex_tex = Texture()
-        self._tex1 = Texture()
-        self._temp_tex = surface_buffer.get_texture()
-
-        self._screen_image = PNMImage(self._size, self._size)
-        self._screen_image.fill(0.5, 0.5, 0.5)
-        self.vertex_tex.load(self._screen_image)
-        self._tex1.load(self._screen_image)
-        self._temp_tex.load(self._screen_image)
-
-        self._screen_image_new = None
+        # (buffer, quad, texture, copies to RAM) of every pass, the last two of a frame are copied
+        # to RAM for the next one, the others stay on the GPU
+        self._passes = []
+        for index in range(passes or self.max_substeps):
+            surface_buffer = base.win.make_texture_buffer(
+                'surface%d' % index, self._size, self._size, Texture('water-step%d' % index), True)
+            surface_buffer.set_clear_color(LVector4(0.5, 0.5, 0.5, 0))
+            # in the order of the steps, before everything else
+            surface_buffer.set_sort(index - (passes or self.max_substeps))
+            surface_buffer.set_active(index == 0)
+
+            cm = CardMaker('water-filter-stage-quad')
+            cm.set_frame_fullscreen_quad()
+            quad = self.target.attach_new_node(cm.generate())
+            quad.set_depth_test(0)
+            quad.set_depth_write(0)
+            quad.set_color(LVector4(0.5, 0.5, 0.5, 1))
+            # every pass only sees its own quad
+            mask = BitMask32.bit(index)
+            quad.hide(BitMask32.all_on())
+            quad.show(mask)
+
+            quad_cam_node = Camera('water-filter-quad-cam')
+            lens = OrthographicLens()
+            lens.set_film_size(2, 2)
+            lens.set_film_offset(0, 0)
+            lens.set_near_far(-1000, 1000)
+            quad_cam_node.set_lens(lens)
+            quad_cam_node.set_camera_mask(mask)
+            quad_cam_np = self.target.attach_new_node(quad_cam_node)
+
+            surface_buffer.get_display_region(0).set_camera(quad_cam_np)
+            surface_buffer.get_display_region(0).set_active(1)
+            self._passes.append([surface_buffer, quad, surface_buffer.get_texture(), True])
+        # steps rendered the last frame anything was
+        self._last_steps = 1
+
+        # current and history textures are swapped every frame, their RAM images are reused
+        self.vertex_tex = Texture('water-current')
+        self._tex1 = Texture('water-history')
+        self._temp_tex = self._passes[0][2]
+        # the current heights without the impulses of the frame, the history of a second step
+        self._unkicked_tex = Texture('water-unkicked')
+        # a window instead of the whole sea wraps around in the textures
+        self.window = ripple.ScrollingWindow(self._size, window_span) if window_span else None
+        self._scrolled = None
+        wrap = Texture.WMRepeat if self.window is not None else Texture.WMClamp
+        for texture in [self.vertex_tex, self._tex1, self._unkicked_tex] + [p[2] for p in self._passes]:
+            texture.setup_2d_texture(self._size, self._size, Texture.T_unsigned_byte, Texture.F_rgba)
+            texture.set_wrap_u(wrap)
+            texture.set_wrap_v(wrap)
+            image = self._get_image(texture)
+            image[..., :3] = 128
+            image[..., 3] = 255
+
+        self.impulses = ripple.ImpulseBuffer(self._size)
+        # red channel of the last impulse region before blending, the history has to be free of impulses
+        self._history_patch = None
 
         texd = base.loader.loadTexture("textures/dampening.tga")  # for dampening purpose
-        self.target.set_texture(TextureStage('tex0'), self.vertex_tex)
-        self.target.set_texture(TextureStage('tex1'), self._tex1)
-        self.target.set_texture(TextureStage('dampening'), texd)
+        self._ts_current = TextureStage('tex0')
+        self._ts_history = TextureStage('tex1')
+        self._ts_dampening = TextureStage('dampening')
+        # every pass after the first steps on from the two before it
+        for index, (_, quad, _, _) in enumerate(self._passes):
+            if index >= 2:
+                quad.set_texture(self._ts_current, self._passes[index - 1][2])
+                quad.set_texture(self._ts_history, self._passes[index - 2][2])
+            else:
+                quad.set_texture(self._ts_current, self.vertex_tex if index == 0 else self._passes[0][2])
+                quad.set_texture(self._ts_history, self._tex1 if index == 0 else self.vertex_tex)
+            quad.set_texture(self._ts_dampening, texd)
 
         self.set_shader_input(
             'param1', LVector4(
@@ -564,6 +721,7 @@ class WaterShaderHelper(TextureShaderHelper):
                 self._size,
                 self._acceleration,
                 self._dampening))
+        self._set_window_input()
 
     @property
     def acceleration(self):
@@ -595,57 +753,633 @@ class WaterShaderHelper(TextureShaderHelper):
                 self._acceleration,
                 self._dampening))
 
-    def update(self):
-        self._tex1.load(self._screen_image)
-        self._temp_tex.store(self._screen_image)
-        if self._screen_image_new is not None and self.is_texture_changed:
-            self.vertex_tex.load(self._screen_image_new)
+    def set_dampening_texture(self, texture):
+        for _, quad, _, _ in self._passes:
+            quad.set_texture(self._ts_dampening, texture)
+
+    def bind(self, ocean):
+        # shows the simulation on an OceanShaderHelper, again after every update as the textures swap
+        ocean.set_shader_input('vtftex', self.vertex_tex)
+        if self.window is not None and (ocean.ripple_window_corner, ocean.ripple_window_span) != (
+                self.window.corner, self.window.span):
+            ocean.ripple_window_span = self.window.span
+            ocean.ripple_window_corner = self.window.corner
+
+    def _set_window_input(self):
+        offset = self.window.offset if self.window is not None else (0.0, 0.0)
+        self.set_shader_input('window', LVector4(offset[0], offset[1], 0, 0))
+
+    def get_texture_pos(self, px, py):
+        if self.window is None:
+            return super(WaterShaderHelper, self).get_texture_pos(px, py)
+        xs, ys = self.window.get_texture_positions(px, py)
+        return int(xs), int(ys)
+
+    def get_texture_positions(self, xs, ys):
+        if self.window is None:
+            return super(WaterShaderHelper, self).get_texture_positions(xs, ys)
+        return self.window.get_texture_positions(xs, ys)
+
+    def move_window(self, x, y):
+        # Centres the window on x, y. What scrolls out is dropped, the strips scrolling in are
+        # cleared with the next update. Returns True if the window moved.
+        columns, rows = self.window.move_to(x, y)
+        if not columns and not rows:
+            return False
+        # impulses stamped where the window was land in the strips scrolling in
+        self.impulses.discard(columns, rows)
+        if self._scrolled is None:
+            self._scrolled = (list(columns), list(rows))
+        else:
+            self._scrolled[0].extend(columns)
+            self._scrolled[1].extend(rows)
+        self._set_window_input()
+        return True
+
+    def _clear_scrolled(self, images):
+        columns, rows = self._scrolled
+        self._scrolled = None
+        for image in images:
+            for start, stop in columns:
+                image[:, start:stop, :3] = 128
+            for start, stop in rows:
+                image[start:stop, :, :3] = 128
+
+    def _get_image(self, texture):
+        # writable view of the RAM image, it also marks the texture for upload
+        image = np.frombuffer(memoryview(texture.modify_ram_image()), dtype=np.uint8)
+        return image.reshape(self._size, self._size, 4)
+
+    def _copy_surface(self, texture, image):
+        # the RAM image a pass was copied into last frame, False if it has not been rendered yet
+        if not texture.has_ram_image():
+            return False
+        surface = np.frombuffer(memoryview(texture.get_ram_image()), dtype=np.uint8)
+        surface = surface.reshape(self._size, self._size, -1)
+        image[..., :surface.shape[2]] = surface
+        return True
+
+    def update(self, steps=1):
+        # Without a step the surface is not rendered this frame and the textures stay as they are,
+        # impulses wait for the next step. The steps of a frame are chained passes, only the first
+        # one starts from the textures.
+        steps = max(min(steps, len(self._passes)), 0)
+        for index, surface_pass in enumerate(self._passes):
+            surface_pass[0].set_active(index < steps)
+        if steps <= 0:
+            return
+
+        last = self._last_steps
+        if last == 1:
+            # the texture shown last frame becomes the history by reference, it is already on the GPU
+            self.vertex_tex, self._tex1 = self._tex1, self.vertex_tex
+            if self._history_patch is not None:
+                (x0, y0, x1, y1), red = self._history_patch
+                self._get_image(self._tex1)[y0:y1, x0:x1, 2] = red
         else:
-            self.vertex_tex.load(self._screen_image)
-        self._screen_image_new = None
-        self.vertex_tex.set_wrap_u(Texture.WMClamp)
-        self.vertex_tex.set_wrap_v(Texture.WMClamp)
-        self._tex1.set_wrap_u(Texture.WMClamp)
-        self._tex1.set_wrap_v(Texture.WMClamp)
+            # the step before the last one of the frame is the history
+            self._copy_surface(self._passes[last - 2][2], self._get_image(self._tex1))
+        self._history_patch = None
+
+        # the only transfer in: the surface rendered last frame into the recycled RAM image
+        image = self._get_image(self.vertex_tex)
+        self._copy_surface(self._passes[last - 1][2], image)
+        if self._scrolled is not None:
+            # both heights of the Verlet step have to be calm where the window moved on to
+            self._clear_scrolled((image, self._get_image(self._tex1)))
+
+        unkicked = self.vertex_tex
+        if self.is_texture_changed and not self.impulses.is_empty:
+            # blend the impulses of the frame into the red channel in one pass
+            x0, y0, x1, y1 = self.impulses.box
+            if steps == 1:
+                self._history_patch = (x0, y0, x1, y1), image[y0:y1, x0:x1, 2].copy()
+            else:
+                # the second step takes the heights from before the impulses as its history, like
+                # the next frame does after a single step
+                unkicked = self._unkicked_tex
+                np.copyto(self._get_image(unkicked), image)
+            self.impulses.apply(image[..., 2], 255.0)
+
+        first = self._passes[0][1]
+        first.set_texture(self._ts_current, self.vertex_tex)
+        first.set_texture(self._ts_history, self._tex1)
+        if steps > 1:
+            self._passes[1][1].set_texture(self._ts_history, unkicked)
+
+        # the last two steps are wanted on the CPU next frame, the others only on the GPU
+        for index, surface_pass in enumerate(self._passes[:steps]):
+            buffer, _, texture, to_ram = surface_pass
+            if to_ram != (index >= steps - 2):
+                surface_pass[3] = not to_ram
+                buffer.clear_render_textures()
+                buffer.add_render_texture(
+                    texture, GraphicsOutput.RTM_copy_ram if not to_ram else GraphicsOutput.RTM_bind_or_copy)
+        self._last_steps = steps
 
         self.is_texture_changed = False
 
     def push_water(self, x1, y1, r, v):
-        if self._screen_image_new is None:
-            self._screen_image_new = PNMImage(self._size, self._size)
-            self._temp_tex.store(self._screen_image_new)
-        frx = max(0, x1 - r)
-        tox = min(self._size, x1 + r + 1)
-        fry = max(0, y1 - r)
-        toy = min(self._size, y1 + r + 1)
-        for x in range(frx, tox):
-            for y in range(fry, toy):
-                self._screen_image_new.set_red(x, y, v)
+        self.stamp_water(x1, y1, r, v)
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        # values are in texture units like push_water's v, kernels are 'square', 'disc' or 'gaussian';
+        # positions are PNMImage coordinates while the RAM image is stored bottom row first
+        self.impulses.stamp(xs, self._size - 1 - np.asarray(ys), radii, values, kernels)
         self.is_texture_changed = True
 
 
-class WaterNodeHelper(object):
-    def __init__(self, base, width, height, depth, segment_x, segment_y, pos, use_cubemap_only=True):
-        self.is_raining = False
-        self._next_rain_time = 0
+class NumpyWaterHelper(object):
+    max_substeps = None
+
+    def __init__(self, base, width, height, size, window_span=0):
+        if window_span:
+            raise RuntimeError("The cpu water backend has no scrolling window, use the gpu one")
+        self.base = base
+        self.window = None
+
+        self._size = size
+        self._width = width
+        self._height = height
+
+        texd = base.loader.loadTexture("textures/dampening.tga")  # for dampening purpose
+        dampening_mask = read_red_channel(texd).reshape(texd.get_y_size(), texd.get_x_size())
+        self.simulation = ripple.RippleSimulation(self._size, 30, 0.99, dampening_mask)
+
+        self.is_texture_changed = False
+
+        self.vertex_tex = self._make_texture()
+        self._upload()
+        # with a worker, the textures it encodes into and what waits for its next job
+        self._textures = None
+        self._stamps = []
+        self._steps = 0
+        # properties of the simulation set since, the worker may be stepping it
+        self._settings = {}
+
+    def _make_texture(self):
+        texture = Texture('water-simulation')
+        texture.setup_2d_texture(self._size, self._size, Texture.T_unsigned_byte, Texture.F_rgba)
+        texture.set_wrap_u(Texture.WMClamp)
+        texture.set_wrap_v(Texture.WMClamp)
+        return texture
+
+    @property
+    def acceleration(self):
+        return self._settings.get('acceleration', self.simulation.acceleration)
+
+    @property
+    def dampening(self):
+        return self._settings.get('dampening', self.simulation.dampening)
+
+    @acceleration.setter
+    def acceleration(self, value):
+        self._set('acceleration', value)
+
+    @dampening.setter
+    def dampening(self, value):
+        self._set('dampening', value)
+
+    def _set(self, name, value):
+        # with a worker the change waits for the next job, like the impulses
+        if self._textures is not None:
+            self._settings[name] = value
+        else:
+            setattr(self.simulation, name, value)
+
+    def get_texture_pos(self, px, py):
+        x = int((px + self._width / 2.0) / self._width * self._size)
+        y = int((py + self._height / 2.0) / self._height * self._size)
+        return x, y
+
+    def get_texture_positions(self, xs, ys):
+        # get_texture_pos of arrays of points
+        xs = np.floor((np.asarray(xs) + self._width / 2.0) * (self._size / float(self._width))).astype(np.intp)
+        ys = np.floor((np.asarray(ys) + self._height / 2.0) * (self._size / float(self._height))).astype(np.intp)
+        return xs, ys
+
+    def bind(self, ocean):
+        ocean.set_shader_input('vtftex', self.vertex_tex)
+
+    @property
+    def is_threaded(self):
+        return self._textures is not None
+
+    def set_threaded(self):
+        # From now on impulses and steps wait for prepare, which hands them to a worker along with
+        # the back of two textures; the front one is shown until the next is published.
+        import worker
+
+        back = self._make_texture()
+        self.simulation.encode(self._get_image(back))
+        self._textures = worker.DoubleBuffer(self.vertex_tex, back)
+
+    def _get_image(self, texture):
+        return np.frombuffer(memoryview(texture.modify_ram_image()), dtype=np.uint8).reshape(self._size, self._size, 4)
+
+    def _upload(self):
+        # encode straight into the texture's RAM image, no intermediate image
+        self.simulation.encode(self._get_image(self.vertex_tex))
+
+    def update(self, steps=1):
+        # the steps of a frame run back to back, the texture is encoded once after them
+        if steps <= 0:
+            return
+        if self._textures is not None:
+            self._steps += steps
+            return
+        for _ in range(steps):
+            self.simulation.step()
+        self._upload()
+
+        self.is_texture_changed = False
+
+    def prepare(self):
+        # (work, publish) of the settings, impulses and steps since the last job for an idle worker,
+        # None without any; publish is None while no step was taken
+        settings, stamps, steps = self._settings, self._stamps, self._steps
+        if not settings and not stamps and not steps:
+            return None
+        self._settings, self._stamps, self._steps = {}, [], 0
+        simulation = self.simulation
+        image = self._get_image(self._textures.back) if steps else None
+
+        def work():
+            for name, value in settings.items():
+                setattr(simulation, name, value)
+            for stamp in stamps:
+                simulation.stamp(*stamp)
+            if steps:
+                for _ in range(steps):
+                    simulation.step()
+                simulation.encode(image)
+
+        def publish():
+            self.vertex_tex = self._textures.swap()
+            self.is_texture_changed = False
+
+        return work, (publish if steps else None)
+
+    def push_water(self, x1, y1, r, v):
+        self.stamp_water(x1, y1, r, v)
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        ys = self._size - 1 - np.asarray(ys)
+        if self._textures is not None:
+            # copies, the caller may reuse its arrays before the worker gets to them
+            if not isinstance(kernels, str):
+                kernels = np.array(kernels)
+            self._stamps.append((np.array(xs), ys, np.array(radii), np.array(values), kernels))
+        else:
+            self.simulation.stamp(xs, ys, radii, values, kernels)
+        self.is_texture_changed = True
 
-        self._texture_size = 512
+
+class CascadedWaterHelper(object):
+    # Nested ripple simulations, each a WaterShaderHelper with a scrolling window of its own span
+    # and size, finest first and all centred on the same point. A coarser level runs everywhere
+    # under the finer ones and feeds them the heights along the edges of their windows, impulses
+    # land in every level they fall in. vertex_ocean.vs shows the finest level inside its window,
+    # fading into the coarser ones towards its edges.
+    max_substeps = 1
+    max_levels = 3
+
+    def __init__(self, base, width, height, levels):
+        # levels are (span, size) pairs
+        levels = sorted(levels)
+        if not 1 <= len(levels) <= self.max_levels:
+            raise RuntimeError("A ripple cascade has 1 to %d levels" % self.max_levels)
+        # one pass each, the edges of the windows are only fed once a frame
+        self.levels = [WaterShaderHelper(base, width, height, size, span, 1) for span, size in levels]
+        self._texel = self.levels[0].window.texel
+        self._size = self.levels[0]._size
+        self._width = width
+        self._height = height
+
+        # only the outermost level is dampened towards its edges, the others get theirs from the next level
+        calm = Texture('no-dampening')
+        calm.setup_2d_texture(1, 1, Texture.T_unsigned_byte, Texture.F_rgba)
+        calm.set_ram_image(b'\xff\xff\xff\xff')
+        for level in self.levels[:-1]:
+            level.set_dampening_texture(calm)
+
+        self._acceleration = self.levels[0].acceleration
+        self.acceleration = self._acceleration
+
+    @property
+    def window(self):
+        return self.levels[0].window
+
+    @property
+    def vertex_tex(self):
+        return self.levels[0].vertex_tex
+
+    @property
+    def acceleration(self):
+        return self._acceleration
+
+    @property
+    def dampening(self):
+        return self.levels[0].dampening
+
+    @acceleration.setter
+    def acceleration(self, value):
+        # waves have to cross the sea as fast on coarse texels as on fine ones
+        self._acceleration = value
+        for level in self.levels:
+            level.acceleration = value * (self._texel / level.window.texel) ** 2
+
+    @dampening.setter
+    def dampening(self, value):
+        for level in self.levels:
+            level.dampening = value
+
+    @property
+    def is_texture_changed(self):
+        return any(level.is_texture_changed for level in self.levels)
+
+    def get_texture_pos(self, px, py):
+        # texels of the finest level counted from the origin of the world, not wrapped
+        return int(np.floor(px / self._texel)), int(np.floor(py / self._texel))
+
+    def get_texture_positions(self, xs, ys):
+        return (np.floor(np.asarray(xs) / self._texel).astype(np.intp),
+                np.floor(np.asarray(ys) / self._texel).astype(np.intp))
+
+    def push_water(self, x1, y1, r, v):
+        self.stamp_water(x1, y1, r, v)
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        # the centres of the finest texels in every level, radii scaled to its texels
+        xs = (np.asarray(xs) + 0.5) * self._texel
+        ys = (np.asarray(ys) + 0.5) * self._texel
+        for level in self.levels:
+            level_xs, level_ys = level.window.get_texture_positions(xs, ys)
+            level_radii = np.rint(np.asarray(radii) * (self._texel / level.window.texel)).astype(np.intp)
+            level.stamp_water(level_xs, level_ys, level_radii, values, kernels)
+
+    def move_window(self, x, y):
+        moved = False
+        for level in self.levels:
+            moved = level.move_window(x, y) or moved
+        return moved
+
+    def update(self, steps=1):
+        for level in reversed(self.levels):
+            level.update(steps)
+        if steps <= 0:
+            return
+        # the edge of a window takes the heights of the next level out, in both the heights
+        # the next step starts from
+        for level, outer in zip(self.levels[:-1], self.levels[1:]):
+            i, j = level.window.get_ring()
+            texel = level.window.texel
+            heights = outer.window.sample(outer._get_image(outer.vertex_tex)[..., 2], (i + 0.5) * texel,
+                                          (j + 0.5) * texel)
+            rows, columns = level.window.get_ram_indices(i, j)
+            level._get_image(level.vertex_tex)[rows, columns, 2] = np.rint(heights)
+
+    def bind(self, ocean):
+        self.levels[0].bind(ocean)
+        for index, level in enumerate(self.levels[1:], 1):
+            ocean.set_shader_input('vtftex%d' % index, level.vertex_tex)
+            span = 'cascade_span%d' % index
+            corner = 'cascade_corner%d' % index
+            if (ocean.params[corner], ocean.params[span]) != (level.window.corner, level.window.span):
+                ocean.params.update({
+                    corner: level.window.corner, span: level.window.span,
+                    'cascade_scale%d' % index: self._texel / level.window.texel})
+
+
+class WaterTileManager(object):
+    # faces of a cube of side size centred on the root, local +z being the outward normal
+    _cube_face_hprs = ((0, 0, 0), (0, 180, 0), (0, 90, 0), (0, -90, 0), (0, 0, 90), (0, 0, -90))
+
+    def __init__(self, root, size, segments, max_depth, cube_sphere=False, page_radius=None, lod_factor=2.0,
+                 bounds_margin=10.0, horizontal_margin=30.0, skirt=None, cache_size=256):
+        self.root = root
+        self._size = float(size)
+        self._segments = segments
+        self._max_depth = max_depth
+        self.page_radius = page_radius if page_radius is not None else self._size
+        self.lod_factor = lod_factor
+        # room for the displacement done in the vertex shader up and down and sideways, tiles are
+        # culled on these bounds, see set_margins
+        self._bounds_margin = bounds_margin
+        self._horizontal_margin = horizontal_margin
+        # depth of the strips hanging from the tile edges over the cracks between depths
+        self.skirt = skirt if skirt is not None else bounds_margin
+        self.cache_size = cache_size
+
+        self._faces = []
+        for i, hpr in enumerate(self._cube_face_hprs if cube_sphere else ((0, 0, 0),)):
+            face = self.root.attach_new_node('water-face-%d' % i)
+            if cube_sphere:
+                face.set_hpr(hpr)
+                face.set_pos(face.get_quat().xform(LVector3(0, 0, self._size / 2.0)))
+            self._faces.append(face)
+        self._is_cube_sphere = cube_sphere
+
+        self._active = {}
+        self._cache = collections.OrderedDict()
+
+    @property
+    def bounds_margin(self):
+        return self._bounds_margin
+
+    @property
+    def horizontal_margin(self):
+        return self._horizontal_margin
+
+    def set_margins(self, horizontal, vertical):
+        # the tiles already made are bounded again
+        if (horizontal, vertical) == (self._horizontal_margin, self._bounds_margin):
+            return
+        self._horizontal_margin = horizontal
+        self._bounds_margin = vertical
+        for key, tile in list(self._active.items()) + list(self._cache.items()):
+            self._set_bounds(key, tile)
+
+    def _get_tile_rect(self, key):
+        face, depth, i, j = key
+        tile_size = self._size / 2 ** depth
+        return i * tile_size - self._size / 2.0, j * tile_size - self._size / 2.0, tile_size
+
+    def _set_bounds(self, key, tile):
+        x, y, tile_size = self._get_tile_rect(key)
+        margin = self._horizontal_margin
+        tile.node().set_bounds(BoundingBox(
+            LPoint3(x - margin, y - margin, -self._bounds_margin - self.skirt),
+            LPoint3(x + tile_size + margin, y + tile_size + margin, self._bounds_margin)))
+
+    @property
+    def active_tiles(self):
+        return len(self._active)
+
+    @property
+    def cached_tiles(self):
+        return len(self._cache)
+
+    def _get_tile(self, key):
+        tile = self._cache.pop(key, None)
+        if tile is None:
+            x, y, tile_size = self._get_tile_rect(key)
+            tile = mesh.create_grid_patch(
+                'water-tile-%d-%d-%d-%d' % key, x, y, tile_size, tile_size, self._segments, self._segments,
+                (self._size, self._size), 'v_down', self.skirt)
+            self._set_bounds(key, tile)
+            tile.node().set_final(True)
+        return tile
+
+    def _collect(self, face, eye, wanted):
+        half = self._size / 2.0
+        stack = [(0, 0, 0)]
+        while stack:
+            depth, i, j = stack.pop()
+            tile_size = self._size / 2 ** depth
+            x0 = i * tile_size - half
+            y0 = j * tile_size - half
+            dx = max(x0 - eye.x, 0.0, eye.x - x0 - tile_size)
+            dy = max(y0 - eye.y, 0.0, eye.y - y0 - tile_size)
+            distance = (dx * dx + dy * dy + eye.z * eye.z) ** 0.5
+            if distance > self.page_radius:
+                # neither this tile nor any of its children are around the camera
+                continue
+            if depth < self._max_depth and distance < self.lod_factor * tile_size:
+                for ci in (2 * i, 2 * i + 1):
+                    for cj in (2 * j, 2 * j + 1):
+                        stack.append((depth + 1, ci, cj))
+            else:
+                wanted.add((face, depth, i, j))
+
+    def update(self, eye_pos):
+        # eye_pos is in the space of the root's parent
+        reference = self.root.get_parent()
+        wanted = set()
+        for index, face in enumerate(self._faces):
+            eye = face.get_relative_point(reference, eye_pos)
+            self._collect(index, eye, wanted)
+            if self._is_cube_sphere:
+                face.set_shader_input('eyePosition', LVector4(eye, 0))
+
+        for key in set(self._active) - wanted:
+            tile = self._active.pop(key)
+            tile.detach_node()
+            self._cache[key] = tile
+        for key in wanted - set(self._active):
+            tile = self._get_tile(key)
+            tile.reparent_to(self._faces[key[0]])
+            self._active[key] = tile
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+class WaterNodeHelper(object):
+    _water_backends = {
+        'gpu': WaterShaderHelper,
+        'cpu': NumpyWaterHelper,
+    }
+
+    def __init__(self, base, width, height, depth, segment_x, segment_y, pos, use_cubemap_only=True, backend='gpu',
+                 clipmap_levels=0, tile_depth=0, cube_sphere=False, reflection_quality='high', texture_size=512,
+                 timestep=1.0 / 60.0, max_substeps=4, ripple_window=0, ripple_cascade=None, wave_atlas=None,
+                 threaded=False):
+        self._texture_size = texture_size
+
+        self.rain = rain.RainEmitter(self._texture_size)
+        self.rain_intensity = 4.0
+        self._last_time = None
+        # anything with record_simulation(water), e.g. a replay.Recorder
+        self.recorder = None
 
         # Vertex texture
-        self.water_shader_hlp = WaterShaderHelper(base, width, height, self._texture_size)
+        water_helper = self._water_backends.get(backend)
+        if water_helper is None:
+            raise RuntimeError("Unknown water simulation backend: %s" % backend)
+        # ripple_window is the span of a window of the simulation following a node, 0 for the whole sea;
+        # ripple_cascade instead are (span, size) of nested windows, see CascadedWaterHelper
+        if wave_atlas is not None:
+            # a baked atlas file played instead of a simulation
+            import atlas
+            water_helper = atlas.AtlasWaterHelper
+            self.water_shader_hlp = atlas.AtlasWaterHelper(base, width, height, wave_atlas, timestep)
+            if abs(self.water_shader_hlp.atlas.span - width) > 1e-3 or width != height:
+                raise RuntimeError("The wave atlas covers %g x %g, not %g x %g" % (
+                    self.water_shader_hlp.atlas.span, self.water_shader_hlp.atlas.span, width, height))
+            self._rain_target = self.water_shader_hlp
+        elif ripple_cascade:
+            if water_helper is not WaterShaderHelper:
+                raise RuntimeError("Only the gpu water backend has cascades")
+            water_helper = CascadedWaterHelper
+            self.water_shader_hlp = CascadedWaterHelper(base, width, height, ripple_cascade)
+            # rain only makes the finest ripples
+            self._rain_target = self.water_shader_hlp.levels[0]
+            self.rain = rain.RainEmitter(self._rain_target._size)
+        else:
+            self.water_shader_hlp = water_helper(base, width, height, self._texture_size, ripple_window)
+            self._rain_target = self.water_shader_hlp
+        # a wave atlas has nothing to rain on or push a wake into
+        self.has_simulation = wave_atlas is None
+        self._window_target = None
+        # the simulation runs at a fixed rate whatever the frame rate, as far as the backend can
+        if water_helper.max_substeps is not None:
+            max_substeps = min(max_substeps, water_helper.max_substeps)
+        self.simulation_clock = ripple.FixedTimestep(timestep, max_substeps)
 
         # Surface
-        self.water_np = create_egg_plane('water', width, height, segment_x, segment_y)
+        self.tiles = None
+        if clipmap_levels:
+            # segment_x cells a side per level, the coarsest level reaching twice the size of the sea,
+            # so it still covers the sea while centred on the camera
+            spacing = 2.0 * max(width, height) / (segment_x * 2 ** (clipmap_levels - 1))
+            self._clipmap_snap = spacing * 2 ** (clipmap_levels - 1)
+            self.water_np = mesh.create_clipmap('water', spacing, segment_x, clipmap_levels, 'v_down')
+            # the mesh is moved in the vertex shader
+            self.water_np.node().set_bounds(OmniBoundingVolume())
+            self.water_np.node().set_final(True)
+        else:
+            self._clipmap_snap = None
+            if tile_depth or cube_sphere:
+                # quadtree of segment_x x segment_x tiles, width is the size of a face
+                self.water_np = NodePath('water')
+                self.tiles = WaterTileManager(self.water_np, width, segment_x, tile_depth, cube_sphere)
+            else:
+                self.water_np = mesh.load_grid_plane('water', width, height, segment_x, segment_y, 'v_down')
         self.water_np.set_pos(0, 0, pos.z)
         self.water_np.reparent_to(base.render)
         self.ocean_shader_hlp = OceanShaderHelper(
-            self.water_np, base, width, height, self._texture_size, use_cubemap_only)
-
-        self.ocean_shader_hlp.set_shader_input('vtftex', self.water_shader_hlp.vertex_tex)
+            self.water_np, base, width, height, self._texture_size, use_cubemap_only, reflection_quality)
+        if self._clipmap_snap is not None:
+            self.ocean_shader_hlp.texture_extent = (width, height)
+        self.ocean_shader_hlp.ripple_heights = self.get_ripple_heights
+        if wave_atlas is not None:
+            # the heights of a baked sea are known, they come straight from the mapped frames
+            self.ocean_shader_hlp.ripple_heights = self.water_shader_hlp.get_heights
+            self.ocean_shader_hlp.height_source = 'analytic'
+        if self.tiles is not None:
+            self.tiles.set_margins(*self.ocean_shader_hlp.displacement_bounds)
+
+        self.water_shader_hlp.bind(self.ocean_shader_hlp)
         self.ocean_shader_hlp.set_eye_pos(LVector3(0, 0, 0))
 
+        # threaded puts the CPU work of a frame on a worker thread: the height snapshots, a spectral
+        # sea and the steps of the cpu backend. What it finishes is shown a frame later.
+        self.worker = None
+        self.worker_times = {}
+        self._publishers = []
+        self._job_times = {}
+        self._pending_dt = 0.0
+        self._threaded_steps = False
+        if threaded:
+            import worker
+            self.worker = worker.Worker('water-worker')
+            self.ocean_shader_hlp.set_worker(self.worker)
+            if isinstance(self.water_shader_hlp, NumpyWaterHelper):
+                self.water_shader_hlp.set_threaded()
+                self._threaded_steps = True
+
         # Faking caustics
-        self.deep_water_np = create_egg_plane('deepwater', width, height, 1, 1)
+        self.deep_water_np = mesh.load_grid_plane('deepwater', width, height, 1, 1, 'v_down')
         self.deep_water_np.set_pos(pos - LVector3(0.0, 0.0, depth))
         self.deep_water_np.reparent_to(base.render)
 
@@ -655,24 +1389,151 @@ class WaterNodeHelper(object):
         LerpTexOffsetInterval(self.deep_water_np, 200, (0.5, 1), (0, 0), textureStage=ts_dp).loop()
 
         if use_cubemap_only:
+            import cubemap
             self.hide()
-            cubemap_file = base.saveCubeMap("tmp/cube_#.jpg", size=256)
-            if cubemap_file is not None:
-                self.ocean_shader_hlp.set_skybox(base.loader.loadCubeMap(cubemap_file))
+            self.ocean_shader_hlp.set_skybox(cubemap.load_cube_map(base, 256))
             self.show()
 
+    @property
+    def is_raining(self):
+        return self.rain.intensity > 0
+
+    @is_raining.setter
+    def is_raining(self, value):
+        self.rain.intensity = self.rain_intensity if value else 0.0
+
+    def record_to(self, recorder):
+        # the drops of the rain, the shader parameters and the settings of the simulation, as they
+        # are now and every change of them, go to a replay.Recorder
+        self._rain_target = recorder.add_target('rain', self._rain_target)
+        recorder.add_ocean(self.ocean_shader_hlp)
+        recorder.add_simulation(self)
+
+    def replay_from(self, player):
+        # the other way round with a replay.Player, the recorded drops stand in for the rain
+        self.rain_intensity = 0.0
+        self.rain.intensity = 0.0
+        player.add_target('rain', self._rain_target)
+        player.add_ocean(self.ocean_shader_hlp)
+        player.add_simulation(self)
+
+    def get_ripple_heights(self, xs, ys):
+        # heights of the ripples shown at xs, ys in the space of water_np, nearest texel of the
+        # simulation texture (of the finest level of a cascade), calm outside of a window
+        helper = self.water_shader_hlp
+        texture = helper.vertex_tex
+        heights = np.zeros(np.broadcast(xs, ys).shape)
+        if not texture.has_ram_image():
+            return heights
+        size = texture.get_x_size()
+        if helper.window is not None:
+            columns, rows = helper.window.get_texture_positions(xs, ys)
+        else:
+            columns, rows = helper.get_texture_positions(xs, ys)
+        columns, rows = np.broadcast_arrays(columns, rows)
+        inside = (columns >= 0) & (columns < size) & (rows >= 0) & (rows < size)
+        image = np.frombuffer(memoryview(texture.get_ram_image()), dtype=np.uint8).reshape(size, size, -1)
+        red = image[size - 1 - rows[inside], columns[inside], 2]
+        heights[inside] = (red / 255.0 - 0.5) * self.ocean_shader_hlp.grid_ratio[3]
+        return heights
+
+    def follow(self, node):
+        # keeps the ripple window centred on node, None leaves it where it is
+        if node is not None and self.water_shader_hlp.window is None:
+            raise RuntimeError("The water has no ripple window to follow a node with")
+        self._window_target = node
+
     def update(self, time):
-        if self.is_raining:
-            if time > self._next_rain_time:
-                x1 = random.randint(self._texture_size / 5, self._texture_size * 4 / 5)
-                y1 = random.randint(self._texture_size / 5, self._texture_size * 4 / 5)
-                v = random.random() * 0.25 + 0.05
-                r = random.randint(0, 3)
-                self.water_shader_hlp.push_water(x1, y1, r, v)
-                self._next_rain_time = time + random.random() * 0.5 + 0.15
-
-        self.ocean_shader_hlp.update(time)
-        self.water_shader_hlp.update()
+        dt = time - self._last_time if self._last_time is not None else 0.0
+        self._last_time = time
+        if self._window_target is not None:
+            pos = self._window_target.get_pos(self.water_np)
+            self.water_shader_hlp.move_window(pos.x, pos.y)
+        with profiler.scope('App:Water:Rain'):
+            if dt > 0 and self.has_simulation:
+                self.rain.rain_on(self._rain_target, dt)
+
+        with profiler.scope('App:Water:Ocean'):
+            self.ocean_shader_hlp.update(time)
+        if self.recorder is not None:
+            # the acceleration and dampening are plain attributes of the helper, changes are picked
+            # up here before the simulation steps with them
+            self.recorder.record_simulation(self)
+        if self._threaded_steps:
+            # steps are only taken when the worker is free to take them, the time adds up meanwhile
+            self._pending_dt += dt
+            steps = 0
+            if not self.worker.is_busy:
+                steps = self.simulation_clock.advance(self._pending_dt)
+                self._pending_dt = 0.0
+        else:
+            steps = self.simulation_clock.advance(dt)
+        profiler.set_level('App:Water:Substeps', steps)
+        profiler.set_level('App:Water:Lag', self.simulation_clock.lag)
+        with profiler.scope('App:Water:PingPong'):
+            self.water_shader_hlp.update(steps)
+        if self.worker is not None:
+            with profiler.scope('App:Water:Handoff'):
+                self._hand_off(time)
+        with profiler.scope('App:Water:Bind'):
+            # the simulation may have swapped its textures or moved
+            self.water_shader_hlp.bind(self.ocean_shader_hlp)
+            self.ocean_shader_hlp.params.flush()
+            if self.tiles is not None:
+                # the waves may have grown or the sea changed
+                self.tiles.set_margins(*self.ocean_shader_hlp.displacement_bounds)
+
+    def _hand_off(self, time):
+        # publishes what the worker has finished and gives it the next job, never waiting for it
+        is_busy = self.worker.is_busy
+        if self.worker.poll():
+            for publish in self._publishers:
+                publish()
+            self._publishers = []
+            self.worker_times = self._job_times
+            for name, seconds in self.worker_times.items():
+                profiler.set_level('App:Water:Worker:%s' % name, seconds * 1000.0)
+            profiler.set_level('App:Water:Worker', self.worker.job_time * 1000.0)
+        if is_busy:
+            return
+
+        jobs = [('Heights', self.ocean_shader_hlp.height_sampler.prepare()),
+                ('Spectrum', self.ocean_shader_hlp.prepare_spectrum(time))]
+        if self._threaded_steps:
+            jobs.append(('Ripples', self.water_shader_hlp.prepare()))
+        jobs = [(name, job) for name, job in jobs if job is not None]
+        if jobs:
+            self._job_times = {}
+            self.worker.submit(self._work, [(name, work) for name, (work, _) in jobs], self._job_times)
+            self._publishers = [publish for _, (_, publish) in jobs if publish is not None]
+
+    @staticmethod
+    def _work(jobs, times):
+        # on the worker thread
+        for name, work in jobs:
+            start = timeit.default_timer()
+            work()
+            times[name] = timeit.default_timer() - start
+
+    def set_eye_pos(self, pos, mc=None):
+        if self._clipmap_snap is not None:
+            # moving by the spacing of the coarsest level keeps every level on its own lattice
+            snap = self._clipmap_snap
+            local = pos - self.water_np.get_pos()
+            offset = (round(local.x / snap) * snap, round(local.y / snap) * snap)
+            if offset != self.ocean_shader_hlp.mesh_offset:
+                self.ocean_shader_hlp.mesh_offset = offset
+        if self.tiles is not None:
+            self.tiles.update(pos)
+        self.ocean_shader_hlp.set_eye_pos(pos, mc)
+
+    def close(self):
+        # lets go of the files the water keeps open, the mapped frames of a wave atlas; once the
+        # worker is done with its last job, the water is not updated after this
+        if self.worker is not None:
+            self.worker.wait()
+        if not self.has_simulation:
+            self.water_shader_hlp.close()
 
     def hide(self):
         self.water_np.hide()
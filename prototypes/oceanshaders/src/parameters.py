@@ -0,0 +1,159 @@
+import contextlib
+
+from panda3d.core import LVector4
+
+
+def _components(value):
+    if hasattr(value, '__len__'):
+        return [float(c) for c in value]
+    return [float(value)]
+
+
+def _lerp(start, end, t):
+    # keeps the type of the value, scalars stay scalars and vectors stay vectors
+    if hasattr(end, '__len__'):
+        mixed = [a + (b - a) * t for a, b in zip(_components(start), _components(end))]
+        return LVector4(*mixed) if isinstance(end, LVector4) else tuple(mixed)
+    return start + (end - start) * t
+
+
+class ParameterBlock(object):
+    # Named shader parameters packed into vec4 inputs. Setting a field only marks the inputs it
+    # is packed into dirty, flush writes each dirty input once to every node.
+
+    def __init__(self, layout, values, nodes):
+        # layout is a sequence of (input name, fields), a field is a parameter name or a constant
+        self._layout = [(name, tuple(fields)) for name, fields in layout]
+        self._inputs_of = {}
+        for name, fields in self._layout:
+            for field in fields:
+                if not isinstance(field, (int, float)):
+                    self._inputs_of.setdefault(field, []).append(name)
+        missing = set(self._inputs_of) - set(values)
+        if missing:
+            raise RuntimeError("No initial value for parameters: %s" % ', '.join(sorted(missing)))
+
+        self._values = dict(values)
+        self._nodes = list(nodes)
+        self._dirty = set(name for name, _ in self._layout)
+        self._transactions = 0
+
+        self._presets = {}
+        self._transition = None
+        # anything with record_parameter(name, value), e.g. a replay.Recorder
+        self.recorder = None
+
+    def __contains__(self, name):
+        return name in self._inputs_of
+
+    @property
+    def names(self):
+        return sorted(self._inputs_of)
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __setitem__(self, name, value):
+        inputs = self._inputs_of.get(name)
+        if inputs is None:
+            raise RuntimeError("Unknown shader parameter: %s" % name)
+        self._values[name] = value
+        self._dirty.update(inputs)
+        if self.recorder is not None:
+            self.recorder.record_parameter(name, value)
+
+    @property
+    def is_dirty(self):
+        return bool(self._dirty)
+
+    @property
+    def in_transition(self):
+        return self._transition is not None
+
+    def update(self, values):
+        for name, value in values.items():
+            self[name] = value
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # changes made in the block are not flushed before it ends and are rolled back on errors
+        values, dirty = dict(self._values), set(self._dirty)
+        self._transactions += 1
+        try:
+            yield self
+        except Exception:
+            if self.recorder is not None:
+                for name, value in values.items():
+                    if self._values[name] is not value:
+                        self.recorder.record_parameter(name, value)
+            self._values, self._dirty = values, dirty
+            raise
+        finally:
+            self._transactions -= 1
+
+    def _pack(self, fields):
+        components = []
+        for field in fields:
+            if isinstance(field, (int, float)):
+                components.append(float(field))
+            else:
+                components.extend(_components(self._values[field]))
+        return LVector4(*components)
+
+    def flush(self):
+        # returns the number of inputs written per node
+        if self._transactions or not self._dirty:
+            return 0
+        written = 0
+        for name, fields in self._layout:
+            if name in self._dirty:
+                value = self._pack(fields)
+                for node in self._nodes:
+                    node.set_shader_input(name, value)
+                written += 1
+        self._dirty.clear()
+        return written
+
+    def add_preset(self, name, values):
+        unknown = [field for field in values if field not in self._inputs_of]
+        if unknown:
+            raise RuntimeError("Unknown shader parameters in preset %s: %s" % (name, ', '.join(sorted(unknown))))
+        self._presets[name] = dict(values)
+
+    def save_preset(self, name, fields=None):
+        fields = self._inputs_of.keys() if fields is None else fields
+        self.add_preset(name, dict((field, self._values[field]) for field in fields))
+
+    def get_preset(self, name):
+        preset = self._presets.get(name)
+        if preset is None:
+            raise RuntimeError("Unknown preset: %s" % name)
+        return preset
+
+    def apply_preset(self, name):
+        self._transition = None
+        self.update(self.get_preset(name))
+
+    def blend_to(self, name, duration, time=None):
+        # moves every parameter of the preset from its current value over duration seconds,
+        # starting at time or else with the next advance
+        target = self.get_preset(name)
+        if duration <= 0:
+            self.apply_preset(name)
+            return
+        start = dict((field, self._values[field]) for field in target)
+        self._transition = (start, target, time, float(duration))
+
+    def advance(self, time):
+        # steps a running transition and flushes, meant to be called once per frame
+        if self._transition is not None:
+            start, target, start_time, duration = self._transition
+            if start_time is None:
+                start_time = time
+                self._transition = (start, target, start_time, duration)
+            t = min(max((time - start_time) / duration, 0.0), 1.0)
+            for field, value in target.items():
+                self[field] = value if t >= 1.0 else _lerp(start[field], value, t)
+            if t >= 1.0:
+                self._transition = None
+        return self.flush()
@@ -0,0 +1,74 @@
+import numpy as np
+
+import ripple
+
+
+class RainEmitter(object):
+    # Rain drops as arrays of impulses in texture space, to be stamped in one go per frame.
+    # The density of the drops follows a coarse random pattern scrolled by the wind, so showers
+    # drift over the sea. Per 1000 drops of radius 0-3 on a 512 texture, emitting takes about
+    # 0.3 ms and stamping about 1.7 ms; blending the impulses into the texture adds about 1.4 ms
+    # for the default rainy area, almost independent of the number of drops (benchmark.py rain).
+
+    def __init__(self, size, intensity=0.0, wind=(0.0, 0.0), seed=None, border=0.2, gustiness=0.5, cells=8):
+        self._size = size
+        # drops per second, over the whole rainy area
+        self.intensity = intensity
+        # texels per second the showers move by, along the x and y axes of the water node
+        self.wind = wind
+        # share of the texture left dry along each edge
+        self.border = border
+        self.gustiness = gustiness
+
+        self.min_value, self.max_value = 0.05, 0.3
+        self.max_radius = 3
+        self.kernel = 'square'
+
+        self._cells = cells
+        self._drift = np.zeros(2)
+        self.reset(seed)
+
+    @property
+    def size(self):
+        return self._size
+
+    def reset(self, seed=None):
+        # the same seed gives the same drops for the same sequence of time steps
+        self._random = np.random.RandomState(seed)
+        self._pattern = ripple.resample(self._random.random_sample((self._cells, self._cells)), self._size)
+        self._drift[:] = 0
+        self.emitted = 0
+
+    def emit(self, dt):
+        # drops of the last dt seconds as (xs, ys, radii, values), ys are image rows from the top
+        self._drift += np.asarray(self.wind, dtype=np.float64) * dt
+        count = self._random.poisson(self.intensity * dt) if self.intensity > 0 and dt > 0 else 0
+        if not count:
+            empty = np.zeros(0, dtype=np.intp)
+            return empty, empty, empty, np.zeros(0, dtype=np.float32)
+
+        size = self._size
+        low = int(size * self.border)
+        high = max(size - low, low + 1)
+        xs = self._random.randint(low, high, count)
+        ys = self._random.randint(low, high, count)
+        if self.gustiness > 0:
+            # thin the drops out where the drifted pattern is low, rows grow towards -y
+            px = (xs - int(self._drift[0])) % size
+            py = (ys + int(self._drift[1])) % size
+            density = 1.0 - self.gustiness + self.gustiness * self._pattern[py, px]
+            kept = self._random.random_sample(count) < density
+            xs, ys = xs[kept], ys[kept]
+            count = xs.size
+
+        radii = self._random.randint(0, self.max_radius + 1, count)
+        values = self._random.uniform(self.min_value, self.max_value, count).astype(np.float32)
+        self.emitted += count
+        return xs, ys, radii, values
+
+    def rain_on(self, water, dt):
+        # water is anything with stamp_water, i.e. the simulation helpers of ocean.py
+        xs, ys, radii, values = self.emit(dt)
+        if xs.size:
+            water.stamp_water(xs, ys, radii, values, self.kernel)
+        return xs.size
@@ -0,0 +1,335 @@
+import gzip
+import json
+import struct
+
+import numpy as np
+from panda3d.core import LMatrix4, LVector4
+
+import spectrum
+
+# A recording is a gzip stream of records after a header: magic, version and a JSON object the
+# recording application describes itself with (sizes, backend, ...). Every record starts with a
+# tag byte. Targets and nodes are named once and referred to by their index from then on.
+_header = struct.Struct('<8sII')
+_magic = b'WATERREC'
+_version = 3
+
+_frame = b'F'      # time, dt: starts a frame, everything up to the next one belongs to it
+_target = b'T'     # index, name: something impulses are stamped on
+_node = b'N'       # index, name: a node whose pose is recorded
+_impulses = b'I'   # target, count, then xs, ys, radii, values and kernels of count impulses
+_parameter = b'P'  # name, kind, count, then count components
+_pose = b'M'       # node, then its 4x4 matrix relative to its parent
+_spectrum = b'S'   # the spectral sea set on the ocean (size 0 for none), then the name of its spectrum
+_simulation = b'W'  # acceleration, dampening, timestep and max steps of the ripple simulation
+
+_frame_struct = struct.Struct('<dd')
+_name_struct = struct.Struct('<BB')
+_impulses_struct = struct.Struct('<BI')
+_parameter_struct = struct.Struct('<BB')
+_pose_struct = struct.Struct('<B16f')
+# size, span, wind speed, fetch, direction, choppiness, period (0 for none), whether it has a seed and the seed
+_spectrum_struct = struct.Struct('<I6dBi')
+_simulation_struct = struct.Struct('<3dI')
+
+kernels = ('square', 'disc', 'gaussian')
+
+# kinds of parameter values, so they come back as what they were set as
+_scalar, _tuple, _vector = range(3)
+
+
+def _pack_name(index, name):
+    name = name.encode('utf-8')
+    return _name_struct.pack(index, len(name)) + name
+
+
+class RecordedTarget(object):
+    # Stands in for a water helper: impulses stamped on it are recorded before they are passed
+    # on, everything else is the helper's.
+
+    def __init__(self, recorder, index, helper):
+        self._recorder = recorder
+        self._index = index
+        self.helper = helper
+
+    def __getattr__(self, name):
+        return getattr(self.helper, name)
+
+    def push_water(self, x1, y1, r, v):
+        self.stamp_water(x1, y1, r, v)
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        self._recorder.record_impulses(self._index, xs, ys, radii, values, kernels)
+        self.helper.stamp_water(xs, ys, radii, values, kernels)
+
+
+class Recorder(object):
+    # Writes what goes into the water frame by frame: the impulses stamped on the targets, the
+    # shader parameters set and the poses of the nodes, all that is needed to play the frames
+    # back the same way whatever the clock and the random numbers did. What is added is recorded
+    # as it is right away, so a recording does not depend on the defaults of the player.
+
+    def __init__(self, filename, info=None):
+        self._file = gzip.open(filename, 'wb', 6)
+        info = json.dumps(info or {}, sort_keys=True).encode('utf-8')
+        self._file.write(_header.pack(_magic, _version, len(info)) + info)
+        self._targets = []
+        self._nodes = []
+        self._derived = set()
+        self._simulation = None
+        self.frames = 0
+
+    def add_target(self, name, helper):
+        # returns what to stamp impulses on instead of helper
+        index = len(self._targets)
+        self._file.write(_target + _pack_name(index, name))
+        target = RecordedTarget(self, index, helper)
+        self._targets.append(target)
+        return target
+
+    def add_node(self, name, node):
+        index = len(self._nodes)
+        self._file.write(_node + _pack_name(index, name))
+        self._nodes.append(node)
+
+    def add_parameters(self, params, derived=()):
+        # a parameters.ParameterBlock, its values now and every value set on it are recorded but
+        # the derived ones, those follow from something recorded otherwise
+        params.recorder = self
+        self._derived.update(derived)
+        for name in params.names:
+            self.record_parameter(name, params[name])
+
+    def add_ocean(self, ocean):
+        # an ocean.OceanShaderHelper, its parameters and the spectral seas set on it
+        self.add_parameters(ocean.params, ocean.derived_parameters)
+        ocean.recorder = self
+        self.record_spectrum(ocean.spectrum)
+
+    def add_simulation(self, water):
+        # an ocean.WaterNodeHelper, the settings of its ripple simulation, see record_simulation
+        water.recorder = self
+        self.record_simulation(water)
+
+    def begin_frame(self, time, dt):
+        self._file.write(_frame + _frame_struct.pack(time, dt))
+        self.frames += 1
+
+    def record_impulses(self, target, xs, ys, radii, values, kernel_names='square'):
+        xs, ys, radii, values, kernel_names = np.broadcast_arrays(
+            np.asarray(xs), np.asarray(ys), np.asarray(radii), np.asarray(values), np.asarray(kernel_names))
+        count = xs.size
+        if not count:
+            return
+        codes = np.zeros(count, dtype=np.uint8)
+        for code, kernel in enumerate(kernels):
+            codes[kernel_names.ravel() == kernel] = code
+        self._file.write(_impulses + _impulses_struct.pack(target, count))
+        for array, dtype in ((xs, '<i4'), (ys, '<i4'), (radii, '<u2'), (values, '<f4')):
+            self._file.write(np.ascontiguousarray(array.ravel(), dtype=dtype).tobytes())
+        self._file.write(codes.tobytes())
+
+    def record_parameter(self, name, value):
+        if name in self._derived:
+            return
+        if isinstance(value, LVector4):
+            kind = _vector
+        elif hasattr(value, '__len__'):
+            kind = _tuple
+        else:
+            kind = _scalar
+        components = [float(c) for c in value] if kind != _scalar else [float(value)]
+        name = name.encode('utf-8')
+        self._file.write(_parameter + _parameter_struct.pack(len(name), kind) + name +
+                         struct.pack('<B%dd' % len(components), len(components), *components))
+
+    def record_spectrum(self, ocean):
+        # a spectrum.SpectralOcean or None, recorded whole whenever it or its sea state changes; a
+        # sea without a seed comes back with other waves
+        if ocean is None:
+            self._file.write(_spectrum + _spectrum_struct.pack(0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0, 0) + b'\0')
+            return
+        state = ocean.sea_state
+        name = ocean.spectrum.encode('utf-8')
+        self._file.write(_spectrum + _spectrum_struct.pack(
+            ocean.size, ocean.span, state.wind_speed, state.fetch, state.direction, ocean.choppiness,
+            ocean.period or 0.0, ocean.seed is not None, ocean.seed or 0) + struct.pack('<B', len(name)) + name)
+
+    def record_simulation(self, water):
+        # the settings of the simulation of an ocean.WaterNodeHelper, written only when they changed
+        helper, clock = water.water_shader_hlp, water.simulation_clock
+        settings = (float(helper.acceleration), float(helper.dampening), clock.timestep, clock.max_steps)
+        if settings != self._simulation:
+            self._simulation = settings
+            self._file.write(_simulation + _simulation_struct.pack(*settings))
+
+    def record_poses(self):
+        # at the end of the frame, once everything that moves the nodes has moved them
+        for index, node in enumerate(self._nodes):
+            mat = node.get_mat()
+            self._file.write(_pose + _pose_struct.pack(index, *[mat[i][j] for i in range(4) for j in range(4)]))
+
+    def close(self):
+        self._file.close()
+
+
+class Player(object):
+    # Reads a recording back a frame at a time. Targets, parameters and nodes are handed to it
+    # under the names they were recorded with; what was recorded for anything it was not given
+    # is skipped.
+
+    def __init__(self, filename):
+        self._file = gzip.open(filename, 'rb')
+        magic, version, length = _header.unpack(self._read(_header.size))
+        if magic != _magic or version != _version:
+            raise RuntimeError("Not a water recording of version %d: %s" % (_version, filename))
+        self.info = json.loads(self._read(length).decode('utf-8'))
+
+        self._targets = {}
+        self._nodes = {}
+        self._params = None
+        self._ocean = None
+        self._water = None
+        # by index in the recording
+        self._target_names = {}
+        self._node_names = {}
+
+        self._poses = []
+        self._is_started = False
+        self._next_frame = None
+        self.frames = 0
+        self.time = None
+        self.dt = 0.0
+
+    @property
+    def is_done(self):
+        return self._is_started and self._next_frame is None
+
+    def add_target(self, name, helper):
+        self._targets[name] = helper
+
+    def add_node(self, name, node):
+        self._nodes[name] = node
+
+    def add_parameters(self, params):
+        self._params = params
+
+    def add_ocean(self, ocean):
+        self.add_parameters(ocean.params)
+        self._ocean = ocean
+
+    def add_simulation(self, water):
+        self._water = water
+
+    def _read(self, size):
+        data = self._file.read(size)
+        if len(data) != size:
+            raise RuntimeError("Water recording is cut short")
+        return data
+
+    def _read_name(self):
+        index, length = _name_struct.unpack(self._read(_name_struct.size))
+        return index, self._read(length).decode('utf-8')
+
+    def _read_until_frame(self):
+        # applies the records up to the start of the next frame and keeps that, None at the end
+        while True:
+            tag = self._file.read(1)
+            if not tag:
+                self._next_frame = None
+                return
+            if tag == _frame:
+                self._next_frame = _frame_struct.unpack(self._read(_frame_struct.size))
+                return
+            if tag == _target:
+                index, name = self._read_name()
+                self._target_names[index] = name
+            elif tag == _node:
+                index, name = self._read_name()
+                self._node_names[index] = name
+            elif tag == _impulses:
+                self._read_impulses()
+            elif tag == _parameter:
+                self._read_parameter()
+            elif tag == _spectrum:
+                self._read_spectrum()
+            elif tag == _simulation:
+                self._read_simulation()
+            elif tag == _pose:
+                values = _pose_struct.unpack(self._read(_pose_struct.size))
+                node = self._nodes.get(self._node_names.get(values[0]))
+                if node is not None:
+                    self._poses.append((node, LMatrix4(*values[1:])))
+            else:
+                raise RuntimeError("Unknown record in water recording: %r" % tag)
+
+    def _read_impulses(self):
+        index, count = _impulses_struct.unpack(self._read(_impulses_struct.size))
+        arrays = [np.frombuffer(self._read(count * np.dtype(dtype).itemsize), dtype=dtype)
+                  for dtype in ('<i4', '<i4', '<u2', '<f4', 'u1')]
+        target = self._targets.get(self._target_names.get(index))
+        if target is not None:
+            xs, ys, radii, values, codes = arrays
+            target.stamp_water(xs.astype(np.intp), ys.astype(np.intp), radii.astype(np.intp),
+                               values.astype(np.float32), np.asarray(kernels)[codes])
+
+    def _read_parameter(self):
+        length, kind = _parameter_struct.unpack(self._read(_parameter_struct.size))
+        name = self._read(length).decode('utf-8')
+        count = struct.unpack('<B', self._read(1))[0]
+        components = struct.unpack('<%dd' % count, self._read(8 * count))
+        if self._params is None:
+            return
+        if kind == _vector:
+            value = LVector4(*components)
+        elif kind == _tuple:
+            value = components
+        else:
+            value = components[0]
+        self._params[name] = value
+
+    def _read_spectrum(self):
+        size, span, wind_speed, fetch, direction, choppiness, period, has_seed, seed = _spectrum_struct.unpack(
+            self._read(_spectrum_struct.size))
+        length = struct.unpack('<B', self._read(1))[0]
+        name = self._read(length).decode('utf-8')
+        if self._ocean is None:
+            return
+        ocean = None
+        if size:
+            ocean = spectrum.SpectralOcean(size, span, wind_speed, fetch, direction, name, choppiness,
+                                           seed if has_seed else None, period or None)
+        self._ocean.set_spectrum(ocean)
+
+    def _read_simulation(self):
+        acceleration, dampening, timestep, max_steps = _simulation_struct.unpack(self._read(_simulation_struct.size))
+        if self._water is None:
+            return
+        helper = self._water.water_shader_hlp
+        helper.acceleration = acceleration
+        helper.dampening = dampening
+        self._water.simulation_clock.timestep = timestep
+        self._water.simulation_clock.max_steps = max_steps
+
+    def next_frame(self):
+        # Starts the next frame: its impulses are stamped and its parameters set right away, the
+        # poses wait for apply_poses. Returns (time, dt) of the frame, None after the last one.
+        if not self._is_started:
+            # what was recorded before the first frame, for the targets given by now
+            self._is_started = True
+            self._read_until_frame()
+        if self._next_frame is None:
+            return None
+        self.time, self.dt = self._next_frame
+        self._poses = []
+        self._read_until_frame()
+        self.frames += 1
+        return self.time, self.dt
+
+    def apply_poses(self):
+        # at the end of the frame, where they were recorded
+        for node, mat in self._poses:
+            node.set_mat(mat)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,419 @@
+import numpy as np
+
+
+def resample(image, size):
+    # bilinear resampling on texel centres, the way a linearly filtered texture is sampled
+    image = np.asarray(image, dtype=np.float32)
+    if image.shape == (size, size):
+        return image.copy()
+    rows, cols = image.shape
+    fy = np.clip((np.arange(size, dtype=np.float32) + 0.5) / size * rows - 0.5, 0, rows - 1)
+    fx = np.clip((np.arange(size, dtype=np.float32) + 0.5) / size * cols - 0.5, 0, cols - 1)
+    y0 = np.minimum(fy.astype(np.intp), max(rows - 2, 0))
+    x0 = np.minimum(fx.astype(np.intp), max(cols - 2, 0))
+    y1 = np.minimum(y0 + 1, rows - 1)
+    x1 = np.minimum(x0 + 1, cols - 1)
+    ty = (fy - y0)[:, None]
+    tx = (fx - x0)[None, :]
+    bottom = image[y0][:, x0] * (1 - tx) + image[y0][:, x1] * tx
+    top = image[y1][:, x0] * (1 - tx) + image[y1][:, x1] * tx
+    return (bottom * (1 - ty) + top * ty).astype(np.float32)
+
+
+def _kernel_weights(kernel, dx, dy, r):
+    if kernel == 'square':
+        return np.ones(dx.shape, dtype=np.float32)
+    distance_squared = (dx * dx + dy * dy).astype(np.float32)
+    if kernel == 'disc':
+        return (distance_squared <= (r + 0.5) ** 2).astype(np.float32)
+    if kernel == 'gaussian':
+        sigma = max(r / 2.0, 0.5)
+        return np.exp(distance_squared / (-2.0 * sigma * sigma))
+    raise RuntimeError("Unknown impulse kernel: %s" % kernel)
+
+
+class ImpulseBuffer(object):
+    def __init__(self, size):
+        self._size = size
+        # weighted sum of the stamped values and the sum of the weights
+        self._values = np.zeros((size, size), dtype=np.float32)
+        self._weights = np.zeros((size, size), dtype=np.float32)
+        self._box = None
+
+    @property
+    def is_empty(self):
+        return self._box is None
+
+    @property
+    def box(self):
+        # (x0, y0, x1, y1) of the stamped region, None if there is nothing to apply
+        return None if self._box is None else tuple(self._box)
+
+    def stamp(self, xs, ys, radii, values, kernels='square'):
+        xs, ys, radii, values, kernels = np.broadcast_arrays(
+            np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp), np.asarray(radii, dtype=np.intp),
+            np.asarray(values, dtype=np.float32), np.asarray(kernels))
+        xs, ys, radii, values, kernels = [a.ravel() for a in (xs, ys, radii, values, kernels)]
+
+        size = self._size
+        # footprints are built per kernel and radius, then accumulated in a single pass
+        columns, rows, footprint_weights, footprint_values = [], [], [], []
+        for kernel in np.unique(kernels):
+            of_kernel = kernels == kernel
+            for r in np.unique(radii[of_kernel]):
+                selected = of_kernel & (radii == r)
+                r = int(r)
+                dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+                weights = _kernel_weights(kernel, dx, dy, r).ravel()
+                dx, dy = dx.ravel(), dy.ravel()
+
+                px = xs[selected, None] + dx
+                py = ys[selected, None] + dy
+                inside = (px >= 0) & (px < size) & (py >= 0) & (py < size) & (weights > 0)
+                if not inside.any():
+                    continue
+                columns.append(px[inside])
+                rows.append(py[inside])
+                footprint_weights.append(np.broadcast_to(weights, px.shape)[inside])
+                footprint_values.append(np.broadcast_to(values[selected, None], px.shape)[inside])
+        if not columns:
+            return
+
+        px, py = np.concatenate(columns), np.concatenate(rows)
+        w = np.concatenate(footprint_weights)
+        v = np.concatenate(footprint_values)
+        # accumulate over the bounding box of the impulses only
+        x0, y0, x1, y1 = px.min(), py.min(), px.max() + 1, py.max() + 1
+        shape = (y1 - y0, x1 - x0)
+        indices = (py - y0) * shape[1] + (px - x0)
+        count = shape[0] * shape[1]
+        self._weights[y0:y1, x0:x1] += np.bincount(indices, w, count).reshape(shape)
+        self._values[y0:y1, x0:x1] += np.bincount(indices, w * v, count).reshape(shape)
+        self._grow_box(x0, y0, x1, y1)
+
+    def _grow_box(self, x0, y0, x1, y1):
+        if self._box is None:
+            self._box = [x0, y0, x1, y1]
+        else:
+            box = self._box
+            self._box = [min(box[0], x0), min(box[1], y0), max(box[2], x1), max(box[3], y1)]
+
+    def apply(self, target, scale=1.0, offset=0.0):
+        # blends the mean stamped value (in texture units) into target, then clears the buffer
+        if self._box is None:
+            return
+        x0, y0, x1, y1 = self._box
+        weights = self._weights[y0:y1, x0:x1]
+        values = self._values[y0:y1, x0:x1]
+        region = target[y0:y1, x0:x1]
+
+        covered = weights > 0
+        mean = values[covered] / weights[covered] * scale + offset
+        coverage = np.minimum(weights[covered], 1.0)
+        blended = region[covered]
+        blended = blended + (mean - blended) * coverage
+        if np.issubdtype(region.dtype, np.integer):
+            limits = np.iinfo(region.dtype)
+            blended = np.clip(np.rint(blended), limits.min, limits.max)
+        region[covered] = blended
+
+        self.clear()
+
+    def discard(self, columns=(), rows=()):
+        # drops what was stamped into the given (start, stop) ranges of columns and rows
+        if self._box is None:
+            return
+        for start, stop in columns:
+            self._weights[:, start:stop] = 0
+            self._values[:, start:stop] = 0
+        for start, stop in rows:
+            self._weights[start:stop] = 0
+            self._values[start:stop] = 0
+
+    def clear(self):
+        if self._box is not None:
+            x0, y0, x1, y1 = self._box
+            self._weights[y0:y1, x0:x1] = 0
+            self._values[y0:y1, x0:x1] = 0
+            self._box = None
+
+
+class RippleSimulation(object):
+    # constants of shaders/water.fs
+    position_weighting = (1.99, 0.99)
+    half_dt_squared = 0.01
+
+    def __init__(self, size, acceleration=30, dampening=0.99, dampening_mask=None):
+        self._size = size
+        self._acceleration = acceleration
+        self._dampening = dampening
+
+        # heights are kept in [-1, 1] with a one cell wide zero border, that is what
+        # the shader reads when a neighbour falls outside of the texture
+        shape = (size + 2, size + 2)
+        self._current = np.zeros(shape, dtype=np.float32)
+        self._previous = np.zeros(shape, dtype=np.float32)
+        self._next = np.zeros(shape, dtype=np.float32)
+        self._source = np.zeros(shape, dtype=np.float32)
+        self.impulses = ImpulseBuffer(size)
+
+        self._gradients = np.zeros((2, size, size), dtype=np.float32)
+        self._scratch = np.empty((size, size), dtype=np.float32)
+
+        self._mask = None
+        self._acceleration_field = None
+        self._dampening_field = None
+        self.dampening_mask = dampening_mask
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def acceleration(self):
+        return self._acceleration
+
+    @property
+    def dampening(self):
+        return self._dampening
+
+    @property
+    def dampening_mask(self):
+        return self._mask
+
+    @property
+    def heights(self):
+        return self._current[1:-1, 1:-1]
+
+    @property
+    def gradients(self):
+        return self._gradients
+
+    @acceleration.setter
+    def acceleration(self, value):
+        self._acceleration = value
+        self._update_fields()
+
+    @dampening.setter
+    def dampening(self, value):
+        self._dampening = value
+        self._update_fields()
+
+    @dampening_mask.setter
+    def dampening_mask(self, value):
+        if value is None:
+            self._mask = np.ones((self._size, self._size), dtype=np.float32)
+        else:
+            self._mask = resample(value, self._size)
+        self._update_fields()
+
+    def _update_fields(self):
+        # everything that only depends on the parameters is folded into two fields
+        self._acceleration_field = self._mask * (self._acceleration * self.half_dt_squared)
+        self._dampening_field = np.clip(self._mask + 0.5, 0.0, 1.0) * self._dampening
+
+    def reset(self):
+        self._current.fill(0)
+        self._previous.fill(0)
+        self._gradients.fill(0)
+        self.impulses.clear()
+
+    def push(self, x1, y1, r, v):
+        self.impulses.stamp(x1, y1, r, v)
+
+    def stamp(self, xs, ys, radii, values, kernels='square'):
+        self.impulses.stamp(xs, ys, radii, values, kernels)
+
+    def step(self):
+        # impulses only land in the input of the step, the history stays untouched
+        if self.impulses.is_empty:
+            source = self._current
+        else:
+            source = self._source
+            np.copyto(source, self._current)
+            # values are texture units, heights are kept in [-1, 1]
+            self.impulses.apply(source[1:-1, 1:-1], 2.0, -1.0)
+        height = source[1:-1, 1:-1]
+        new_height = self._next[1:-1, 1:-1]
+        laplacian = self._scratch
+        w0, w1 = self.position_weighting
+
+        np.add(source[1:-1, :-2], source[1:-1, 2:], out=laplacian)
+        laplacian += source[:-2, 1:-1]
+        laplacian += source[2:, 1:-1]
+        # new_height doubles as scratch space until the integration below
+        np.multiply(height, 4.0, out=new_height)
+        laplacian -= new_height
+        laplacian *= self._acceleration_field
+
+        # Verlet integration
+        np.multiply(self._previous[1:-1, 1:-1], -w1, out=new_height)
+        new_height += laplacian
+        np.multiply(height, w0, out=laplacian)
+        new_height += laplacian
+        new_height *= self._dampening_field
+        np.clip(new_height, -1.0, 1.0, out=new_height)
+
+        np.subtract(source[1:-1, 2:], height, out=self._gradients[0])
+        np.subtract(source[2:, 1:-1], height, out=self._gradients[1])
+
+        self._previous, self._current, self._next = self._current, self._next, self._previous
+
+    def encode(self, image):
+        # image is a (size, size, 4) uint8 BGRA array, channels as written by water.fs
+        scratch = self._scratch
+        np.multiply(self.heights, 127.5, out=scratch)
+        scratch += 128.0  # 127.5 plus 0.5 for rounding
+        np.minimum(scratch, 255, out=scratch)
+        image[..., 2] = scratch
+        for channel, gradient in zip((1, 0), self._gradients):
+            # (dh / 4 + 0.5) scaled to a byte
+            np.multiply(gradient, 63.75, out=scratch)
+            scratch += 128.0
+            np.clip(scratch, 0, 255, out=scratch)
+            image[..., channel] = scratch
+        image[..., 3] = 255
+        return image
+
+
+class FixedTimestep(object):
+    # Turns frame times into whole simulation steps of timestep seconds, the rest is carried over
+    # to the next frame. More than max_steps in a frame are dropped rather than caught up on.
+
+    def __init__(self, timestep=1.0 / 60.0, max_steps=4):
+        self.timestep = timestep
+        self.max_steps = max_steps
+        self._lag = 0.0
+        self._steps = 0
+        self.total_steps = 0
+        self.dropped_time = 0.0
+
+    @property
+    def lag(self):
+        # simulation time owed, less than a timestep
+        return self._lag
+
+    @property
+    def steps(self):
+        # steps of the last frame
+        return self._steps
+
+    @property
+    def alpha(self):
+        # how far the frame is between the last two steps
+        return self._lag / self.timestep
+
+    def reset(self):
+        self._lag = 0.0
+        self._steps = 0
+
+    def advance(self, dt):
+        self._lag += max(dt, 0.0)
+        # a tiny tolerance keeps accumulated rounding from losing a step
+        steps = int(self._lag / self.timestep + 1e-6)
+        self._lag = max(self._lag - steps * self.timestep, 0.0)
+        if self.max_steps is not None and steps > self.max_steps:
+            # whole steps over the limit are lost, only the fraction is carried over
+            self.dropped_time += (steps - self.max_steps) * self.timestep
+            steps = self.max_steps
+        self._steps = steps
+        self.total_steps += steps
+        return steps
+
+
+def _wrapped_ranges(start, stop, size):
+    # (start, stop) ranges of the indices start to stop modulo size, split where they wrap
+    if stop - start >= size:
+        return [(0, size)]
+    start, stop = start % size, stop % size
+    if start < stop:
+        return [(start, stop)]
+    return [(start, size)] + ([(0, stop)] if stop else [])
+
+
+class ScrollingWindow(object):
+    # A size x size texel window of span world units that is moved around a larger sea. Texels are
+    # addressed toroidally, world texel (i, j) lives at (i % size, j % size) of the texture, so
+    # moving the window leaves everything in place and only the strips scrolled in have to be cleared.
+    # Texture positions are in PNMImage coordinates like those of get_texture_pos.
+
+    def __init__(self, size, span):
+        self._size = size
+        self.span = float(span)
+        self.texel = self.span / size
+        # world texel of the lower left corner
+        self._origin = (-(size // 2), -(size // 2))
+
+    @property
+    def origin(self):
+        return self._origin
+
+    @property
+    def corner(self):
+        # world position of the lower left corner
+        return self._origin[0] * self.texel, self._origin[1] * self.texel
+
+    @property
+    def offset(self):
+        # what to add to a texture coordinate to get the window's own, 0 to 1 from its lower left corner
+        size = self._size
+        return (-self._origin[0] % size) / float(size), (self._origin[1] % size) / float(size)
+
+    def contains(self, xs, ys):
+        x0, y0 = self._origin
+        i = np.floor(np.asarray(xs) / self.texel)
+        j = np.floor(np.asarray(ys) / self.texel)
+        return (i >= x0) & (i < x0 + self._size) & (j >= y0) & (j < y0 + self._size)
+
+    def get_texture_positions(self, xs, ys):
+        # points outside of the window are sent far outside of the texture, stamps drop them
+        i = np.floor(np.asarray(xs) / self.texel).astype(np.intp)
+        j = np.floor(np.asarray(ys) / self.texel).astype(np.intp)
+        outside = ~self.contains(xs, ys)
+        return np.where(outside, -4 * self._size, i % self._size), np.where(outside, -4 * self._size, j % self._size)
+
+    def get_ram_indices(self, i, j):
+        # (rows, columns) of the RAM image, bottom row first, of world texels i, j
+        return (-1 - np.asarray(j)) % self._size, np.asarray(i) % self._size
+
+    def get_ring(self):
+        # world texels (i, j) along the edge of the window, each once
+        x0, y0 = self._origin
+        last = self._size - 1
+        steps = np.arange(last)
+        i = np.concatenate((x0 + steps, np.full(last, x0 + last), x0 + last - steps, np.full(last, x0)))
+        j = np.concatenate((np.full(last, y0), y0 + steps, np.full(last, y0 + last), y0 + last - steps))
+        return i, j
+
+    def sample(self, channel, xs, ys):
+        # bilinear sample of a (size, size) channel of the RAM image at world positions
+        fx = np.asarray(xs, dtype=np.float64) / self.texel - 0.5
+        fy = np.asarray(ys, dtype=np.float64) / self.texel - 0.5
+        i0, j0 = np.floor(fx).astype(np.intp), np.floor(fy).astype(np.intp)
+        tx, ty = fx - i0, fy - j0
+        rows0, columns0 = self.get_ram_indices(i0, j0)
+        rows1, columns1 = self.get_ram_indices(i0 + 1, j0 + 1)
+        bottom = channel[rows0, columns0] * (1 - tx) + channel[rows0, columns1] * tx
+        top = channel[rows1, columns0] * (1 - tx) + channel[rows1, columns1] * tx
+        return bottom * (1 - ty) + top * ty
+
+    def move_to(self, x, y):
+        # Centres the window on x, y, returns the (start, stop) ranges of texture columns and rows
+        # (rows of the RAM image, bottom first) scrolled in, empty if it stayed where it was.
+        size = self._size
+        x0, y0 = self._origin
+        x1 = int(np.floor(x / self.texel)) - size // 2
+        y1 = int(np.floor(y / self.texel)) - size // 2
+        self._origin = (x1, y1)
+
+        columns, rows = [], []
+        if x1 > x0:
+            columns = _wrapped_ranges(x0 + size, x1 + size, size)
+        elif x1 < x0:
+            columns = _wrapped_ranges(x1, x0, size)
+        # world row j is RAM row size - 1 - j % size, so the ranges run the other way round
+        if y1 > y0:
+            rows = _wrapped_ranges(-y1, -y0, size)
+        elif y1 < y0:
+            rows = _wrapped_ranges(-y0, -y1, size)
+        return columns, rows
@@ -0,0 +1,69 @@
+from panda3d.core import Shader
+
+
+class ShaderRegistry(object):
+    # Shaders by name, loaded on first use and kept for every later one.
+
+    def __init__(self):
+        self._sources = {}
+        self._shaders = {}
+        # only needed once prewarm loads shaders on another thread
+        self._lock = None
+
+    def register(self, name, vertex, fragment, language=Shader.SL_GLSL):
+        # only remembers the files, nothing is read before the shader is needed
+        self._sources[name] = (language, vertex, fragment)
+
+    @property
+    def names(self):
+        return sorted(self._sources)
+
+    def is_loaded(self, name):
+        return name in self._shaders
+
+    def get(self, name):
+        shader = self._shaders.get(name)
+        if shader is not None:
+            return shader
+        source = self._sources.get(name)
+        if source is None:
+            raise RuntimeError("Unknown shader: %s" % name)
+        if self._lock is None:
+            return self._load(name, source)
+        with self._lock:
+            shader = self._shaders.get(name)
+            if shader is None:
+                shader = self._load(name, source)
+        return shader
+
+    def _load(self, name, source):
+        language, vertex, fragment = source
+        shader = Shader.load(language, vertex=vertex, fragment=fragment)
+        if shader is None:
+            raise RuntimeError("Could not load shader %s from %s and %s" % (name, vertex, fragment))
+        self._shaders[name] = shader
+        return shader
+
+    def prewarm(self, names=None, gsg=None):
+        # Loads the shaders on a background thread while the rest of the startup goes on. Given a
+        # GraphicsStateGuardian, they are queued to be compiled with the next rendered frame too.
+        # Returns the thread, join it to wait.
+        import threading
+
+        names = self.names if names is None else list(names)
+        if self._lock is None:
+            self._lock = threading.Lock()
+
+        def load():
+            for name in names:
+                shader = self.get(name)
+                if gsg is not None:
+                    shader.prepare(gsg.get_prepared_objects())
+
+        thread = threading.Thread(target=load, name='shader-prewarm')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+registry = ShaderRegistry()
@@ -28,6 +28,10 @@ in vec2 p3d_MultiTexCoord4;
 uniform mat4 p3d_ModelViewProjectionMatrix;
 
 uniform sampler2D vtftex;
+uniform sampler2D vtftex1;
+uniform sampler2D vtftex2;
+uniform sampler2D spectrumtex; // xyz: displacement of a tile of a spectral sea
+uniform sampler2D spectrumnormals;
 
 uniform float time;
 uniform vec4 waveInfo;
@@ -35,6 +39,12 @@ uniform vec4 param2;
 uniform vec4 speed;
 uniform vec4 eyePosition;
 uniform vec4 gridRatio;
+uniform vec4 surfaceFrame; // xy: offset of the mesh, zw: extent the texture coordinates span (0 to use the vertex's)
+uniform vec4 rippleWindow; // xy: lower left corner of a scrolling simulation window, z: its span (0 without one)
+uniform vec4 rippleCascade1; // coarser levels of the window like rippleWindow, w: their texel size over vtftex's
+uniform vec4 rippleCascade2;
+uniform vec4 spectrumFrame; // x: span of the spectral tile (0 for the geometric waves), y: range of the heights (0: from waveInfo)
+                            // z: 0 turns the geometric waves off (a baked atlas plays instead)
 
 // Output to fragment shader
 out vec4 texcoord0;
@@ -46,6 +56,20 @@ out vec4 bumpCoord01;
 out vec4 bumpCoord23;
 out float z;
 
+// how much of a simulation window shows at position, fading in over fade of its span from the edge
+float windowWeight(vec4 window, vec2 position, float fade) {
+    vec2 windowCoord = (position - window.xy) / window.z;
+    vec2 edge = min(windowCoord, 1.0 - windowCoord);
+    float inside = min(edge.x, edge.y);
+    return fade > 0.0 ? clamp(inside / fade, 0.0, 1.0) : float(inside >= 0.0);
+}
+
+// the window wraps around in the texture, slopes are scaled to texels of vtftex
+vec4 windowSample(sampler2D level, vec4 window, vec2 position, float slopeScale) {
+    vec4 texel = texture(level, vec2(position.x, -position.y) / window.z);
+    return vec4(texel.x, (texel.yz - 0.5) * slopeScale + 0.5, texel.w);
+}
+
 void main() {
     #define NWAVES 2
 	Wave wave[NWAVES] = Wave[NWAVES](
@@ -61,10 +85,35 @@ void main() {
 	wave[1].dir = speed.zw;
 
     vec4 position = p3d_Vertex;
+    position.xy += surfaceFrame.xy;
+
+    // a mesh following the camera takes its texture coordinates from where it is
+    vec2 vtfCoord = p3d_MultiTexCoord4;
+    vec2 surfaceCoord = p3d_MultiTexCoord1;
+    if (surfaceFrame.z > 0.0) {
+        vtfCoord = vec2(position.x / surfaceFrame.z + 0.5, 0.5 - position.y / surfaceFrame.w);
+        surfaceCoord = vtfCoord;
+    }
 
     // applying texture deformation
-    vec4 simulationSample = texture(vtftex, p3d_MultiTexCoord4);
-	position.z = (simulationSample.x - 0.5) * gridRatio.w;
+    vec4 simulationSample = vec4(0.5);
+    if (rippleWindow.z > 0.0) {
+        // calm outside of the windows, a level of a cascade fades into the coarser one under it
+        if (rippleCascade2.z > 0.0) {
+            simulationSample = mix(simulationSample, windowSample(vtftex2, rippleCascade2, position.xy, rippleCascade2.w),
+                                   windowWeight(rippleCascade2, position.xy, 0.0));
+        }
+        if (rippleCascade1.z > 0.0) {
+            simulationSample = mix(simulationSample, windowSample(vtftex1, rippleCascade1, position.xy, rippleCascade1.w),
+                                   windowWeight(rippleCascade1, position.xy, rippleCascade2.z > 0.0 ? 0.1 : 0.0));
+        }
+        simulationSample = mix(simulationSample, windowSample(vtftex, rippleWindow, position.xy, 1.0),
+                               windowWeight(rippleWindow, position.xy, rippleCascade1.z > 0.0 ? 0.1 : 0.0));
+    } else {
+        simulationSample = texture(vtftex, vtfCoord);
+    }
+	// on top of the vertex's own height, the skirts of paged tiles hang below the surface
+	position.z += (simulationSample.x - 0.5) * gridRatio.w;
     vec3 dzdx = vec3(gridRatio.x, 0.0,  (simulationSample.y - 0.5) * 4.0 * gridRatio.z);
     vec3 dzdy = vec3(0.0, gridRatio.y, (simulationSample.z - 0.5) * 4.0 * gridRatio.z);
     vec3 dd = normalize(cross(dzdx, dzdy));
@@ -77,7 +126,18 @@ void main() {
 	float angle, sin_a, cos_a, qi, wa;
 	float ci, ki;
 
-    for(int i = 0; i < NWAVES; i++)
+    // a tile of the spectral sea takes the place of the geometric waves
+    int waveCount = spectrumFrame.z > 0.0 ? NWAVES : 0;
+    if (spectrumFrame.x > 0.0) {
+        vec2 tileCoord = position.xy / spectrumFrame.x;
+        displacement = texture(spectrumtex, tileCoord).xyz;
+        // the normal as slopes of the heights
+        vec3 tileNormal = texture(spectrumnormals, tileCoord).xyz * 2.0 - 1.0;
+        dd += vec3(tileNormal.xy / max(tileNormal.z, 0.05), 0.0);
+        waveCount = 0;
+    }
+
+    for(int i = 0; i < waveCount; i++)
 	{
 	    dir = normalize(wave[i].dir);
 	    angle = dot(dir, position.xy) * wave[i].freq + time * wave[i].phase * length(wave[i].dir);
@@ -100,7 +160,8 @@ void main() {
 	}
 	
 	position.xyz += displacement;
-	z = position.z / (2.0 * 1.75 * waveInfo.y + 0.2) + 0.5;
+	float heightRange = spectrumFrame.y > 0.0 ? spectrumFrame.y : 2.0 * 1.75 * waveInfo.y + 0.2;
+	z = position.z / heightRange + 0.5;
 
 	float BumpScale = waveInfo.z;
 	binormal.xyz = BumpScale * normalize(vec3(cc.x, cc.z, -dd.y)); // Binormal
@@ -111,10 +172,10 @@ void main() {
 	vec2 textureScale = param2.zw;
 
 	// calculate texture coordinates for normal map lookup
-	bumpCoord01.xy = p3d_MultiTexCoord1.xy * textureScale + time * bumpSpeed;
-	bumpCoord01.zw = p3d_MultiTexCoord1.xy * textureScale * 2.0 + time * bumpSpeed * 4.0;
-	bumpCoord23.xy = p3d_MultiTexCoord1.xy * textureScale * 4.0 + time * bumpSpeed * 8.0;
-	bumpCoord23.zw = p3d_MultiTexCoord1.xy;
+	bumpCoord01.xy = surfaceCoord * textureScale + time * bumpSpeed;
+	bumpCoord01.zw = surfaceCoord * textureScale * 2.0 + time * bumpSpeed * 4.0;
+	bumpCoord23.xy = surfaceCoord * textureScale * 4.0 + time * bumpSpeed * 8.0;
+	bumpCoord23.zw = surfaceCoord;
 
 	// transform vertex position by combined view projection matrix
     gl_Position = p3d_ModelViewProjectionMatrix * position;
@@ -5,6 +5,7 @@ uniform sampler2D p3d_Texture1;
 uniform sampler2D p3d_Texture2;
 
 uniform vec4 param1;
+uniform vec4 window; // xy: offset from the texture coordinates to those of a scrolling window
 
 in vec2 texcoord0;
 
@@ -24,11 +25,13 @@ void main() {
   vec2 psSimulationTexCoordDelta_x1y2 = vec2(0, vy);
   float height_x1y1, height_x0y1, height_x2y1, height_x1y0, height_x1y2;
   vec2 x;
+  // neighbours across the edge of the window are outside even if the texture wraps around there
+  vec2 local = fract(texcoord0 + window.xy);
   height_x1y1 = texture(p3d_Texture0, texcoord0).x;
   height_x1y1 = (height_x1y1 -0.5) * 2;
 
   x = texcoord0 + psSimulationTexCoordDelta_x0y1;
-  if (inrange(x)) {
+  if (inrange(local + psSimulationTexCoordDelta_x0y1)) {
     height_x0y1 = texture(p3d_Texture0, x).x;
 	height_x0y1 = (height_x0y1 -0.5) * 2;
   } else {
@@ -36,7 +39,7 @@ void main() {
   }
 
   x = texcoord0 + psSimulationTexCoordDelta_x2y1;
-  if (inrange(x)) {
+  if (inrange(local + psSimulationTexCoordDelta_x2y1)) {
 	height_x2y1 = texture(p3d_Texture0, x).x;
 	height_x2y1 = (height_x2y1 -0.5) * 2;
   } else {
@@ -44,7 +47,7 @@ void main() {
   }
 
   x = texcoord0 + psSimulationTexCoordDelta_x1y0;
-  if (inrange(x)) {
+  if (inrange(local + psSimulationTexCoordDelta_x1y0)) {
 	height_x1y0 = texture(p3d_Texture0, x).x;
 	height_x1y0 = (height_x1y0 -0.5) * 2;
   } else {
@@ -52,7 +55,7 @@ void main() {
   }
 
   x = texcoord0 + psSimulationTexCoordDelta_x1y2;
-  if (inrange(x)) {
+  if (inrange(local + psSimulationTexCoordDelta_x1y2)) {
 	height_x1y2 = texture(p3d_Texture0, x).x;
 	height_x1y2 = (height_x1y2 -0.5) * 2;
   } else {
@@ -61,7 +64,7 @@ void main() {
 
   float previousHeight = texture(p3d_Texture1, texcoord0).x;
   previousHeight = (previousHeight -0.5) * 2;
-  float damp = texture(p3d_Texture2, texcoord0).x;
+  float damp = texture(p3d_Texture2, local).x;
   float psSimulationWaveSpeedSquared = param1.z; //30;
   float acceleration = damp * psSimulationWaveSpeedSquared * (height_x0y1 + height_x2y1 + height_x1y0 + height_x1y2 - 4.0 * height_x1y1);
 
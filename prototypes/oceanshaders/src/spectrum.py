@@ -0,0 +1,218 @@
+import collections
+
+import numpy as np
+
+gravity = 9.81
+
+
+def phillips(k, cos_angle, wind_speed, fetch, amplitude=0.0081 / 2.0):
+    # Phillips spectrum of a fully developed sea, fetch does not play a part
+    length = wind_speed * wind_speed / gravity
+    small = length / 1000.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spectrum = amplitude * np.exp(-1.0 / (k * length) ** 2) / k ** 4 * cos_angle ** 2
+    # waves much shorter than the grid only alias
+    return np.where(k > 0, spectrum * np.exp(-(k * small) ** 2), 0.0)
+
+
+def jonswap(k, cos_angle, wind_speed, fetch, gamma=3.3):
+    # JONSWAP spectrum of a sea still growing over fetch metres, turned into a wavenumber
+    # spectrum with cos^2 spreading around the wind
+    dimensionless_fetch = gravity * fetch / (wind_speed * wind_speed)
+    alpha = 0.076 * dimensionless_fetch ** -0.22
+    peak = 22.0 * (gravity * gravity / (wind_speed * fetch)) ** (1.0 / 3.0)
+    omega = np.sqrt(gravity * k)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        sigma = np.where(omega <= peak, 0.07, 0.09)
+        r = np.exp(-(omega - peak) ** 2 / (2.0 * sigma * sigma * peak * peak))
+        frequency_spectrum = alpha * gravity * gravity / omega ** 5 * np.exp(-1.25 * (peak / omega) ** 4) * gamma ** r
+        # S(k) dk dtheta = S(omega) domega dtheta, over k for the polar to cartesian change
+        spreading = np.where(cos_angle > 0, 2.0 / np.pi * cos_angle ** 2, 0.0)
+        spectrum = frequency_spectrum * (gravity / (2.0 * omega)) / k * spreading
+    return np.where(k > 0, spectrum, 0.0)
+
+
+SeaState = collections.namedtuple('SeaState', ('wind_speed', 'fetch', 'direction'))
+
+
+class SpectralOcean(object):
+    # A tile of span metres of a sea made of the waves of a spectrum, after Tessendorf. The
+    # amplitudes of a sea state are drawn once and cached, a frame is a phase update and one
+    # inverse FFT of all fields. The tile wraps around, so it repeats without seams.
+    spectra = {'phillips': phillips, 'jonswap': jonswap}
+    cache_size = 8
+
+    # shared by every ocean, keyed by the sea state and the grid
+    _cache = collections.OrderedDict()
+
+    def __init__(self, size=256, span=256.0, wind_speed=10.0, fetch=100000.0, direction=0.0, spectrum='jonswap',
+                 choppiness=1.0, seed=1, period=None):
+        if spectrum not in self.spectra:
+            raise RuntimeError("Unknown wave spectrum: %s" % spectrum)
+        self._size = size
+        self.span = float(span)
+        self.spectrum = spectrum
+        self.choppiness = choppiness
+        self.seed = seed
+        # with a period the sea repeats itself after that many seconds
+        self.period = period
+
+        frequencies = np.fft.fftfreq(size, 1.0 / size) * (2.0 * np.pi / self.span)
+        self._kx, self._ky = np.meshgrid(frequencies, frequencies)
+        self._k = np.hypot(self._kx, self._ky)
+        # index of -k for every k
+        self._negative = (-np.arange(size)) % size
+        # what takes the heights to the spectra of the transform, two real fields packed in each:
+        # heights + i slope x, displacement x + i displacement y and slope y
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kx, ky = self._kx / self._k, self._ky / self._k
+        self._transfer = np.nan_to_num(np.stack((
+            1.0 - self._kx, ky - 1j * kx, 1j * self._ky))).astype(np.complex64)
+        self._spectra = np.empty((3, size, size), dtype=np.complex64)
+
+        # heights, displacement along x and y and slopes along x and y of the last update
+        self.heights = np.zeros((size, size), dtype=np.float32)
+        self.displacement = np.zeros((2, size, size), dtype=np.float32)
+        self.slopes = np.zeros((2, size, size), dtype=np.float32)
+        self._scratch = np.empty((size, size), dtype=np.float32)
+        self.time = None
+
+        self._state = None
+        self.set_sea_state(wind_speed, fetch, direction)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def sea_state(self):
+        return self._state
+
+    @property
+    def height_range(self):
+        # the surface hardly ever leaves +-range/2, 4.5 standard deviations of the heights
+        return 9.0 * self._deviation
+
+    @property
+    def displacement_range(self):
+        # how far the surface hardly ever moves sideways: the displacement along x and y together has
+        # the variance of the heights, scaled by the choppiness
+        return 4.5 * self.choppiness * self._deviation
+
+    def set_sea_state(self, wind_speed, fetch, direction):
+        # direction of the wind in degrees counterclockwise from +x; while a worker may be updating
+        # the sea, change it through OceanShaderHelper.set_sea_state
+        state = SeaState(float(wind_speed), float(fetch), float(direction))
+        key = (state, self.spectrum, self._size, self.span, self.seed, self.period)
+        cached = self._cache.pop(key, None)
+        if cached is None:
+            cached = self._make_amplitudes(state)
+        self._cache[key] = cached
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        self._h0, self._h0_negative, self._omega, self._deviation = cached
+        self._state = state
+        self.time = None
+
+    def _make_amplitudes(self, state):
+        angle = np.radians(state.direction)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cos_angle = np.where(
+                self._k > 0, (self._kx * np.cos(angle) + self._ky * np.sin(angle)) / self._k, 0.0)
+        dk = 2.0 * np.pi / self.span
+        variance = self.spectra[self.spectrum](self._k, cos_angle, state.wind_speed, state.fetch) * dk * dk
+        if self._size % 2 == 0:
+            # the Nyquist modes have no partner of opposite wavenumber
+            variance[self._size // 2] = 0.0
+            variance[:, self._size // 2] = 0.0
+
+        random = np.random.RandomState(self.seed)
+        noise = random.normal(size=(2, self._size, self._size))
+        h0 = ((noise[0] + 1j * noise[1]) * np.sqrt(variance / 2.0)).astype(np.complex64)
+        h0_negative = np.conj(h0[self._negative][:, self._negative])
+        omega = np.sqrt(gravity * self._k)
+        if self.period:
+            # whole multiples of the base frequency of the period
+            base = 2.0 * np.pi / self.period
+            omega = np.floor(omega / base) * base
+        # both modes of a pair add to the variance
+        deviation = np.sqrt(2.0 * variance.sum())
+        return h0, h0_negative, omega, max(deviation, 1e-3)
+
+    def update(self, time):
+        if time == self.time:
+            return
+        self.time = time
+        # the angles in double precision, they grow large
+        angles = np.mod(self._omega * time, 2.0 * np.pi).astype(np.float32)
+        phase = np.cos(angles) + 1j * np.sin(angles)
+        h = self._h0 * phase
+        h += self._h0_negative * np.conj(phase)
+
+        spectra = np.multiply(self._transfer, h, out=self._spectra)
+        fields = np.fft.ifft2(spectra)
+        fields *= self._size * self._size
+        self.heights[:] = fields[0].real
+        self.slopes[0] = fields[0].imag
+        np.multiply(fields[1].real, self.choppiness, out=self.displacement[0])
+        np.multiply(fields[1].imag, self.choppiness, out=self.displacement[1])
+        self.slopes[1] = fields[2].real
+
+    def encode(self, displacement_image, normal_image):
+        # Writes the last update into RAM images, rows along y like the fields: a float BGRA one of
+        # the displacement (x, y, height) and a byte BGRA one of the normals.
+        displacement_image[..., 2] = self.displacement[0]
+        displacement_image[..., 1] = self.displacement[1]
+        displacement_image[..., 0] = self.heights
+        displacement_image[..., 3] = 1.0
+
+        # the normal is (-slope x, -slope y, 1) over its length
+        sx, sy = self.slopes
+        scale = self._scratch
+        np.multiply(sx, sx, out=scale)
+        scale += sy * sy
+        scale += 1.0
+        np.sqrt(scale, out=scale)
+        np.divide(127.5, scale, out=scale)
+        normal_image[..., 0] = scale + 128.0  # plus 0.5 for rounding
+        normal_image[..., 1] = 128.0 - sy * scale
+        normal_image[..., 2] = 128.0 - sx * scale
+        normal_image[..., 3] = 255
+
+    def get_horizontal_displacement(self, xs, ys):
+        return (sample_tile(self.displacement[0], self.span, xs, ys),
+                sample_tile(self.displacement[1], self.span, xs, ys))
+
+    def get_heights(self, xs, ys, iterations=2):
+        # Heights of the tile over xs, ys as vertex_ocean.vs shows it. The surface moves sideways
+        # too, a few fixed-point iterations find the point that ends up above xs, ys; with none
+        # the undisplaced point is taken.
+        px, py = find_origins(self.get_horizontal_displacement, xs, ys, iterations)
+        return sample_tile(self.heights, self.span, px, py)
+
+
+def sample_tile(field, span, xs, ys):
+    # bilinear sample of a (size, size) field of a tile of span wrapping around, rows along y, the
+    # way the shader samples it: texel centres half a texel in
+    size = field.shape[0]
+    texel = span / float(size)
+    fx = np.asarray(xs, dtype=np.float64) / texel - 0.5
+    fy = np.asarray(ys, dtype=np.float64) / texel - 0.5
+    x0, y0 = np.floor(fx).astype(np.intp), np.floor(fy).astype(np.intp)
+    tx, ty = fx - x0, fy - y0
+    x0, y0 = x0 % size, y0 % size
+    x1, y1 = (x0 + 1) % size, (y0 + 1) % size
+    bottom = field[y0, x0] * (1 - tx) + field[y0, x1] * tx
+    top = field[y1, x0] * (1 - tx) + field[y1, x1] * tx
+    return bottom * (1 - ty) + top * ty
+
+
+def find_origins(get_displacement, xs, ys, iterations=2):
+    # the points a horizontal displacement takes to xs, ys, get_displacement gives (dx, dy) of points
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    px, py = xs, ys
+    for _ in range(iterations):
+        dx, dy = get_displacement(px, py)
+        px, py = xs - dx, ys - dy
+    return px, py
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+def get_hull_outline(x0, x1, beam, taper=0.2, y=0.0):
+    # waterline of a hull lying along x from x0 to x1, its ends pointed over taper of the length
+    taper = (x1 - x0) * taper
+    half = 0.5 * beam
+    return np.array((
+        (x0, y), (x0 + taper, y - half), (x1 - taper, y - half), (x1, y), (x1 - taper, y + half), (x0 + taper, y + half)))
+
+
+def get_bounds_outline(node, taper=0.2):
+    lower, upper = node.get_tight_bounds(node)
+    return get_hull_outline(lower.x, upper.x, upper.y - lower.y, taper, 0.5 * (lower.y + upper.y))
+
+
+def _inside(points, polygon):
+    # even-odd rule, vectorized over the points
+    x, y = points[:, 0], points[:, 1]
+    inside = np.zeros(len(points), dtype=bool)
+    for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            at = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (x < at)
+    return inside
+
+
+class WakeRasterizer(object):
+    # Pushes the water down under a hull's waterline polygon every frame. The polygon is swept
+    # from the last pose to the current one in sub-frame steps, so a fast hull leaves no gaps,
+    # each point pushing deeper the faster it moves. Everything goes in with one stamp_water.
+
+    def __init__(self, node, water, water_helper, outline=None, speed_scale=0.01, min_depth=0.0, max_depth=0.2,
+                 max_samples=8):
+        self.node = node
+        self.water = water
+        self.water_helper = water_helper
+        self.speed_scale = speed_scale
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.max_samples = max_samples
+
+        outline = get_bounds_outline(node) if outline is None else np.asarray(outline, dtype=np.float64)
+        # half a texel apart, so the rotated footprint has no holes; in the node's space
+        if water_helper.window is not None:
+            texel = water_helper.window.texel
+        else:
+            texel = float(water_helper._width) / water_helper._size
+        scale = node.get_transform(water).get_scale()
+        spacing = 0.5 * texel / max(abs(scale.x), abs(scale.y), 1e-6)
+        lower, upper = outline.min(axis=0), outline.max(axis=0)
+        xs, ys = np.meshgrid(
+            np.arange(lower[0] + 0.5 * spacing, upper[0], spacing), np.arange(lower[1] + 0.5 * spacing, upper[1], spacing))
+        points = np.stack((xs.ravel(), ys.ravel()), axis=-1)
+        self.points = points[_inside(points, outline)]
+        self._texel = texel
+
+        self._pose = None
+        self.samples = 0
+
+    def _get_pose(self):
+        # origin, x and y axis of the node in the plane of the water
+        mat = self.node.get_mat(self.water)
+        return np.array(((mat[3][0], mat[3][1]), (mat[0][0], mat[0][1]), (mat[1][0], mat[1][1])))
+
+    def _place(self, pose):
+        # points in the water's space for poses of shape (..., 3, 2)
+        return (pose[..., None, 0, :] + self.points[:, 0, None] * pose[..., None, 1, :] +
+                self.points[:, 1, None] * pose[..., None, 2, :])
+
+    def reset(self):
+        self._pose = None
+
+    def update(self, dt):
+        pose = self._get_pose()
+        last = self._pose if self._pose is not None else pose
+        self._pose = pose
+        if not len(self.points) or dt <= 0:
+            return 0
+
+        start, end = self._place(last), self._place(pose)
+        moved = np.sqrt(((end - start) ** 2).sum(axis=-1))
+        speed = moved / dt
+        depth = np.clip(self.min_depth + self.speed_scale * speed, 0.0, self.max_depth)
+
+        # enough samples for the fastest point to move a texel at most between two of them
+        samples = int(np.clip(np.ceil(moved.max() / self._texel), 1, self.max_samples))
+        t = (np.arange(samples) + 1.0) / samples
+        poses = last + (pose - last) * t[:, None, None]
+        positions = self._place(poses).reshape(-1, 2)
+
+        xs, ys = self.water_helper.get_texture_positions(positions[:, 0], positions[:, 1])
+        # the same values as push_water, 0.5 being the calm surface
+        values = np.tile(0.5 - depth, samples)
+        self.water_helper.stamp_water(xs, ys, 0, values)
+        self.samples = samples
+        return len(values)
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class GerstnerWaves(object):
+    # wave set of shaders/vertex_ocean.vs, the second wave is derived from the first one
+    freq_scales = (1.0, 1.33)
+    amp_scales = (1.0, 0.75)
+    phases = (0.5, 1.7)
+
+    def __init__(self, params):
+        # anything with the wave properties of OceanShaderHelper, read on every call
+        self.params = params
+
+    def get_waves(self):
+        params = self.params
+        waves = []
+        for freq_scale, amp_scale, phase, speed in zip(
+                self.freq_scales, self.amp_scales, self.phases, (params.speed0, params.speed1)):
+            speed = np.array((speed[0], speed[1]), dtype=np.float64)
+            length = np.hypot(speed[0], speed[1])
+            direction = speed / length if length > 0 else speed
+            waves.append((params.wave_freq * freq_scale, params.wave_amp * amp_scale, phase * length, direction))
+        return waves
+
+    def get_max_horizontal_displacement(self):
+        # how far the waves move a point sideways when all of them line up
+        waves = self.get_waves()
+        q = self.params.teeth / float(len(waves))
+        return sum(q / freq for freq, _, _, _ in waves if freq > 0)
+
+    def _angles(self, waves, xs, ys, t):
+        for freq, amp, omega, direction in waves:
+            angle = (direction[0] * xs + direction[1] * ys) * freq + t * omega
+            yield freq, amp, omega, direction, np.sin(angle), np.cos(angle)
+
+    def get_horizontal_displacement(self, xs, ys, t):
+        waves = self.get_waves()
+        q = self.params.teeth / float(len(waves))
+        dx = np.zeros(np.broadcast(xs, ys, t).shape)
+        dy = np.zeros_like(dx)
+        for freq, amp, omega, direction, sin_a, cos_a in self._angles(waves, xs, ys, t):
+            # qi * amp = q / freq
+            dx += q / freq * direction[0] * cos_a
+            dy += q / freq * direction[1] * cos_a
+        return dx, dy
+
+    def find_origins(self, xs, ys, t, iterations=2):
+        # the grid points the waves move to xs, ys at t
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        px, py = xs, ys
+        for _ in range(iterations):
+            dx, dy = self.get_horizontal_displacement(px, py, t)
+            px, py = xs - dx, ys - dy
+        return px, py
+
+    def evaluate(self, xs, ys, t, samples=None, iterations=2):
+        # Heights, normals and velocities of the surface at (xs, ys) in the water node's space.
+        # The shader moves vertices sideways too, so the point showing up above (xs, ys) started
+        # somewhere else, a few fixed-point iterations find it; with no iterations the undisplaced
+        # grid point is evaluated like in the vertex shader. Samples are normalized RGB values of
+        # the simulation texture (vtftex), without them a flat sea is assumed.
+        t = np.asarray(t, dtype=np.float64)
+        px, py = self.find_origins(xs, ys, t, iterations)
+
+        params = self.params
+        grid_ratio = params.grid_ratio
+        shape = np.broadcast(px, py, t).shape
+
+        # simulation sample scaled by gridRatio
+        if samples is None:
+            height = np.zeros(shape)
+            dd = np.zeros(shape + (3,))
+            dd[..., 2] = 1.0
+        else:
+            samples = np.asarray(samples, dtype=np.float64) - 0.5
+            height = samples[..., 0] * grid_ratio[3] + np.zeros(shape)
+            sx = samples[..., 1] * 4.0 * grid_ratio[2]
+            sy = samples[..., 2] * 4.0 * grid_ratio[2]
+            # cross((gx, 0, sx), (0, gy, sy))
+            dd = np.stack(np.broadcast_arrays(
+                -sx * grid_ratio[1], -sy * grid_ratio[0], np.full_like(sx, grid_ratio[0] * grid_ratio[1])), axis=-1)
+            dd /= np.linalg.norm(dd, axis=-1)[..., None]
+            dd = np.broadcast_to(dd, shape + (3,)).copy()
+
+        velocity = np.zeros(shape + (3,))
+        waves = self.get_waves()
+        q = params.teeth / float(len(waves))
+        for freq, amp, omega, direction, sin_a, cos_a in self._angles(waves, px, py, t):
+            wa = freq * amp
+            ci = q * sin_a
+            ki = wa * cos_a
+            dd[..., 0] -= ki * direction[0]
+            dd[..., 1] -= ki * direction[1]
+            dd[..., 2] -= ci
+
+            height += amp * sin_a
+            # time derivative of the displacement
+            velocity[..., 0] -= q / freq * direction[0] * sin_a * omega
+            velocity[..., 1] -= q / freq * direction[1] * sin_a * omega
+            velocity[..., 2] += amp * cos_a * omega
+
+        normals = dd / np.linalg.norm(dd, axis=-1)[..., None]
+        return height, normals, velocity
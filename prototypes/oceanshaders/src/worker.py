@@ -0,0 +1,92 @@
+import threading
+import timeit
+
+
+class Worker(object):
+    # Runs one job at a time on a daemon thread. Nothing here waits for the thread: submit refuses
+    # a job while the last one runs and poll tells once that a job has finished. A job submitted
+    # before the last one was polled replaces its results.
+
+    def __init__(self, name='worker'):
+        self._condition = threading.Condition()
+        self._job = None
+        self._is_busy = False
+        self._is_finished = False
+        self._error = None
+        # seconds the last job took
+        self.job_time = 0.0
+
+        thread = threading.Thread(target=self._run, name=name)
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def is_busy(self):
+        return self._is_busy
+
+    def submit(self, function, *args):
+        with self._condition:
+            if self._is_busy:
+                return False
+            self._job = function, args
+            self._is_busy = True
+            self._is_finished = False
+            self._condition.notify_all()
+        return True
+
+    def poll(self):
+        # True once for every finished job, which may be published now; errors of the job are raised here
+        with self._condition:
+            is_finished, self._is_finished = self._is_finished, False
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+        return is_finished
+
+    def wait(self):
+        # the one blocking call, for changes that cannot happen under a running job
+        with self._condition:
+            while self._is_busy:
+                self._condition.wait()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None:
+                    self._condition.wait()
+                function, args = self._job
+                self._job = None
+            start = timeit.default_timer()
+            error = None
+            try:
+                function(*args)
+            except Exception as e:
+                error = e
+            # nothing of the job is held on to while waiting for the next one
+            function = args = None
+            with self._condition:
+                self.job_time = timeit.default_timer() - start
+                self._error = error
+                self._is_finished = True
+                self._is_busy = False
+                self._condition.notify_all()
+
+
+class DoubleBuffer(object):
+    # Two of something: the render task reads the front while a worker fills the back, swap
+    # publishes the back once the worker is done with it.
+
+    def __init__(self, front, back):
+        self._buffers = [front, back]
+
+    @property
+    def front(self):
+        return self._buffers[0]
+
+    @property
+    def back(self):
+        return self._buffers[1]
+
+    def swap(self):
+        self._buffers.reverse()
+        return self._buffers[0]
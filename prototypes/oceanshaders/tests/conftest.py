@@ -0,0 +1,6 @@
+import os
+import sys
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, os.pardir, 'src'))
+sys.path.insert(0, os.path.join(_here, os.pardir, os.pardir, 'common'))
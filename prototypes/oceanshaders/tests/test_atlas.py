@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+import atlas
+import spectrum
+import waves
+
+
+class Params(dict):
+    # the parameters of an OceanShaderHelper the atlas sets, counting the updates
+    updates = 0
+
+    def update(self, values):
+        self.updates += 1
+        dict.update(self, values)
+
+
+class Ocean(object):
+    spectrum = None
+
+    def __init__(self):
+        self.params = Params(grid_ratio=None, geometric_waves=1.0, height_range=0.0)
+        self.inputs = {}
+
+    def set_shader_input(self, name, value):
+        self.inputs[name] = value
+
+
+@pytest.fixture
+def sea():
+    return spectrum.SpectralOcean(16, 32.0, wind_speed=4.0, fetch=5000.0, period=2.0)
+
+
+@pytest.fixture
+def baked(tmp_path, sea):
+    filename = str(tmp_path / 'sea.atlas')
+    atlas.bake(filename, sea, 8)
+    return filename
+
+
+def texel_centres(size, span):
+    # world positions of the texel centres, in the order of the rows and columns of the tile
+    return ((np.arange(size) + size // 2) % size - size // 2 + 0.5) * (span / size)
+
+
+def test_bake_and_map(baked, sea):
+    wave_atlas = atlas.WaveAtlas(baked)
+    assert (wave_atlas.frames, wave_atlas.size, wave_atlas.span, wave_atlas.period) == (8, 16, 32.0, 2.0)
+    assert wave_atlas.grid_ratio == (10.0, 10.0, 15.0, 5.0)
+    assert [wave_atlas.get_frame_index(t) for t in (0.0, 0.24, 0.25, 1.99, 2.0, 2.3)] == [0, 0, 1, 7, 0, 1]
+    assert wave_atlas.get_frame(3).shape == (16, 16, 4)
+    wave_atlas.close()
+
+
+def test_bake_needs_a_period(tmp_path):
+    with pytest.raises(RuntimeError):
+        atlas.bake(str(tmp_path / 'sea.atlas'), spectrum.SpectralOcean(16, 32.0), 8)
+
+
+def test_broken_files_raise(tmp_path, baked):
+    with open(baked, 'rb') as f:
+        data = f.read()
+    short = tmp_path / 'short.atlas'
+    short.write_bytes(data[:-100])
+    with pytest.raises(RuntimeError):
+        atlas.WaveAtlas(str(short))
+    other = tmp_path / 'other.atlas'
+    other.write_bytes(b'NOTATLAS' + data[8:])
+    with pytest.raises(RuntimeError):
+        atlas.WaveAtlas(str(other))
+
+
+def test_helper_plays_the_baked_heights(baked, sea):
+    helper = atlas.AtlasWaterHelper(None, 32.0, 32.0, baked, timestep=0.05)
+    assert helper.frame == 0
+    helper.update(6)
+    assert helper.frame == 1
+    sea.update(0.25)
+    coordinates = texel_centres(16, 32.0)
+    xs, ys = np.meshgrid(coordinates, coordinates)
+    # a byte per height over grid_ratio[3]
+    np.testing.assert_allclose(helper.get_heights(xs, ys), sea.heights, atol=5.0 / 255.0)
+    helper.close()
+
+
+def test_helper_has_no_simulation(baked):
+    helper = atlas.AtlasWaterHelper(None, 32.0, 32.0, baked)
+    with pytest.raises(RuntimeError):
+        helper.push_water(3, 3, 1, 0.4)
+    with pytest.raises(RuntimeError):
+        helper.stamp_water([3], [3], [1], [0.4])
+    helper.close()
+
+
+def test_bind_turns_the_geometric_waves_off(baked):
+    helper = atlas.AtlasWaterHelper(None, 32.0, 32.0, baked)
+    ocean = Ocean()
+    helper.bind(ocean)
+    assert ocean.inputs['vtftex'] is helper.vertex_tex
+    assert ocean.params['geometric_waves'] == 0.0
+    assert ocean.params['height_range'] == 5.0
+    assert tuple(ocean.params['grid_ratio']) == (10.0, 10.0, 15.0, 5.0)
+    helper.bind(ocean)
+    assert ocean.params.updates == 1
+    helper.close()
+
+
+def test_gerstner_waves_loop(tmp_path):
+    class WaveParams(object):
+        wave_freq, wave_amp, teeth = 0.2, 0.8, 0.3
+        speed0, speed1 = (1.0, 0.5), (-0.5, 1.0)
+        grid_ratio = (10.0, 10.0, 15.0, 5.0)
+
+    gerstner = waves.GerstnerWaves(WaveParams())
+    looping = atlas.LoopingWaves(gerstner, 4.0)
+    for (_, _, omega, _), (_, _, looped, _) in zip(gerstner.get_waves(), looping.get_waves()):
+        assert looped * 4.0 / (2.0 * np.pi) == pytest.approx(np.rint(omega * 4.0 / (2.0 * np.pi)))
+
+    filename = str(tmp_path / 'waves.atlas')
+    atlas.bake_waves(filename, gerstner, 8, 16, 32.0, 4.0)
+    helper = atlas.AtlasWaterHelper(None, 32.0, 32.0, filename, timestep=0.25)
+    helper.update(2)
+    coordinates = texel_centres(16, 32.0)
+    xs, ys = np.meshgrid(coordinates, coordinates)
+    heights, _, _ = looping.evaluate(xs, ys, 0.5)
+    np.testing.assert_allclose(helper.get_heights(xs, ys), heights, atol=5.0 / 255.0)
+    later, _, _ = looping.evaluate(xs, ys, 4.5)
+    np.testing.assert_allclose(later, heights, atol=1e-9)
+    helper.close()
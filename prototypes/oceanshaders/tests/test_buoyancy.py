@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from panda3d.core import CardMaker, NodePath
+
+import buoyancy
+
+
+def make_hull(parent, length=4.0, beam=2.0):
+    # a flat deck of length along x and beam along y
+    node = parent.attach_new_node('hull')
+    cards = CardMaker('deck')
+    cards.set_frame(-length / 2, length / 2, -beam / 2, beam / 2)
+    node.attach_new_node(cards.generate()).set_p(-90)
+    return node
+
+
+def settle(solver, seconds=10.0):
+    for _ in range(int(seconds * 60)):
+        solver.update(1.0 / 60.0)
+
+
+def test_floats_at_rest_on_calm_water():
+    water = NodePath('water')
+    hull = make_hull(water)
+    solver = buoyancy.BuoyancySolver(water, lambda xs, ys: np.full(np.shape(xs), 1.5))
+    solver.add(hull, draft=0.5)
+    settle(solver)
+    # the springs hold the weight with the points draft deep, the origin on the surface
+    assert hull.get_z(water) == pytest.approx(1.5, abs=1e-3)
+    assert hull.get_p(water) == pytest.approx(0.0, abs=1e-3)
+    assert hull.get_r(water) == pytest.approx(0.0, abs=1e-3)
+
+
+@pytest.mark.parametrize('heading', [0.0, 40.0, 135.0])
+def test_follows_a_slope_whatever_the_heading(heading):
+    water = NodePath('water')
+    # a parent turned against the water, the angles are taken in the water's frame all the same
+    parent = water.attach_new_node('parent')
+    parent.set_h(30)
+    hull = make_hull(parent)
+    hull.set_pos(5, 3, 0)
+    hull.set_h(heading - 30)
+    slope = 0.1
+    solver = buoyancy.BuoyancySolver(water, lambda xs, ys: slope * np.asarray(ys))
+    solver.add(hull)
+    start = hull.get_pos(water)
+    settle(solver)
+
+    h = np.radians(heading)
+    assert hull.get_h(water) == pytest.approx(heading, abs=1e-3)
+    assert hull.get_p(water) == pytest.approx(np.degrees(np.arctan(slope * np.cos(h))), abs=0.05)
+    assert hull.get_r(water) == pytest.approx(-np.degrees(np.arctan(slope * np.sin(h))), abs=0.05)
+    # x and y are left to whatever else moves the node
+    assert hull.get_x(water) == pytest.approx(start.x, abs=1e-4)
+    assert hull.get_y(water) == pytest.approx(start.y, abs=1e-4)
+
+
+def test_samples_stay_level_under_a_tilted_hull():
+    water = NodePath('water')
+    hull_node = make_hull(water)
+    hull = buoyancy.Hull(hull_node)
+    level = hull.get_sample_positions(water)
+    hull_node.set_hpr(0, 20, -15)
+    tilted = hull.get_sample_positions(water)
+    np.testing.assert_allclose(level, tilted, atol=1e-5)
+
+
+def test_heights_are_looked_up_once_per_update():
+    water = NodePath('water')
+    calls = []
+
+    def get_heights(xs, ys):
+        calls.append(len(xs))
+        return np.zeros(len(xs))
+
+    solver = buoyancy.BuoyancySolver(water, get_heights, max_steps=4)
+    first = solver.add(make_hull(water), samples=(4, 2))
+    second = solver.add(make_hull(water), samples=(3, 3))
+    assert solver.update(3.5 / 60.0) == 3
+    assert calls == [first.num_points + second.num_points]
+    assert solver.update(0.1 / 60.0) == 0
+    # at most max_steps per update, the rest is dropped
+    assert solver.update(1.0) == 4
+    solver.remove(second)
+    solver.remove(first)
+    assert solver.update(1.0) == 0
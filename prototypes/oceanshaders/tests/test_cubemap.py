@@ -0,0 +1,77 @@
+import os
+
+import pytest
+from panda3d.core import DirectionalLight, Filename, ModelRoot, NodePath, Texture
+
+import cubemap
+
+
+@pytest.fixture
+def scene(tmp_path):
+    model_file = tmp_path / 'box.egg'
+    model_file.write_text(u'<CoordinateSystem> { Z-up }\n')
+    root = NodePath('render')
+    model = ModelRoot('box')
+    model.set_fullpath(Filename.from_os_specific(str(model_file)))
+    root.attach_new_node(model).set_pos(1, 2, 3)
+    return root, model_file
+
+
+def make_cube_texture(size=4):
+    texture = Texture('baked')
+    texture.setup_cube_map(size, Texture.T_unsigned_byte, Texture.F_rgb)
+    texture.make_ram_image()
+    return texture
+
+
+def test_scene_key_is_stable(scene):
+    root, _ = scene
+    assert cubemap.get_scene_key(root, 64) == cubemap.get_scene_key(root, 64)
+
+
+def test_scene_key_follows_the_scene(scene):
+    root, model_file = scene
+    key = cubemap.get_scene_key(root, 64)
+    assert cubemap.get_scene_key(root, 128) != key
+    assert cubemap.get_scene_key(root, 64, 'camera moved') != key
+
+    root.find('**/+ModelRoot').set_x(5)
+    moved = cubemap.get_scene_key(root, 64)
+    assert moved != key
+
+    model_file.write_text(u'<CoordinateSystem> { Z-up }\n<Comment> { changed }\n')
+    changed = cubemap.get_scene_key(root, 64)
+    assert changed != moved
+
+    root.find('**/+ModelRoot').hide()
+    assert cubemap.get_scene_key(root, 64) != changed
+
+
+def test_scene_key_follows_the_lights(scene):
+    root, _ = scene
+    light = root.attach_new_node(DirectionalLight('sun'))
+    root.set_light(light)
+    key = cubemap.get_scene_key(root, 64)
+    light.node().set_color((1.0, 0.5, 0.5, 1.0))
+    assert cubemap.get_scene_key(root, 64) != key
+
+
+def test_cube_map_is_baked_once(tmp_path, monkeypatch):
+    bakes = []
+
+    def bake_cube_map(base, size, source=None):
+        bakes.append(size)
+        return make_cube_texture(size)
+
+    monkeypatch.setattr(cubemap, 'bake_cube_map', bake_cube_map)
+    cache_dir = str(tmp_path / 'cubemaps')
+    texture = cubemap.load_cube_map(None, 4, cache_dir, key='scene')
+    assert bakes == [4]
+    assert texture.get_name() == 'environment'
+    assert texture.get_minfilter() == Texture.FT_linear_mipmap_linear
+    assert os.path.exists(os.path.join(cache_dir, 'cube-scene.txo'))
+
+    cached = cubemap.load_cube_map(None, 4, cache_dir, key='scene')
+    assert bakes == [4]
+    assert cached.get_texture_type() == Texture.TT_cube_map
+    assert cached.get_num_ram_mipmap_images() == texture.get_num_ram_mipmap_images()
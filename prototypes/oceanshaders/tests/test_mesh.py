@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+from panda3d.core import GeomVertexReader
+
+import mesh
+
+
+def read_grid(node_path):
+    geom = node_path.node().get_geom(0)
+    reader = GeomVertexReader(geom.get_vertex_data(), 'vertex')
+    uv_reader = GeomVertexReader(geom.get_vertex_data(), 'texcoord')
+    positions, uvs = [], []
+    while not reader.is_at_end():
+        positions.append(tuple(reader.get_data3()))
+        uvs.append(tuple(uv_reader.get_data2()))
+    primitive = geom.get_primitive(0)
+    indices = [primitive.get_vertex(i) for i in range(primitive.get_num_vertices())]
+    return np.array(positions), np.array(uvs), np.array(indices)
+
+
+def test_grid_plane_is_centred_and_shared():
+    positions, uvs, indices = read_grid(mesh.create_grid_plane('grid', 8.0, 4.0, 4, 2))
+    assert len(positions) == 5 * 3
+    assert len(indices) == 4 * 2 * 6
+    np.testing.assert_allclose(positions.min(axis=0), (-4.0, -2.0, 0.0))
+    np.testing.assert_allclose(positions.max(axis=0), (4.0, 2.0, 0.0))
+    # counter-clockwise seen from above
+    a, b, c = positions[indices[:3]]
+    assert np.cross(b - a, c - a)[2] > 0
+
+
+@pytest.mark.parametrize('uv_layout, v_at_minus_y', [('v_up', 0.0), ('v_down', 1.0)])
+def test_uv_layouts(uv_layout, v_at_minus_y):
+    positions, uvs, _ = read_grid(mesh.create_grid_plane('grid', 8.0, 4.0, 4, 2, uv_layout))
+    np.testing.assert_allclose(uvs[:, 0], positions[:, 0] / 8.0 + 0.5)
+    np.testing.assert_allclose(uvs[positions[:, 1] == -2.0, 1], v_at_minus_y)
+
+
+def test_unknown_uv_layout_raises():
+    with pytest.raises(RuntimeError):
+        mesh.create_grid_plane('grid', 8.0, 4.0, 4, 2, 'v_sideways')
+
+
+def test_load_grid_plane_caches(tmp_path):
+    cache_dir = str(tmp_path / 'meshes')
+    built = mesh.load_grid_plane('built', 8.0, 4.0, 4, 2, 'v_down', cache_dir)
+    cache_file = mesh.get_grid_plane_cache_file(8.0, 4.0, 4, 2, 'v_down', cache_dir)
+    assert os.path.exists(cache_file)
+    loaded = mesh.load_grid_plane('loaded', 8.0, 4.0, 4, 2, 'v_down', cache_dir)
+    assert loaded.get_name() == 'loaded'
+    for built_array, loaded_array in zip(read_grid(built), read_grid(loaded)):
+        np.testing.assert_allclose(built_array, loaded_array)
@@ -0,0 +1,131 @@
+import pytest
+from panda3d.core import LVector4
+
+import parameters
+
+
+class Node(object):
+    # records the shader inputs set on it
+    def __init__(self):
+        self.inputs = []
+
+    def set_shader_input(self, name, value):
+        self.inputs.append((name, LVector4(value)))
+
+
+class Recorder(object):
+    def __init__(self):
+        self.values = []
+
+    def record_parameter(self, name, value):
+        self.values.append((name, value))
+
+
+layout = (('waveInfo', ('wave_freq', 'wave_amp', 'teeth', 1.0)), ('speed', ('speed0', 'speed1')))
+values = {'wave_freq': 0.1, 'wave_amp': 1.0, 'teeth': 0.5, 'speed0': (1.0, 0.0), 'speed1': (0.0, 2.0)}
+
+
+@pytest.fixture
+def node():
+    return Node()
+
+
+@pytest.fixture
+def block(node):
+    block = parameters.ParameterBlock(layout, values, [node])
+    block.flush()
+    del node.inputs[:]
+    return block
+
+
+def test_flush_packs_only_the_dirty_inputs(block, node):
+    block['teeth'] = 0.25
+    block['wave_amp'] = 2.0
+    assert block.is_dirty
+    assert block.flush() == 1
+    assert node.inputs == [('waveInfo', LVector4(0.1, 2.0, 0.25, 1.0))]
+    assert not block.is_dirty
+    assert block.flush() == 0
+
+
+def test_tuples_fill_several_components(block, node):
+    block['speed1'] = (3.0, 4.0)
+    block.flush()
+    assert node.inputs == [('speed', LVector4(1.0, 0.0, 3.0, 4.0))]
+
+
+def test_missing_and_unknown_parameters_raise(block):
+    with pytest.raises(RuntimeError):
+        parameters.ParameterBlock(layout, {'wave_freq': 0.1}, [])
+    with pytest.raises(RuntimeError):
+        block['depth'] = 1.0
+    with pytest.raises(RuntimeError):
+        block.add_preset('deep', {'depth': 1.0})
+    with pytest.raises(RuntimeError):
+        block.apply_preset('unknown')
+
+
+def test_transaction_flushes_once_at_the_end(block, node):
+    with block.transaction():
+        block['wave_amp'] = 3.0
+        assert block.flush() == 0
+    assert block.flush() == 1
+    assert node.inputs[-1] == ('waveInfo', LVector4(0.1, 3.0, 0.5, 1.0))
+
+
+def test_transaction_rolls_back_on_errors(block, node):
+    recorder = Recorder()
+    block.recorder = recorder
+    with pytest.raises(ValueError):
+        with block.transaction():
+            block['wave_amp'] = 3.0
+            block['speed0'] = (5.0, 5.0)
+            raise ValueError()
+    assert block['wave_amp'] == 1.0
+    assert block['speed0'] == (1.0, 0.0)
+    assert not block.is_dirty
+    assert block.flush() == 0
+    assert node.inputs == []
+    # the recording ends on the restored values
+    recorded = dict(recorder.values)
+    assert recorded['wave_amp'] == 1.0
+    assert recorded['speed0'] == (1.0, 0.0)
+
+
+def test_names_and_recorder(block):
+    assert block.names == ['speed0', 'speed1', 'teeth', 'wave_amp', 'wave_freq']
+    assert 'teeth' in block and 'depth' not in block
+    recorder = Recorder()
+    block.recorder = recorder
+    block.update({'teeth': 0.75})
+    assert recorder.values == [('teeth', 0.75)]
+
+
+def test_presets(block):
+    block.save_preset('start', ['wave_amp', 'speed0'])
+    block.update({'wave_amp': 4.0, 'speed0': (9.0, 9.0)})
+    block.apply_preset('start')
+    assert block['wave_amp'] == 1.0
+    assert block['speed0'] == (1.0, 0.0)
+
+
+def test_blend_to_keeps_the_types(block):
+    block.add_preset('storm', {'wave_amp': 3.0, 'speed0': (5.0, 4.0)})
+    block.blend_to('storm', 2.0, time=10.0)
+    assert block.in_transition
+    block.advance(11.0)
+    assert block['wave_amp'] == pytest.approx(2.0)
+    assert block['speed0'] == pytest.approx((3.0, 2.0))
+    assert isinstance(block['speed0'], tuple)
+    block.advance(12.5)
+    assert not block.in_transition
+    assert block['wave_amp'] == 3.0
+
+
+def test_blend_starts_with_the_next_advance(block):
+    block.add_preset('storm', {'wave_amp': 3.0})
+    block.blend_to('storm', 1.0)
+    block.advance(5.0)
+    assert block['wave_amp'] == 1.0
+    block.advance(5.5)
+    assert block['wave_amp'] == pytest.approx(2.0)
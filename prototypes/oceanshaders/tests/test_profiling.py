@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    recorder = profiling.FrameRecorder(str(tmp_path / 'frames.log'))
+    yield recorder
+    recorder.close()
+
+
+def read_records(path):
+    with open(str(path)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_frames_are_json_lines(tmp_path, recorder):
+    profiler = profiling.Profiler(recorder)
+    assert profiler.is_recording
+    for frame in range(3):
+        with profiler.scope('App:Water'):
+            with profiler.scope('App:Water:Rain'):
+                pass
+        with profiler.scope('App:Water'):
+            pass
+        profiler.set_level('App:Water:Substeps', frame)
+        profiler.end_frame(frame / 60.0)
+    recorder.close()
+
+    records = read_records(tmp_path / 'frames.log')
+    assert [record['frame'] for record in records] == [0, 1, 2]
+    assert records[2]['time'] == pytest.approx(2 / 60.0, abs=1e-4)
+    assert records[2]['levels'] == {'App:Water:Substeps': 2}
+    for record in records:
+        assert sorted(record['ms']) == ['App:Water', 'App:Water:Rain']
+        assert record['ms']['App:Water'] >= record['ms']['App:Water:Rain'] >= 0
+
+
+def test_empty_frames_are_skipped(tmp_path, recorder):
+    profiler = profiling.Profiler(recorder)
+    profiler.end_frame(0.0)
+    with profiler.scope('App:Camera'):
+        pass
+    profiler.end_frame(1.0)
+    recorder.close()
+    assert [record['frame'] for record in read_records(tmp_path / 'frames.log')] == [1]
+
+
+def test_scopes_without_a_recorder():
+    profiler = profiling.Profiler()
+    assert not profiler.is_recording
+    with profiler.scope('App:Water'):
+        pass
+    profiler.set_level('App:Water:Lag', 0.5)
+    profiler.end_frame(0.0)
+    assert profiler.scope('App:Water') is profiler.scope('App:Water')
+
+
+def test_errors_pass_through_scopes(recorder):
+    profiler = profiling.Profiler(recorder)
+    with pytest.raises(ValueError):
+        with profiler.scope('App:Buoyancy'):
+            raise ValueError()
+    assert 'App:Buoyancy' in recorder._timings
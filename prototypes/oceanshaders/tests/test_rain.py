@@ -0,0 +1,69 @@
+import numpy as np
+
+import rain
+
+
+class Water(object):
+    def __init__(self):
+        self.stamps = []
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        self.stamps.append((xs, ys, radii, values, kernels))
+
+
+def emit_all(emitter, steps, dt=1.0 / 60.0):
+    return [emitter.emit(dt) for _ in range(steps)]
+
+
+def test_same_seed_same_drops():
+    first = rain.RainEmitter(64, 600.0, wind=(3.0, -2.0), seed=7)
+    second = rain.RainEmitter(64, 600.0, wind=(3.0, -2.0), seed=7)
+    for a, b in zip(emit_all(first, 20), emit_all(second, 20)):
+        for array_a, array_b in zip(a, b):
+            np.testing.assert_array_equal(array_a, array_b)
+    first.reset(7)
+    second.reset(7)
+    np.testing.assert_array_equal(first.emit(0.5)[0], second.emit(0.5)[0])
+
+
+def test_drops_stay_in_range():
+    emitter = rain.RainEmitter(64, 6000.0, seed=1, border=0.25)
+    xs, ys, radii, values = [np.concatenate(arrays) for arrays in zip(*emit_all(emitter, 30))]
+    assert xs.size == emitter.emitted > 0
+    assert xs.min() >= 16 and xs.max() < 48
+    assert ys.min() >= 16 and ys.max() < 48
+    assert radii.min() >= 0 and radii.max() <= emitter.max_radius
+    assert values.min() >= emitter.min_value and values.max() <= emitter.max_value
+
+
+def test_intensity_sets_the_rate():
+    emitter = rain.RainEmitter(64, 1000.0, seed=3, gustiness=0.0)
+    emit_all(emitter, 600)
+    assert abs(emitter.emitted - 10000) < 400
+
+
+def test_gusts_thin_the_drops():
+    steady = rain.RainEmitter(64, 1000.0, seed=3, gustiness=0.0)
+    gusty = rain.RainEmitter(64, 1000.0, seed=3, gustiness=1.0)
+    emit_all(steady, 300)
+    emit_all(gusty, 300)
+    assert gusty.emitted < 0.8 * steady.emitted
+
+
+def test_no_rain_no_stamps():
+    water = Water()
+    emitter = rain.RainEmitter(64, 0.0, seed=1)
+    assert emitter.rain_on(water, 1.0) == 0
+    emitter.intensity = 100.0
+    assert emitter.rain_on(water, 0.0) == 0
+    assert water.stamps == []
+
+
+def test_rain_on_stamps_once_per_frame():
+    water = Water()
+    emitter = rain.RainEmitter(64, 3000.0, seed=5)
+    emitter.kernel = 'disc'
+    count = emitter.rain_on(water, 0.1)
+    assert len(water.stamps) == 1
+    assert water.stamps[0][0].size == count
+    assert water.stamps[0][4] == 'disc'
@@ -0,0 +1,232 @@
+import gzip
+
+import numpy as np
+import pytest
+from panda3d.core import LVector4, NodePath
+
+import parameters
+import replay
+import ripple
+import spectrum
+
+
+class Helper(object):
+    # a water helper that keeps what is stamped on it
+    def __init__(self, acceleration=30.0, dampening=0.99):
+        self.acceleration = acceleration
+        self.dampening = dampening
+        self.stamps = []
+        self.window = 'window'
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        arrays = np.broadcast_arrays(np.asarray(xs), np.asarray(ys), np.asarray(radii), np.asarray(values),
+                                     np.asarray(kernels))
+        self.stamps.append([array.ravel().tolist() for array in arrays])
+
+
+class Water(object):
+    # the parts of an ocean.WaterNodeHelper recorded with its simulation
+    def __init__(self, timestep=1.0 / 60.0):
+        self.water_shader_hlp = Helper()
+        self.simulation_clock = ripple.FixedTimestep(timestep, 4)
+        self.recorder = None
+
+
+class Ocean(object):
+    # the parts of an ocean.OceanShaderHelper recorded with its parameters
+    derived_parameters = ('height_range',)
+
+    def __init__(self):
+        layout = (('waveInfo', ('wave_freq', 'wave_amp', 'height_range', 0.0)), ('speed', ('speed0', 'speed1')))
+        self.params = parameters.ParameterBlock(layout, {
+            'wave_freq': 0.1, 'wave_amp': 1.0, 'height_range': 2.0, 'speed0': (1.0, 0.0),
+            'speed1': LVector4(0, 0, 0, 0)}, [])
+        self.spectrum = None
+        self.recorder = None
+        self.spectra = []
+
+    def set_spectrum(self, ocean):
+        self.spectrum = ocean
+        self.spectra.append(ocean)
+
+
+def record(filename, frames, info=None, before=None):
+    # frames of (time, dt, function of the recorded things)
+    ocean, water, helper, node = Ocean(), Water(), Helper(), NodePath('ship')
+    if before is not None:
+        before(ocean, water)
+    recorder = replay.Recorder(filename, info)
+    target = recorder.add_target('rain', helper)
+    recorder.add_ocean(ocean)
+    recorder.add_simulation(water)
+    recorder.add_node('ship', node)
+    for time, dt, step in frames:
+        recorder.begin_frame(time, dt)
+        step(target, ocean, water, node)
+        recorder.record_simulation(water)
+        recorder.record_poses()
+    recorder.close()
+    return recorder
+
+
+def play(filename):
+    ocean, water, helper, node = Ocean(), Water(), Helper(), NodePath('ship')
+    player = replay.Player(filename)
+    player.add_target('rain', helper)
+    player.add_ocean(ocean)
+    player.add_simulation(water)
+    player.add_node('ship', node)
+    return player, ocean, water, helper, node
+
+
+def nothing(target, ocean, water, node):
+    pass
+
+
+def test_impulses_and_poses_round_trip(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+
+    def rain(target, ocean, water, node):
+        target.stamp_water([1, 2], [3, 4], [0, 2], [0.25, 0.75], ['disc', 'gaussian'])
+        target.push_water(5, 6, 1, 0.5)
+        node.set_pos(1, 2, 3)
+
+    recorded = record(filename, [(0.0, 0.0, nothing), (0.5, 0.5, rain)], info={'world_size': 64})
+    assert recorded.frames == 2
+
+    player, _, _, helper, node = play(filename)
+    assert player.info == {'world_size': 64}
+    assert player.next_frame() == (0.0, 0.0)
+    assert helper.stamps == []
+    assert player.next_frame() == (0.5, 0.5)
+    assert helper.stamps == [[[1, 2], [3, 4], [0, 2], [0.25, 0.75], ['disc', 'gaussian']],
+                             [[5], [6], [1], [0.5], ['square']]]
+    assert node.get_pos() == (0, 0, 0)
+    player.apply_poses()
+    assert node.get_pos() == (1, 2, 3)
+    assert player.next_frame() is None
+    assert player.is_done and player.frames == 2
+    player.close()
+
+
+def test_settings_made_before_recording_are_replayed(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+
+    def set_up(ocean, water):
+        # like main.py's init_environment, before record_to
+        water.water_shader_hlp.acceleration = 10.0
+        water.water_shader_hlp.dampening = 0.96
+        water.simulation_clock.timestep = 1.0 / 30.0
+        with ocean.params.transaction():
+            ocean.params['wave_amp'] = 0.5
+            ocean.params['speed1'] = LVector4(1, 2, 3, 4)
+        ocean.params['height_range'] = 7.0
+
+    record(filename, [(0.0, 0.0, nothing)], before=set_up)
+    player, ocean, water, _, _ = play(filename)
+    player.next_frame()
+    assert water.water_shader_hlp.acceleration == 10.0
+    assert water.water_shader_hlp.dampening == 0.96
+    assert water.simulation_clock.timestep == 1.0 / 30.0
+    assert ocean.params['wave_amp'] == 0.5
+    assert ocean.params['speed1'] == LVector4(1, 2, 3, 4)
+    assert isinstance(ocean.params['speed0'], tuple)
+    # derived parameters follow from something else and are left alone
+    assert ocean.params['height_range'] == 2.0
+
+
+def test_changes_land_in_their_frame(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+
+    def calm(target, ocean, water, node):
+        ocean.params['wave_amp'] = 0.25
+        water.water_shader_hlp.dampening = 0.9
+
+    def rollback(target, ocean, water, node):
+        with pytest.raises(ValueError):
+            with ocean.params.transaction():
+                ocean.params['wave_amp'] = 3.0
+                raise ValueError()
+
+    record(filename, [(0.0, 0.0, nothing), (0.1, 0.1, calm), (0.2, 0.1, rollback), (0.3, 0.1, nothing)])
+    player, ocean, water, _, _ = play(filename)
+    player.next_frame()
+    assert (ocean.params['wave_amp'], water.water_shader_hlp.dampening) == (1.0, 0.99)
+    player.next_frame()
+    assert (ocean.params['wave_amp'], water.water_shader_hlp.dampening) == (0.25, 0.9)
+    player.next_frame()
+    assert ocean.params['wave_amp'] == 0.25
+
+
+def test_settings_are_only_written_when_they_change(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+    record(filename, [(i / 60.0, 1 / 60.0, nothing) for i in range(100)])
+    with gzip.open(filename, 'rb') as f:
+        data = f.read()
+    struct = replay._simulation_struct
+    settings = struct.pack(30.0, 0.99, 1.0 / 60.0, 4)
+    assert data.count(replay._simulation + settings) == 1
+
+
+def test_spectral_seas_round_trip(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+    sea = spectrum.SpectralOcean(16, 32.0, 8.0, 20000.0, 45.0, 'phillips', choppiness=0.5, seed=3, period=4.0)
+
+    def set_sea(target, ocean, water, node):
+        ocean.set_spectrum(sea)
+        ocean.recorder.record_spectrum(sea)
+
+    def remove_sea(target, ocean, water, node):
+        ocean.set_spectrum(None)
+        ocean.recorder.record_spectrum(None)
+
+    record(filename, [(0.0, 0.0, nothing), (0.1, 0.1, set_sea), (0.2, 0.1, remove_sea)])
+    player, ocean, _, _, _ = play(filename)
+    player.next_frame()
+    assert ocean.spectra == [None]
+    player.next_frame()
+    replayed = ocean.spectrum
+    assert (replayed.size, replayed.span, replayed.spectrum, replayed.choppiness, replayed.seed, replayed.period) == (
+        16, 32.0, 'phillips', 0.5, 3, 4.0)
+    assert replayed.sea_state == sea.sea_state
+    sea.update(1.0)
+    replayed.update(1.0)
+    np.testing.assert_array_equal(replayed.heights, sea.heights)
+    player.next_frame()
+    assert ocean.spectrum is None
+
+
+def test_what_is_not_given_is_skipped(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+
+    def rain(target, ocean, water, node):
+        target.push_water(5, 6, 1, 0.5)
+        ocean.params['wave_amp'] = 0.5
+        node.set_x(4)
+
+    record(filename, [(0.0, 0.0, rain)])
+    player = replay.Player(filename)
+    assert player.next_frame() == (0.0, 0.0)
+    player.apply_poses()
+    assert player.next_frame() is None
+
+
+def test_foreign_and_short_recordings_raise(tmp_path):
+    filename = str(tmp_path / 'water.rec')
+    record(filename, [(0.0, 0.0, nothing)])
+    with gzip.open(filename, 'rb') as f:
+        data = f.read()
+
+    other = str(tmp_path / 'other.rec')
+    with gzip.open(other, 'wb') as f:
+        f.write(data[:8] + b'\x63' + data[9:])
+    with pytest.raises(RuntimeError):
+        replay.Player(other)
+
+    short = str(tmp_path / 'short.rec')
+    with gzip.open(short, 'wb') as f:
+        f.write(data[:-10])
+    player = replay.Player(short)
+    with pytest.raises(RuntimeError):
+        while player.next_frame() is not None:
+            pass
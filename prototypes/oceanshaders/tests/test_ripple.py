@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+
+import ripple
+
+
+def water_fs_step(current, previous, damp, acceleration, dampening):
+    # shaders/water.fs texel by texel, neighbours outside of the texture are 0
+    size = current.shape[0]
+    w0, w1 = ripple.RippleSimulation.position_weighting
+    result = np.zeros_like(current)
+    for y in range(size):
+        for x in range(size):
+            def height(i, j):
+                return current[j, i] if 0 <= i < size and 0 <= j < size else 0.0
+            laplacian = height(x - 1, y) + height(x + 1, y) + height(x, y - 1) + height(x, y + 1) - 4.0 * current[y, x]
+            new_height = (w0 * current[y, x] - w1 * previous[y, x] +
+                          ripple.RippleSimulation.half_dt_squared * damp[y, x] * acceleration * laplacian)
+            new_height *= min(max(damp[y, x] + 0.5, 0.0), 1.0) * dampening
+            result[y, x] = min(max(new_height, -1.0), 1.0)
+    return result
+
+
+@pytest.mark.parametrize('mask', [False, True])
+def test_step_matches_water_fs(mask):
+    random = np.random.RandomState(3)
+    size = 12
+    damp = random.uniform(0.0, 1.0, (size, size)).astype(np.float32) if mask else np.ones((size, size), np.float32)
+    simulation = ripple.RippleSimulation(size, 30, 0.99, damp if mask else None)
+    current = random.uniform(-0.5, 0.5, (size, size)).astype(np.float32)
+    previous = random.uniform(-0.5, 0.5, (size, size)).astype(np.float32)
+    simulation.heights[...] = current
+    simulation._previous[1:-1, 1:-1] = previous
+
+    simulation.step()
+
+    expected = water_fs_step(current.astype(np.float64), previous.astype(np.float64), damp, 30, 0.99)
+    np.testing.assert_allclose(simulation.heights, expected, atol=1e-5)
+    np.testing.assert_allclose(simulation.gradients[0][:, :-1], np.diff(current, axis=1), atol=1e-6)
+    np.testing.assert_allclose(simulation.gradients[1][:-1], np.diff(current, axis=0), atol=1e-6)
+
+
+def test_impulse_lands_in_the_next_step_only():
+    simulation = ripple.RippleSimulation(16)
+    # 0.25 in texture units is a height of -0.5
+    simulation.stamp(8, 8, 1, 0.25)
+    simulation.step()
+    assert simulation.impulses.is_empty
+    assert simulation.heights[8, 8] < 0
+    assert simulation.heights[0, 0] == 0
+
+
+def test_stamp_averages_overlapping_values():
+    impulses = ripple.ImpulseBuffer(8)
+    impulses.stamp([3, 3], [4, 4], 0, [0.2, 0.6])
+    target = np.zeros((8, 8), dtype=np.float32)
+    impulses.apply(target)
+    assert target[4, 3] == pytest.approx(0.4)
+    assert np.count_nonzero(target) == 1
+    assert impulses.box is None
+
+
+@pytest.mark.parametrize('kernel, count', [('square', 25), ('disc', 21), ('gaussian', 25)])
+def test_kernels_cover_their_footprint(kernel, count):
+    impulses = ripple.ImpulseBuffer(8)
+    impulses.stamp(4, 4, 2, 0.5, kernel)
+    assert impulses.box == (2, 2, 7, 7)
+    target = np.zeros((8, 8), dtype=np.float32)
+    impulses.apply(target)
+    assert np.count_nonzero(target) == count
+    assert target[4, 4] == pytest.approx(0.5)
+
+
+def test_unknown_kernel_raises():
+    with pytest.raises(RuntimeError):
+        ripple.ImpulseBuffer(8).stamp(4, 4, 1, 0.5, 'star')
+
+
+def test_impulses_outside_are_dropped():
+    impulses = ripple.ImpulseBuffer(8)
+    impulses.stamp([-5, 20], [2, 2], 1, 0.5)
+    assert impulses.is_empty
+
+
+def test_encode_matches_the_texture_channels():
+    simulation = ripple.RippleSimulation(4)
+    simulation.heights[...] = [[-1.0, 0.0, 0.5, 1.0]] * 4
+    simulation.step()
+    image = np.zeros((4, 4, 4), dtype=np.uint8)
+    simulation.encode(image)
+    expected = np.minimum(simulation.heights * 127.5 + 128.0, 255).astype(np.uint8)
+    np.testing.assert_array_equal(image[..., 2], expected)
+    assert (image[..., 3] == 255).all()
+
+
+def test_fixed_timestep_carries_the_rest_over():
+    clock = ripple.FixedTimestep(1.0 / 60.0, max_steps=4)
+    assert [clock.advance(1.0 / 144.0) for _ in range(6)] == [0, 0, 1, 0, 1, 0]
+    assert clock.total_steps == 2
+    assert clock.alpha == pytest.approx(6.0 / 144.0 * 60.0 - 2.0)
+
+
+def test_fixed_timestep_is_exact_at_its_own_rate():
+    clock = ripple.FixedTimestep(1.0 / 60.0)
+    assert all(clock.advance(1.0 / 60.0) == 1 for _ in range(1000))
+    assert clock.total_steps == 1000
+
+
+def test_fixed_timestep_drops_what_it_cannot_catch_up_on():
+    clock = ripple.FixedTimestep(0.1, max_steps=4)
+    assert clock.advance(0.75) == 4
+    assert clock.dropped_time == pytest.approx(0.3)
+    assert clock.lag == pytest.approx(0.05)
+    assert clock.advance(-1.0) == 0
+    clock.reset()
+    assert clock.lag == 0.0 and clock.steps == 0
+
+
+def expand(ranges):
+    return sorted(i for start, stop in ranges for i in range(start, stop))
+
+
+@pytest.mark.parametrize('x, y', [(2.5, 0.0), (-3.0, 0.0), (0.0, 3.5), (0.0, -6.0), (5.0, -2.0), (30.0, 11.0),
+                                  (0.3, 0.7)])
+def test_window_clears_what_scrolls_in(x, y):
+    window = ripple.ScrollingWindow(8, 8.0)
+    x0, y0 = window.origin
+    columns, rows = window.move_to(x, y)
+    x1, y1 = window.origin
+    # the world texels of the window that were not in it before, where they live in the texture
+    new_columns = sorted(set(i % 8 for i in range(x1, x1 + 8) if not x0 <= i < x0 + 8))
+    new_rows = sorted(set(window.get_ram_indices(0, j)[0] for j in range(y1, y1 + 8) if not y0 <= j < y0 + 8))
+    assert expand(columns) == new_columns
+    assert expand(rows) == new_rows
+
+
+def test_window_addresses_texels_toroidally():
+    window = ripple.ScrollingWindow(8, 16.0)
+    window.move_to(9.0, -5.0)
+    # 2 units a texel, centred on texel (4, -3)
+    assert window.corner == (0.0, -14.0)
+    assert window.contains([0.0, 15.9, 16.0, -0.1], [-14.0, 1.9, 0.0, 0.0]).tolist() == [True, True, False, False]
+    xs, ys = window.get_texture_positions([0.0, 3.0, 100.0], [-14.0, -1.0, 0.0])
+    assert xs.tolist() == [0, 1, -32]
+    assert ys.tolist() == [1, 7, -32]
+
+
+def test_window_samples_the_ram_image():
+    window = ripple.ScrollingWindow(8, 8.0)
+    window.move_to(1.0, 2.0)
+    channel = np.zeros((8, 8))
+    rows, columns = window.get_ram_indices(np.array([1, 2]), np.array([3, 3]))
+    channel[rows, columns] = (1.0, 3.0)
+    assert window.sample(channel, 1.5, 3.5) == pytest.approx(1.0)
+    assert window.sample(channel, 2.0, 3.5) == pytest.approx(2.0)
+    i, j = window.get_ring()
+    assert len(i) == 4 * 7
+    assert len(set(zip(i.tolist(), j.tolist()))) == 4 * 7
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import shader_registry
+
+shaders = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src', 'shaders')
+
+
+@pytest.fixture
+def registry():
+    registry = shader_registry.ShaderRegistry()
+    registry.register('water', os.path.join(shaders, 'water.vs'), os.path.join(shaders, 'water.fs'))
+    registry.register('ocean', os.path.join(shaders, 'vertex_ocean.vs'), os.path.join(shaders, 'vertex_ocean.fs'))
+    return registry
+
+
+def test_loaded_on_first_use_only(registry):
+    assert registry.names == ['ocean', 'water']
+    assert not registry.is_loaded('water')
+    shader = registry.get('water')
+    assert registry.is_loaded('water')
+    assert not registry.is_loaded('ocean')
+    assert registry.get('water') is shader
+
+
+def test_unknown_and_missing_shaders_raise(registry):
+    with pytest.raises(RuntimeError):
+        registry.get('sky')
+    registry.register('sky', os.path.join(shaders, 'sky.vs'), os.path.join(shaders, 'sky.fs'))
+    with pytest.raises(RuntimeError):
+        registry.get('sky')
+
+
+def test_prewarm_loads_everything(registry):
+    registry.prewarm().join()
+    assert registry.is_loaded('water') and registry.is_loaded('ocean')
+    shader = registry.get('ocean')
+    registry.prewarm(['ocean']).join()
+    assert registry.get('ocean') is shader
+
+
+def test_importing_ocean_leaves_the_optional_modules_out():
+    # the import cost of ocean, see benchmark.py startup
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+    optional = ('atlas', 'cubemap', 'spectrum', 'worker', 'threading', 'logging', 'json')
+    output = subprocess.check_output([sys.executable, '-c', (
+        "import sys; sys.path.insert(0, '../../common'); import ocean; "
+        "print(' '.join(name for name in %r if name in sys.modules))" % (optional,))], cwd=src)
+    assert output.decode('utf-8').split() == []
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+import spectrum
+
+
+@pytest.fixture
+def sea():
+    ocean = spectrum.SpectralOcean(32, 64.0, wind_speed=8.0, fetch=20000.0, direction=30.0)
+    ocean.update(2.5)
+    return ocean
+
+
+def spectral_derivative(field, span, axis):
+    size = field.shape[0]
+    k = np.fft.fftfreq(size, 1.0 / size) * (2.0 * np.pi / span)
+    k = k[None, :] if axis == 1 else k[:, None]
+    return np.fft.ifft2(1j * k * np.fft.fft2(field)).real
+
+
+@pytest.mark.parametrize('name', sorted(spectrum.SpectralOcean.spectra))
+def test_fields_are_real_and_consistent(name):
+    sea = spectrum.SpectralOcean(32, 64.0, 8.0, 20000.0, 30.0, name)
+    sea.update(1.0)
+    assert abs(sea.heights.mean()) < 1e-4
+    assert 0.3 < sea.heights.std() / (sea.height_range / 9.0) < 1.5
+    # the slopes are the derivatives of the heights, rows along y
+    np.testing.assert_allclose(sea.slopes[0], spectral_derivative(sea.heights, 64.0, 1), atol=1e-4)
+    np.testing.assert_allclose(sea.slopes[1], spectral_derivative(sea.heights, 64.0, 0), atol=1e-4)
+
+
+def test_choppiness_scales_the_displacement():
+    smooth = spectrum.SpectralOcean(32, 64.0, 8.0, 20000.0, choppiness=1.0)
+    choppy = spectrum.SpectralOcean(32, 64.0, 8.0, 20000.0, choppiness=2.0)
+    smooth.update(1.0)
+    choppy.update(1.0)
+    np.testing.assert_allclose(choppy.displacement, 2.0 * smooth.displacement, atol=1e-5)
+    np.testing.assert_allclose(choppy.heights, smooth.heights)
+    assert choppy.displacement_range == pytest.approx(2.0 * smooth.displacement_range)
+
+
+def test_seed_and_period():
+    first = spectrum.SpectralOcean(16, 32.0, seed=4, period=5.0)
+    second = spectrum.SpectralOcean(16, 32.0, seed=4, period=5.0)
+    first.update(1.25)
+    second.update(6.25)
+    np.testing.assert_allclose(first.heights, second.heights, atol=1e-4)
+    other = spectrum.SpectralOcean(16, 32.0, seed=5, period=5.0)
+    other.update(1.25)
+    assert np.abs(other.heights - first.heights).max() > 1e-3
+
+
+def test_sea_state():
+    sea = spectrum.SpectralOcean(16, 32.0, wind_speed=5.0)
+    calm = sea.height_range
+    sea.set_sea_state(15.0, 100000.0, 90.0)
+    assert sea.sea_state == spectrum.SeaState(15.0, 100000.0, 90.0)
+    assert sea.height_range > calm
+    with pytest.raises(RuntimeError):
+        spectrum.SpectralOcean(16, 32.0, spectrum='pierson')
+
+
+def test_sample_tile_wraps_around():
+    field = np.arange(16.0).reshape(4, 4)
+    # texel centres half a texel in, a tile of 8 units
+    assert spectrum.sample_tile(field, 8.0, 1.0, 1.0) == pytest.approx(0.0)
+    assert spectrum.sample_tile(field, 8.0, 3.0, 5.0) == pytest.approx(field[2, 1])
+    assert spectrum.sample_tile(field, 8.0, 9.0 + 8.0, 1.0 - 16.0) == pytest.approx(0.0)
+    assert spectrum.sample_tile(field, 8.0, 2.0, 1.0) == pytest.approx(0.5)
+    assert spectrum.sample_tile(field, 8.0, 0.0, 1.0) == pytest.approx(1.5)
+
+
+def test_heights_follow_the_displaced_surface(sea):
+    xs, ys = np.meshgrid(np.linspace(-20, 20, 9), np.linspace(-20, 20, 9))
+    dx, dy = sea.get_horizontal_displacement(xs, ys)
+    # where the points of the grid end up, the surface shows their heights
+    heights = sea.get_heights(xs + dx, ys + dy, iterations=10)
+    np.testing.assert_allclose(heights, sea.get_heights(xs, ys, iterations=0), atol=0.05 * sea.height_range)
+
+
+def test_encode(sea):
+    displacement = np.zeros((32, 32, 4), dtype=np.float32)
+    normals = np.zeros((32, 32, 4), dtype=np.uint8)
+    sea.encode(displacement, normals)
+    np.testing.assert_array_equal(displacement[..., 0], sea.heights)
+    np.testing.assert_array_equal(displacement[..., 2], sea.displacement[0])
+    # BGRA bytes of (-slope x, -slope y, 1) normalized
+    sx, sy = sea.slopes
+    length = np.sqrt(1.0 + sx * sx + sy * sy)
+    decoded = (normals[..., 2::-1] - 127.5) / 127.5
+    np.testing.assert_allclose(decoded, np.stack((-sx, -sy, np.ones_like(sx)), axis=-1) / length[..., None],
+                               atol=1.0 / 127.5)
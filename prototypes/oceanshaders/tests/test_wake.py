@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from panda3d.core import NodePath
+
+import wake
+
+
+class Water(object):
+    # the parts of a water helper the wake uses, 64 texels over 64 units
+    window = None
+    _width = 64.0
+    _size = 64
+
+    def __init__(self):
+        self.stamps = []
+
+    def get_texture_positions(self, xs, ys):
+        xs = np.floor(np.asarray(xs) + self._width / 2.0).astype(np.intp)
+        ys = np.floor(np.asarray(ys) + self._width / 2.0).astype(np.intp)
+        return xs, ys
+
+    def stamp_water(self, xs, ys, radii, values, kernels='square'):
+        self.stamps.append((xs, ys, values))
+
+
+@pytest.fixture
+def scene():
+    water = NodePath('water')
+    node = water.attach_new_node('hull')
+    return water, node, Water()
+
+
+def test_hull_outline():
+    outline = wake.get_hull_outline(-5.0, 5.0, 2.0, taper=0.2)
+    assert outline.shape == (6, 2)
+    np.testing.assert_allclose(outline.min(axis=0), (-5.0, -1.0))
+    np.testing.assert_allclose(outline.max(axis=0), (5.0, 1.0))
+    inside = wake._inside(np.array([(0.0, 0.0), (4.9, 0.9), (-4.5, 0.0), (0.0, 1.5)]), outline)
+    assert inside.tolist() == [True, False, True, False]
+
+
+def test_standing_hull_stamps_its_footprint(scene):
+    water, node, helper = scene
+    rasterizer = wake.WakeRasterizer(node, water, helper, wake.get_hull_outline(-5.0, 5.0, 2.0), min_depth=0.05)
+    assert rasterizer.update(1.0 / 60.0) == len(rasterizer.points)
+    assert rasterizer.samples == 1
+    xs, ys, values = helper.stamps[0]
+    np.testing.assert_allclose(values, 0.45)
+    # the footprint of a 10 x 2 hull at the centre of the texture, with no holes
+    covered = set(zip(xs.tolist(), ys.tolist()))
+    assert {(x, 32) for x in range(28, 36)} <= covered
+    assert min(xs) >= 27 and max(xs) <= 37 and min(ys) >= 31 and max(ys) <= 33
+
+
+def test_moving_hull_is_swept(scene):
+    water, node, helper = scene
+    rasterizer = wake.WakeRasterizer(node, water, helper, wake.get_hull_outline(-2.0, 2.0, 1.0),
+                                     speed_scale=0.01, max_depth=0.2, max_samples=8)
+    rasterizer.update(1.0 / 60.0)
+    node.set_x(3.0)
+    count = rasterizer.update(1.0 / 60.0)
+    assert rasterizer.samples == 3
+    assert count == 3 * len(rasterizer.points)
+    xs, _, values = helper.stamps[1]
+    # 180 units a second pushes as deep as it goes
+    np.testing.assert_allclose(values, 0.5 - 0.2)
+    # from behind the start pose to the bow of the end pose
+    assert min(xs) <= 31 and max(xs) >= 36
+
+
+def test_sweep_is_capped(scene):
+    water, node, helper = scene
+    rasterizer = wake.WakeRasterizer(node, water, helper, wake.get_hull_outline(-2.0, 2.0, 1.0), max_samples=4)
+    rasterizer.update(1.0 / 60.0)
+    node.set_x(20.0)
+    rasterizer.update(1.0 / 60.0)
+    assert rasterizer.samples == 4
+
+
+def test_no_time_no_stamps(scene):
+    water, node, helper = scene
+    rasterizer = wake.WakeRasterizer(node, water, helper, wake.get_hull_outline(-2.0, 2.0, 1.0))
+    assert rasterizer.update(0.0) == 0
+    rasterizer.reset()
+    node.set_x(10.0)
+    # after a reset the hull starts where it is, without sweeping from the last pose
+    rasterizer.update(1.0 / 60.0)
+    assert rasterizer.samples == 1
+    assert helper.stamps
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import waves
+
+
+class Params(object):
+    wave_freq = 0.08
+    wave_amp = 1.2
+    teeth = 0.4
+    speed0 = (2.0, 0.5)
+    speed1 = (-1.0, 1.5)
+    grid_ratio = (10.0, 10.0, 15.0, 5.0)
+
+
+@pytest.fixture
+def sea():
+    return waves.GerstnerWaves(Params())
+
+
+def test_heights_at_the_grid_points(sea):
+    xs, ys = np.meshgrid(np.linspace(-40, 40, 7), np.linspace(-40, 40, 5))
+    heights, _, _ = sea.evaluate(xs, ys, 1.5, iterations=0)
+    expected = np.zeros_like(xs)
+    for freq, amp, omega, direction in sea.get_waves():
+        expected += amp * np.sin((direction[0] * xs + direction[1] * ys) * freq + 1.5 * omega)
+    np.testing.assert_allclose(heights, expected)
+
+
+def test_origins_are_displaced_onto_the_points(sea):
+    xs, ys = np.linspace(-30, 30, 11), np.linspace(20, -20, 11)
+    px, py = sea.find_origins(xs, ys, 0.7, iterations=20)
+    dx, dy = sea.get_horizontal_displacement(px, py, 0.7)
+    np.testing.assert_allclose(px + dx, xs, atol=1e-6)
+    np.testing.assert_allclose(py + dy, ys, atol=1e-6)
+
+
+def test_displacement_stays_within_its_bound(sea):
+    xs, ys = np.meshgrid(np.linspace(-60, 60, 41), np.linspace(-60, 60, 41))
+    dx, dy = sea.get_horizontal_displacement(xs, ys, 2.0)
+    assert np.hypot(dx, dy).max() <= sea.get_max_horizontal_displacement() + 1e-9
+
+
+def test_velocity_is_the_time_derivative(sea):
+    xs, ys = np.linspace(-30, 30, 9), np.linspace(-10, 25, 9)
+    t, h = 3.0, 1e-5
+    heights, _, velocity = sea.evaluate(xs, ys, t, iterations=0)
+    later, _, _ = sea.evaluate(xs, ys, t + h, iterations=0)
+    dx0, dy0 = sea.get_horizontal_displacement(xs, ys, t)
+    dx1, dy1 = sea.get_horizontal_displacement(xs, ys, t + h)
+    np.testing.assert_allclose(velocity[..., 2], (later - heights) / h, atol=1e-3)
+    np.testing.assert_allclose(velocity[..., 0], (dx1 - dx0) / h, atol=1e-3)
+    np.testing.assert_allclose(velocity[..., 1], (dy1 - dy0) / h, atol=1e-3)
+
+
+def test_flat_sea_points_up():
+    params = Params()
+    params.wave_amp = 0.0
+    params.teeth = 0.0
+    heights, normals, _ = waves.GerstnerWaves(params).evaluate([0.0, 5.0], [1.0, -3.0], 0.0)
+    np.testing.assert_allclose(heights, 0.0)
+    np.testing.assert_allclose(normals, [[0.0, 0.0, 1.0]] * 2)
+
+
+def test_samples_add_the_simulation(sea):
+    xs, ys = np.array([3.0, -7.0]), np.array([1.0, 4.0])
+    plain, _, _ = sea.evaluate(xs, ys, 0.5)
+    samples = np.array([[0.6, 0.5, 0.5], [0.3, 0.5, 0.5]])
+    heights, normals, _ = sea.evaluate(xs, ys, 0.5, samples)
+    np.testing.assert_allclose(heights - plain, (samples[:, 0] - 0.5) * Params.grid_ratio[3])
+    np.testing.assert_allclose(np.linalg.norm(normals, axis=-1), 1.0)
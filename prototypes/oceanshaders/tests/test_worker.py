@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+import worker
+
+
+def test_job_runs_on_the_worker():
+    job_worker = worker.Worker('test-worker')
+    threads = []
+    assert job_worker.submit(lambda: threads.append(threading.current_thread().name))
+    job_worker.wait()
+    assert threads == ['test-worker']
+    assert not job_worker.is_busy
+    assert job_worker.poll()
+    # once for every job
+    assert not job_worker.poll()
+
+
+def test_busy_worker_refuses_jobs():
+    job_worker = worker.Worker()
+    release = threading.Event()
+    assert job_worker.submit(release.wait)
+    assert job_worker.is_busy
+    assert not job_worker.submit(lambda: None)
+    assert not job_worker.poll()
+    release.set()
+    job_worker.wait()
+    assert job_worker.poll()
+    assert job_worker.job_time >= 0.0
+
+
+def test_errors_are_raised_by_poll():
+    job_worker = worker.Worker()
+
+    def fail():
+        raise ValueError("from the job")
+
+    job_worker.submit(fail)
+    job_worker.wait()
+    with pytest.raises(ValueError):
+        job_worker.poll()
+    assert job_worker.submit(lambda: None)
+    job_worker.wait()
+    assert job_worker.poll()
+
+
+def test_arguments_are_passed_on():
+    job_worker = worker.Worker()
+    results = {}
+    job_worker.submit(results.__setitem__, 'answer', 42)
+    job_worker.wait()
+    assert results == {'answer': 42}
+
+
+def test_double_buffer_swaps():
+    buffers = worker.DoubleBuffer('a', 'b')
+    assert (buffers.front, buffers.back) == ('a', 'b')
+    assert buffers.swap() == 'b'
+    assert (buffers.front, buffers.back) == ('b', 'a')